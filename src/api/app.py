@@ -1,45 +1,249 @@
-from flask import Flask, request, jsonify
-from flask_caching import Cache
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
-import torch
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 import logging
+import os
+import json
+import hmac
+import threading
+import time
+import msgpack
+from scheduler import MicroBatchScheduler
+from prediction_cache import PredictionCache
+from flow_records import LABELS, flow_text
+from startup import StartupState, LOADING, WARMING_UP
+from models import ModelManager
+from metrics import MetricsRegistry, CONTENT_TYPE, BATCH_SIZE_BUCKETS
+from tokenization import SAMPLE_FLOWS
 
 # Configuration du logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
 
-# Charger le modèle fine-tuné et le tokenizer
-model_name = "./maudhuyAI/v2_2"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSequenceClassification.from_pretrained(model_name)
+# Moteur d'inférence CPU (pytorch, int8, torchscript ou onnx) et threads intra-opération (0: défaut)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'pytorch')
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0))
+
+# Longueur maximale d'un texte en jetons (voir compare_backends.py --token-lengths) et
+# volume maximal (textes x longueur complétée) d'un sous-lot trié par longueur
+INFERENCE_MAX_LENGTH = int(os.environ.get('INFERENCE_MAX_LENGTH', 512))
+INFERENCE_MAX_BATCH_TOKENS = int(os.environ.get('INFERENCE_MAX_BATCH_TOKENS', 8192))
+
+# Projection en mémoire des poids safetensors au lieu de leur lecture (moteur pytorch)
+INFERENCE_MMAP_WEIGHTS = os.environ.get('INFERENCE_MMAP_WEIGHTS', '0') == '1'
+
+# Regroupement des requêtes concurrentes: taille maximale d'une passe et attente maximale
+MAX_BATCH_SIZE = int(os.environ.get('PREDICT_MAX_BATCH_SIZE', 64))
+MAX_WAIT_MS = float(os.environ.get('PREDICT_MAX_WAIT_MS', 5))
+
+# Tailles des passes de préchauffage (par défaut puissances de 2 jusqu'à MAX_BATCH_SIZE)
+WARMUP_BATCH_SIZES = [int(size) for size in os.environ.get('WARMUP_BATCH_SIZES', '').split(',') if size.strip()] \
+    or sorted({min(2 ** power, MAX_BATCH_SIZE) for power in range(MAX_BATCH_SIZE.bit_length() + 1)})
+
+# Attente maximale (s) d'une requête /predict arrivée avant la fin du préchauffage
+READY_TIMEOUT = float(os.environ.get('PREDICT_READY_TIMEOUT', 120))
+
+# Chargement du modèle dans un thread, le serveur répondant pendant ce temps;
+# serve.py le désactive pour charger le modèle avant de créer ses processus
+LOAD_IN_BACKGROUND = os.environ.get('API_LOAD_IN_BACKGROUND', '1') == '1'
+
+# Répertoire des versions du modèle (sous-répertoires écrits par fineTune.py), version
+# imposée (vide: la plus récente), intervalle de surveillance des nouvelles versions
+# (s, 0: désactivée) et ancienneté minimale des fichiers d'une version avant son chargement
+MODEL_DIRECTORY = os.environ.get('MODEL_DIRECTORY', './maudhuyAI')
+MODEL_VERSION = os.environ.get('MODEL_VERSION', '')
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 30))
+MODEL_SETTLE_SECONDS = float(os.environ.get('MODEL_SETTLE_SECONDS', 10))
+
+# Jeton exigé par POST /model/reload dans l'en-tête X-Reload-Token; sans jeton, la route
+# n'accepte que les requêtes locales (boucle locale)
+MODEL_RELOAD_TOKEN = os.environ.get('MODEL_RELOAD_TOKEN', '')
+RELOAD_TOKEN_HEADER = 'X-Reload-Token'
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+# Cache des prédictions par texte: budget mémoire (Mo) et durée de vie (s)
+PREDICTION_CACHE_MB = float(os.environ.get('PREDICTION_CACHE_MB', 64))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 86400))
+
+startup = StartupState()
+prediction_cache = PredictionCache(PREDICTION_CACHE_MB, PREDICTION_CACHE_TTL)
+
+metrics = MetricsRegistry()
+request_seconds = metrics.histogram('api_request_duration_seconds', "Durée des requêtes HTTP, corps de réponse diffusé compris",
+                                    labels=('route', 'status'))
+decode_seconds = metrics.histogram('api_request_decode_seconds', "Durée du décodage du corps des requêtes de prédiction",
+                                   labels=('format',))
+queue_wait_seconds = metrics.histogram('api_queue_wait_seconds', "Attente des requêtes avant le départ de leur passe du modèle")
+tokenization_seconds = metrics.histogram('api_tokenization_seconds', "Durée de la tokenisation d'une passe du modèle")
+model_seconds = metrics.histogram('api_model_seconds', "Durée des sous-lots d'une passe du modèle, hors tokenisation")
+batch_size_texts = metrics.histogram('api_batch_size_texts', "Nombre de textes distincts par passe du modèle",
+                                     buckets=BATCH_SIZE_BUCKETS)
+in_flight_requests = metrics.gauge('api_in_flight_requests', "Requêtes HTTP en cours de traitement")
+metrics.gauge('api_queue_depth', "Requêtes en attente d'une passe du modèle", lambda: scheduler.pending())
+metrics.counter('api_prediction_cache_hits_total', "Textes trouvés dans le cache des prédictions",
+                lambda: prediction_cache.hits)
+metrics.counter('api_prediction_cache_misses_total', "Textes absents du cache des prédictions",
+                lambda: prediction_cache.misses)
+metrics.gauge('api_prediction_cache_hit_ratio', "Part des textes trouvés dans le cache des prédictions",
+              lambda: prediction_cache.stats()['hit_ratio'])
+metrics.gauge('api_prediction_cache_entries', "Entrées du cache des prédictions", lambda: len(prediction_cache.entries))
+metrics.gauge('api_ready', "1 si le modèle est chargé et préchauffé", lambda: int(startup.ready.is_set()))
 
 def clear_cache():
     """
     Effacer le cache au démarrage de l'application.
     """
-    with app.app_context():
-        cache.clear()
-        logger.info("Cache cleared at startup.")
+    prediction_cache.clear()
+    logger.info("Cache cleared at startup.")
+
+def warm_backend(backend):
+    """
+    Exécuter des passes de préchauffage aux tailles de lot représentatives, hors cache.
+    """
+    for size in WARMUP_BATCH_SIZES:
+        backend.classify([SAMPLE_FLOWS[index % len(SAMPLE_FLOWS)] for index in range(size)])
+
+def load_backend_version(path, warm=True):
+    """
+    Charger le moteur d'inférence d'une version du modèle.
+
+    Args:
+    path (str): Répertoire de la version.
+    warm (bool): Préchauffer le moteur avant de le rendre.
+    """
+    from backends import load_backend
+    loaded = load_backend(INFERENCE_BACKEND, path, INFERENCE_THREADS, INFERENCE_MAX_LENGTH,
+                          INFERENCE_MAX_BATCH_TOKENS, INFERENCE_MMAP_WEIGHTS)
+    if warm:
+        warm_backend(loaded)
+    return loaded
+
+manager = ModelManager(MODEL_DIRECTORY, load_backend_version, MODEL_VERSION, MODEL_SETTLE_SECONDS)
+# Service multi-processus (serve.py): le rechargement est confié au maître, qui
+# remplace les processus, plutôt que fait dans le seul processus ayant reçu la requête
+reload_handler = None
+
+def run_model(texts):
+    """
+    Exécuter une passe du modèle fine-tuné sur un lot de textes. La version courante
+    est lue une seule fois: un remplacement du modèle prend effet à la passe suivante.
+
+    Args:
+    texts (list): Liste des textes à prédire.
+
+    Returns:
+    list: Triplets (identifiant de l'étiquette, confiance, version du modèle), voir flow_records.LABELS.
+    """
+    model = manager.current
+    results = [(label, confidence, model) for label, confidence in model.backend.classify(texts)]
+    tokenization_time, model_time = model.backend.pass_timings
+    tokenization_seconds.observe(tokenization_time)
+    model_seconds.observe(model_time)
+    return results
+
+def observe_batch(size, queue_waits):
+    batch_size_texts.observe(size)
+    for queue_wait in queue_waits:
+        queue_wait_seconds.observe(queue_wait)
+
+scheduler = MicroBatchScheduler(run_model, MAX_BATCH_SIZE, MAX_WAIT_MS / 1000, on_batch=observe_batch)
+
+@app.before_request
+def start_request_timer():
+    g.started_at = time.perf_counter()
+    in_flight_requests.inc()
+
+@app.after_request
+def record_status(response):
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request(exception=None):
+    # Appelée après la diffusion complète du corps (réponses NDJSON) ou une exception
+    started_at = g.pop('started_at', None)
+    if started_at is None:
+        return
+    in_flight_requests.dec()
+    # Les chemins inconnus sont regroupés pour borner le nombre de séries
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_seconds.observe(time.perf_counter() - started_at, route, g.pop('status', 500))
+
+def load_model():
+    """
+    Charger la version du modèle à servir, en chronométrant chaque étape.
+    """
+    startup.set_status(LOADING)
+    with startup.phase('imports'):
+        # torch et transformers ne sont importés qu'ici, le serveur répondant déjà
+        import backends
+    model = manager.load(warm=False)
+    for name, duration in model.backend.timings.items():
+        startup.record(name, duration)
+    startup.set_status(WARMING_UP)
+    logger.info(f"Inference backend: {model.backend.name} ({INFERENCE_THREADS or 'default'} intra-op threads, "
+                f"max {INFERENCE_MAX_LENGTH} tokens per text{', mmap weights' if INFERENCE_MMAP_WEIGHTS else ''})")
+
+def warm_up():
+    """
+    Préchauffer la version en service puis déclarer l'API prête et journaliser le bilan du démarrage.
+    """
+    with startup.phase('warmup'):
+        warm_backend(manager.current.backend)
+    startup.mark_ready()
+    logger.info(f"Startup: {startup.summary()}")
+
+def start_model():
+    try:
+        load_model()
+        warm_up()
+    except Exception as e:
+        startup.fail(e)
+        logger.error(f"Model loading failed: {e}")
+        return
+    if MODEL_WATCH_INTERVAL > 0:
+        threading.Thread(target=manager.watch, args=(MODEL_WATCH_INTERVAL,), name='model-watch', daemon=True).start()
+
+def not_ready_response():
+    """
+    Attendre la fin du préchauffage au plus READY_TIMEOUT secondes.
+
+    Returns:
+    Response: Réponse 503 si le modèle n'est pas prêt, None sinon.
+    """
+    if startup.wait_ready(READY_TIMEOUT):
+        return None
+    logger.error(f"Model not ready ({startup.status})")
+    return jsonify({"error": "Model not ready", "status": startup.status}), 503
 
-@cache.memoize()
 def predict(texts):
     """
-    Prédire les étiquettes pour les textes donnés en utilisant le modèle fine-tuné.
+    Prédire les étiquettes pour les textes donnés. Seuls les textes absents du cache de
+    la version en service, chacun une seule fois, sont envoyés au modèle, regroupés avec
+    ceux des requêtes concurrentes dans une même passe. Si la version change pendant la
+    requête, celle-ci est reprise afin que toutes ses prédictions viennent de la même version.
 
     Args:
     texts (list): Liste des textes à prédire.
 
     Returns:
-    list: Liste des prédictions sous forme de chaînes 'allow' ou 'deny'.
+    tuple: (couples (identifiant de l'étiquette, confiance) dans l'ordre des textes, version du modèle).
     """
-    inputs = tokenizer(texts, return_tensors="pt", truncation=True, padding=True, max_length=512)
-    with torch.no_grad():
-        logits = model(**inputs).logits
-    predictions = torch.argmax(logits, dim=-1).tolist()
-    return ['allow' if pred == 1 else 'deny' for pred in predictions]
+    while True:
+        model = manager.current
+        predictions, missing = prediction_cache.lookup(texts, model.cache_scope)
+        if not missing:
+            return predictions, model.name
+        missing_texts = list(missing)
+        results = scheduler.submit(missing_texts)
+        if any(result_model is not model for _, _, result_model in results):
+            continue
+        results = [(label, confidence) for label, confidence, _ in results]
+        prediction_cache.store(missing_texts, results, model.cache_scope)
+        for text, result in zip(missing_texts, results):
+            for index in missing[text]:
+                predictions[index] = result
+        return predictions, model.name
 
 @app.route('/predict', methods=['POST'])
 def predict_route():
@@ -49,15 +253,107 @@ def predict_route():
     Returns:
     json: JSON contenant les prédictions.
     """
+    not_ready = not_ready_response()
+    if not_ready:
+        return not_ready
+
+    started_at = time.perf_counter()
     data = request.json
+    decode_seconds.observe(time.perf_counter() - started_at, 'json')
     input_texts = data.get('input_text', [])
     if not input_texts:
         logger.error("No input_text provided")
         return jsonify({"error": "No input_text provided"}), 400
 
-    predictions = predict(input_texts)
-    logger.info(f"Predictions made: {predictions}")
-    return jsonify({"predictions": predictions})
+    predictions, model_version = predict(input_texts)
+    predictions = [LABELS[label] for label, _ in predictions]
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Predictions made: {predictions}")
+    return jsonify({"predictions": predictions, "model_version": model_version})
+
+def compact_predictions(predictions, model_version):
+    return {"labels": [label for label, _ in predictions], "confidences": [confidence for _, confidence in predictions],
+            "model_version": model_version}
+
+@app.route('/predict/flows', methods=['POST'])
+def predict_flows_route():
+    """
+    Route de prédiction pour des flux structurés (voir flow_records.py), en encodage compact.
+
+    - application/msgpack: le corps est un tableau de flux; la réponse msgpack contient
+      les identifiants des étiquettes (labels), leurs confiances (confidences) et la
+      version du modèle (model_version).
+    - application/x-ndjson: un flux JSON par ligne, pour les connexions persistantes qui
+      envoient de longues suites de flux; la réponse est diffusée au fil des passes du
+      modèle, une ligne {"label", "confidence", "model_version"} par flux. waitress lit le corps entier
+      avant de le transmettre: c'est la réponse, pas la requête, qui est diffusée.
+
+    Returns:
+    Response: Prédictions dans l'encodage de la requête.
+    """
+    not_ready = not_ready_response()
+    if not_ready:
+        return not_ready
+
+    content_type = request.mimetype
+    started_at = time.perf_counter()
+    try:
+        if content_type == 'application/x-ndjson':
+            texts = [flow_text(json.loads(line)) for line in request.get_data().splitlines() if line.strip()]
+        elif content_type in ('application/msgpack', 'application/x-msgpack'):
+            records = msgpack.unpackb(request.get_data(), raw=False)
+            if not isinstance(records, list):
+                raise ValueError("The msgpack body must be an array of flow records")
+            texts = [flow_text(record) for record in records]
+        else:
+            return jsonify({"error": f"Unsupported content type '{content_type}'"}), 415
+    except (ValueError, msgpack.UnpackException) as e:
+        message = str(e) or type(e).__name__
+        logger.error(f"Invalid flow records: {message}")
+        return jsonify({"error": message}), 400
+    decode_seconds.observe(time.perf_counter() - started_at, 'ndjson' if content_type == 'application/x-ndjson' else 'msgpack')
+    if not texts:
+        logger.error("No flow records provided")
+        return jsonify({"error": "No flow records provided"}), 400
+
+    if content_type == 'application/x-ndjson':
+        def stream():
+            for start in range(0, len(texts), MAX_BATCH_SIZE):
+                predictions, model_version = predict(texts[start:start + MAX_BATCH_SIZE])
+                yield ''.join(json.dumps({"label": label, "confidence": confidence, "model_version": model_version}) + '\n'
+                              for label, confidence in predictions)
+        return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+    predictions, model_version = predict(texts)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Predictions made: {predictions}")
+    return Response(msgpack.packb(compact_predictions(predictions, model_version), use_single_float=True),
+                    mimetype='application/msgpack')
+
+@app.route('/stats', methods=['GET'])
+def stats_route():
+    """
+    Route des statistiques du regroupement des requêtes, de la tokenisation et du cache des prédictions.
+
+    Returns:
+    json: Taille des passes, attente en file, durée des passes du modèle, remplissage des
+    sous-lots et taux de succès des caches, propres au processus qui répond (voir serve.py).
+    """
+    model = manager.current
+    return jsonify({"pid": os.getpid(), "batching": scheduler.stats(),
+                    "tokenization": model.backend.flow_tokenizer.stats() if model else None,
+                    "cache": prediction_cache.stats(), "model": manager.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    """
+    Route des métriques du processus qui répond, au format texte de Prometheus (voir metrics.py).
+
+    Returns:
+    Response: Histogrammes de latence des requêtes, du décodage, de l'attente en file, de la
+    tokenisation, du modèle et des tailles de passe; cache, file d'attente et requêtes en cours.
+    """
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -69,6 +365,69 @@ def health_check():
     """
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Route pour vérifier que le modèle est chargé et préchauffé.
+
+    Returns:
+    json: État du démarrage et durée de chaque étape; code 503 tant que l'API n'est pas prête.
+    """
+    state = startup.snapshot()
+    state['model_version'] = manager.current.name if manager.current else None
+    return jsonify(state), 200 if startup.ready.is_set() else 503
+
+@app.route('/model', methods=['GET'])
+def model_status():
+    """
+    Route de l'état des versions du modèle.
+
+    Returns:
+    json: Version en service, version en cours de chargement, versions disponibles et historique.
+    """
+    state = manager.stats()
+    state['available'] = manager.available_versions()
+    return jsonify(state), 200
+
+@app.route('/model/reload', methods=['POST'])
+def model_reload():
+    """
+    Route de remplacement à chaud du modèle: la version demandée (ou la plus récente) est
+    chargée et préchauffée en arrière-plan, l'ancienne servant jusqu'au changement. Une
+    version nommée reste en service jusqu'à la demande suivante; sans version, la
+    surveillance du répertoire reprend avec la plus récente.
+
+    Returns:
+    json: Version en cours de chargement (202), 401/403 si la requête n'est pas autorisée, 404 si elle
+    n'existe pas, 409 si un chargement est déjà en cours.
+    """
+    if MODEL_RELOAD_TOKEN:
+        if not hmac.compare_digest(request.headers.get(RELOAD_TOKEN_HEADER, ''), MODEL_RELOAD_TOKEN):
+            logger.warning(f"Model reload refused: invalid token from {request.remote_addr}")
+            return jsonify({"error": "Invalid or missing reload token"}), 401
+    elif request.remote_addr not in LOOPBACK_ADDRESSES:
+        logger.warning(f"Model reload refused: non-local request from {request.remote_addr}")
+        return jsonify({"error": "Model reload is only allowed from localhost unless MODEL_RELOAD_TOKEN is set"}), 403
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    try:
+        if reload_handler is not None:
+            version = manager.resolve(version) if version else None
+            reload_handler(version)
+            started = True
+        else:
+            started = manager.reload_async(version)
+    except LookupError as e:
+        logger.error(f"Model reload refused: {e}")
+        return jsonify({"error": str(e)}), 404
+    if not started:
+        return jsonify({"error": "A model version is already loading", "loading": manager.loading}), 409
+    logger.info(f"Model reload requested ({version or 'latest'})")
+    return jsonify({"status": "loading", "version": version or manager.latest()}), 202
+
+if LOAD_IN_BACKGROUND:
+    threading.Thread(target=start_model, name='model-loader', daemon=True).start()
+
 if __name__ == "__main__":
     logger.info("Starting Flask API...")
     clear_cache()
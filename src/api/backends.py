@@ -0,0 +1,319 @@
+"""
+Moteurs d'inférence CPU du classifieur fine-tuné.
+
+- pytorch: modèle d'origine en précision complète;
+- int8: quantification dynamique int8 des couches linéaires (torch.quantization);
+- torchscript: graphe tracé puis figé par torch.jit;
+- onnx: export ONNX exécuté par ONNX Runtime (dépendance optionnelle onnxruntime).
+
+Tous les moteurs partagent le tokenizer du modèle, découpent les textes en sous-lots
+de longueurs voisines (voir tokenization.py) et renvoient les logits sous forme de
+tableau NumPy, ce qui permet de les comparer entre eux (voir compare_backends.py).
+
+Avec mmap_weights, les poids au format safetensors sont projetés en mémoire au lieu
+d'être lus: les pages sont chargées à la demande depuis le cache du système et
+partagées entre processus (voir serve.py). Seul le moteur pytorch en profite, les
+autres transformant les poids (quantification, gel du graphe, export).
+"""
+import inspect
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+from models import EXPORT_DIRECTORY
+from tokenization import FlowTokenizer
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('pytorch', 'int8', 'torchscript', 'onnx')
+# Troncature d'origine de l'API: une valeur plus basse change les prédictions des flux les plus longs
+MAX_LENGTH = 512
+MAX_BATCH_TOKENS = 8192
+EXAMPLE_FLOW = "example.com 10.0.0.1 53 10.0.0.2 53 UDP DNS"
+SAFETENSORS_FILE = 'model.safetensors'
+SAFETENSORS_DTYPES = {
+    'F64': torch.float64, 'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16,
+    'I64': torch.int64, 'I32': torch.int32, 'I16': torch.int16, 'I8': torch.int8, 'U8': torch.uint8, 'BOOL': torch.bool,
+}
+
+
+def mmap_safetensors(path):
+    """
+    Projeter un fichier safetensors en mémoire, sans copie des poids.
+
+    Args:
+    path (str): Chemin du fichier safetensors.
+
+    Returns:
+    tuple: (projection à conserver tant que les tenseurs servent, dictionnaire nom -> tenseur).
+    """
+    with open(path, 'rb') as f:
+        # Projection privée: les pages restent partagées tant qu'elles ne sont pas modifiées
+        weights = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header_size = struct.unpack('<Q', weights[:8])[0]
+    header = json.loads(weights[8:8 + header_size])
+    header.pop('__metadata__', None)
+    state_dict = {}
+    for name, entry in header.items():
+        dtype = SAFETENSORS_DTYPES[entry['dtype']]
+        begin, end = entry['data_offsets']
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            state_dict[name] = torch.empty(entry['shape'], dtype=dtype)
+            continue
+        state_dict[name] = torch.frombuffer(weights, dtype=dtype, count=count,
+                                            offset=8 + header_size + begin).reshape(entry['shape'])
+    return weights, state_dict
+
+
+class PyTorchBackend:
+    """
+    Args:
+    model_path (str): Répertoire du modèle fine-tuné.
+    threads (int): Nombre de threads intra-opération (0: valeur par défaut de la bibliothèque).
+    max_length (int): Nombre maximal de jetons par texte.
+    max_batch_tokens (int): Volume maximal (textes x longueur complétée) d'une passe.
+    mmap_weights (bool): Projeter les poids safetensors en mémoire au lieu de les lire.
+    """
+    name = 'pytorch'
+
+    def __init__(self, model_path, threads=0, max_length=MAX_LENGTH, max_batch_tokens=MAX_BATCH_TOKENS, mmap_weights=False):
+        self.model_path = model_path
+        self.threads = threads
+        self.mmap_weights = mmap_weights
+        # Durée de chaque étape du chargement (s), pour le bilan du démarrage
+        self.timings = {}
+        # Durées (s) de la tokenisation et des passes du modèle du dernier appel à logits()
+        self.pass_timings = (0.0, 0.0)
+        if threads > 0:
+            torch.set_num_threads(threads)
+        started_at = time.perf_counter()
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.flow_tokenizer = FlowTokenizer(self.tokenizer, max_length, max_batch_tokens)
+        if not self.flow_tokenizer.split_fields:
+            logger.warning("Tokenizer does not split on whitespace, field tokenization cache disabled")
+        self.timings['tokenizer'] = time.perf_counter() - started_at
+        started_at = time.perf_counter()
+        self.model = self.load_model()
+        self.timings['model'] = time.perf_counter() - started_at
+
+    def load_model(self):
+        safetensors_path = os.path.join(self.model_path, SAFETENSORS_FILE)
+        if self.mmap_weights and os.path.isfile(safetensors_path):
+            model = self.load_mapped_model(safetensors_path)
+        else:
+            if self.mmap_weights:
+                logger.warning(f"No {SAFETENSORS_FILE} in {self.model_path}, loading weights without mmap")
+            model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
+        model.eval()
+        return model
+
+    def load_mapped_model(self, safetensors_path):
+        """
+        Construire le modèle puis remplacer ses paramètres par des vues des poids
+        projetés en mémoire (load_state_dict(assign=True), PyTorch 2.1 ou plus).
+
+        Contrairement à from_pretrained, aucun nom de poids hérité n'est converti: toute
+        clé absente (hors poids liés par tie_weights) ou inattendue lève une erreur
+        plutôt que de laisser servir des poids initialisés au hasard.
+        """
+        self.weights_mmap, state_dict = mmap_safetensors(safetensors_path)
+        model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(self.model_path))
+        result = model.load_state_dict(state_dict, strict=False, assign=True)
+        model.tie_weights()
+        # Une clé absente n'est admise que si tie_weights l'a liée à un poids chargé
+        tensors = model.state_dict()
+        loaded = {tensor.data_ptr() for name, tensor in tensors.items() if name in state_dict}
+        missing = [key for key in result.missing_keys if tensors[key].data_ptr() not in loaded]
+        if missing or result.unexpected_keys:
+            raise ValueError(f"Weights in {safetensors_path} do not match the model config "
+                             f"(missing: {', '.join(missing) or 'none'}; unexpected: {', '.join(result.unexpected_keys) or 'none'})")
+        return model
+
+    def set_threads(self, threads):
+        """
+        Changer le nombre de threads intra-opération, notamment dans un processus créé
+        par fork après le chargement (voir serve.py).
+        """
+        self.threads = threads
+        if threads > 0:
+            torch.set_num_threads(threads)
+
+    def example_inputs(self):
+        """
+        Entrées d'exemple pour le tracé et l'export (dictionnaire de tenseurs).
+        """
+        _, inputs = self.flow_tokenizer.sub_batches_for([EXAMPLE_FLOW])[0]
+        return {name: torch.from_numpy(value) for name, value in inputs.items()}
+
+    def model_inputs(self, model, encoded):
+        """
+        Ordonner les entrées du tokenizer selon la signature de forward(), pour les
+        moteurs qui prennent des arguments positionnels (trace, export ONNX).
+        """
+        parameters = inspect.signature(model.forward).parameters
+        return [name for name in parameters if name in encoded]
+
+    def forward(self, inputs):
+        """
+        Args:
+        inputs (dict): Entrées d'un sous-lot (tableaux NumPy int64).
+
+        Returns:
+        numpy.ndarray: Logits du sous-lot.
+        """
+        with torch.inference_mode():
+            return self.model(**{name: torch.from_numpy(value) for name, value in inputs.items()}).logits.numpy()
+
+    def logits(self, texts):
+        """
+        Passer les textes par sous-lots de longueurs voisines et remettre les logits
+        dans l'ordre des textes.
+
+        Returns:
+        numpy.ndarray: Logits de forme (nombre de textes, nombre d'étiquettes).
+        """
+        logits = None
+        started_at = time.perf_counter()
+        sub_batches = self.flow_tokenizer.sub_batches_for(texts)
+        tokenized_at = time.perf_counter()
+        for indices, inputs in sub_batches:
+            sub_batch_logits = self.forward(inputs)
+            if logits is None:
+                logits = np.empty((len(texts), sub_batch_logits.shape[-1]), dtype=sub_batch_logits.dtype)
+            logits[indices] = sub_batch_logits
+        self.pass_timings = (tokenized_at - started_at, time.perf_counter() - tokenized_at)
+        return logits
+
+    def predict(self, texts):
+        """
+        Returns:
+        list: Indice de l'étiquette prédite pour chaque texte.
+        """
+        return np.argmax(self.logits(texts), axis=-1).tolist()
+
+    def classify(self, texts):
+        """
+        Returns:
+        list: Couples (indice de l'étiquette prédite, probabilité de cette étiquette) pour chaque texte.
+        """
+        logits = self.logits(texts).astype(np.float64)
+        probabilities = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        probabilities /= probabilities.sum(axis=-1, keepdims=True)
+        labels = probabilities.argmax(axis=-1)
+        return list(zip(labels.tolist(), probabilities[np.arange(len(labels)), labels].tolist()))
+
+
+class Int8Backend(PyTorchBackend):
+    name = 'int8'
+
+    def load_model(self):
+        model = super().load_model()
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class TorchScriptBackend(PyTorchBackend):
+    name = 'torchscript'
+
+    def load_model(self):
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_path, torchscript=True)
+        model.eval()
+        example = self.example_inputs()
+        self.input_names = self.model_inputs(model, example)
+        with torch.no_grad():
+            traced = torch.jit.trace(model, tuple(example[name] for name in self.input_names), strict=False)
+        return torch.jit.freeze(traced)
+
+    def forward(self, inputs):
+        with torch.inference_mode():
+            return self.model(*(torch.from_numpy(inputs[name]) for name in self.input_names))[0].numpy()
+
+
+class OnnxBackend(PyTorchBackend):
+    """
+    L'export est conservé dans <model_path>/onnx/model.onnx et refait si un fichier du
+    modèle est plus récent. Les threads d'une session ONNX Runtime ne survivent pas à
+    un fork: set_threads() recrée la session dans chaque processus.
+    """
+    name = 'onnx'
+
+    def load_model(self):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("The onnx backend requires the onnxruntime package") from e
+        onnx_path = os.path.join(self.model_path, EXPORT_DIRECTORY, 'model.onnx')
+        if self.export_needed(onnx_path):
+            self.export(onnx_path)
+        return self.create_session(onnx_path)
+
+    def create_session(self, onnx_path):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if self.threads > 0:
+            options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = onnxruntime.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [model_input.name for model_input in session.get_inputs()]
+        self.onnx_path = onnx_path
+        return session
+
+    def set_threads(self, threads):
+        self.threads = threads
+        # La session héritée est conservée: la détruire attendrait des threads absents après un fork
+        self.inherited_sessions = getattr(self, 'inherited_sessions', []) + [self.model]
+        self.model = self.create_session(self.onnx_path)
+
+    def export_needed(self, onnx_path):
+        if not os.path.isfile(onnx_path):
+            return True
+        exported_at = os.path.getmtime(onnx_path)
+        return any(os.path.getmtime(os.path.join(self.model_path, name)) > exported_at
+                   for name in os.listdir(self.model_path) if os.path.isfile(os.path.join(self.model_path, name)))
+
+    def export(self, onnx_path):
+        logger.info(f"Exporting {self.model_path} to ONNX ({onnx_path})...")
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_path)
+        model.eval()
+        example = self.example_inputs()
+        input_names = self.model_inputs(model, example)
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['logits'] = {0: 'batch'}
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(example[name] for name in input_names), onnx_path, input_names=input_names,
+                              output_names=['logits'], dynamic_axes=dynamic_axes, opset_version=14)
+
+    def forward(self, inputs):
+        return self.model.run(['logits'], {name: inputs[name] for name in self.input_names})[0]
+
+
+BACKEND_CLASSES = {backend.name: backend for backend in (PyTorchBackend, Int8Backend, TorchScriptBackend, OnnxBackend)}
+
+
+def load_backend(name, model_path, threads=0, max_length=MAX_LENGTH, max_batch_tokens=MAX_BATCH_TOKENS, mmap_weights=False):
+    """
+    Charger le moteur d'inférence demandé.
+
+    Args:
+    name (str): Nom du moteur (voir BACKENDS).
+    model_path (str): Répertoire du modèle fine-tuné.
+    threads (int): Nombre de threads intra-opération (0: valeur par défaut).
+    max_length (int): Nombre maximal de jetons par texte.
+    max_batch_tokens (int): Volume maximal (textes x longueur complétée) d'une passe.
+    mmap_weights (bool): Projeter les poids safetensors en mémoire (moteur pytorch).
+
+    Returns:
+    PyTorchBackend: Moteur prêt à prédire.
+    """
+    if name not in BACKEND_CLASSES:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {', '.join(BACKENDS)}")
+    return BACKEND_CLASSES[name](model_path, threads, max_length, max_batch_tokens, mmap_weights)
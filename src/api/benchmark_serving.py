@@ -0,0 +1,166 @@
+"""
+Montée en charge du service multi-processus (serve.py) selon le nombre de processus.
+
+Pour chaque nombre de processus, serve.py est lancé avec les cœurs disponibles
+répartis entre les processus, puis des clients (processus distincts) envoient en
+continu des lots de chaînes de flux toutes différentes, pour que le cache des
+prédictions ne serve pas les réponses. Le rapport donne le débit, la latence des
+requêtes, l'accélération par rapport à un seul processus et la mémoire des
+processus (PSS, qui compte une seule fois les pages partagées, contre RSS).
+
+Usage (depuis src/api, Linux):
+    python benchmark_serving.py
+    python benchmark_serving.py --workers 1 2 4 8 --clients 16 --duration 30 --batch-size 32
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+import requests
+
+from serve import usable_cores
+
+
+def synthetic_flow(rng):
+    return (f"host{rng.randrange(10 ** 6)}.example.com 10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)} "
+            f"{rng.randrange(1024, 65536)} 192.168.{rng.randrange(256)}.{rng.randrange(256)} "
+            f"{rng.choice((53, 80, 443, 8080))} {rng.choice(('TCP', 'UDP'))} {rng.choice(('DNS', 'HTTP', 'HTTPS', 'unknown'))}")
+
+
+def client(url, batch_size, deadline, seed, results):
+    rng = random.Random(seed)
+    session = requests.Session()
+    texts, latencies, errors = 0, [], 0
+    while time.monotonic() < deadline:
+        batch = [synthetic_flow(rng) for _ in range(batch_size)]
+        started_at = time.perf_counter()
+        try:
+            response = session.post(url, json={'input_text': batch}, timeout=60)
+            response.raise_for_status()
+        except requests.RequestException:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started_at)
+        texts += batch_size
+    results.put((texts, latencies, errors))
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    return {f'p{point}': samples[min(len(samples) - 1, int(len(samples) * point / 100))] for point in points}
+
+
+def worker_memory(pid):
+    """
+    Returns:
+    dict: RSS et PSS cumulés (Mo) des processus créés par le maître, si /proc le permet.
+    """
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(child) for child in f.read().split()]
+        totals = {'rss_mb': 0.0, 'pss_mb': 0.0}
+        for child in children:
+            with open(f'/proc/{child}/smaps_rollup') as f:
+                for line in f:
+                    name, value = line.split(':', 1)
+                    if name in ('Rss', 'Pss'):
+                        totals[f'{name.lower()}_mb'] += int(value.split()[0]) / 1024
+        return totals
+    except OSError:
+        return {}
+
+
+def wait_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/ready', timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"API not ready after {timeout}s")
+
+
+def run_level(workers, args):
+    threads = max(1, usable_cores() // workers)
+    base_url = f'http://127.0.0.1:{args.port}'
+    env = dict(os.environ, PREDICTION_CACHE_MB='1', INFERENCE_THREADS=str(threads))
+    process = subprocess.Popen([sys.executable, 'serve.py', '--workers', str(workers), '--threads-per-worker',
+                                str(threads), '--host', '127.0.0.1', '--port', str(args.port)], env=env)
+    try:
+        wait_ready(base_url, process, args.startup_timeout)
+        # Première passe de chaque processus (allocations, caches du tokenizer)
+        rng = random.Random(0)
+        for _ in range(2 * workers):
+            requests.post(f'{base_url}/predict', json={'input_text': [synthetic_flow(rng) for _ in range(args.batch_size)]},
+                          timeout=60)
+        results = multiprocessing.Queue()
+        deadline = time.monotonic() + args.duration
+        clients = [multiprocessing.Process(target=client, args=(f'{base_url}/predict', args.batch_size, deadline,
+                                                                 index + 1, results))
+                   for index in range(args.clients)]
+        started_at = time.perf_counter()
+        for process_client in clients:
+            process_client.start()
+        collected = [results.get() for _ in clients]
+        elapsed = time.perf_counter() - started_at
+        for process_client in clients:
+            process_client.join()
+        memory = worker_memory(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+    texts = sum(result[0] for result in collected)
+    latencies = [latency for result in collected for latency in result[1]]
+    return {
+        'workers': workers,
+        'threads_per_worker': threads,
+        'texts_per_s': texts / elapsed,
+        'request_latency_ms': {point: value * 1000 for point, value in percentiles(latencies).items()},
+        'errors': sum(result[2] for result in collected),
+        **memory,
+    }
+
+
+def print_report(report):
+    print(f"Cœurs: {report['cores']}, clients: {report['clients']}, lots de {report['batch_size']}, "
+          f"{report['duration']}s par mesure")
+    print(f"{'processus':>10}{'threads':>9}{'textes/s':>11}{'accél.':>8}{'p50 (ms)':>10}{'p99 (ms)':>10}"
+          f"{'erreurs':>9}{'RSS (Mo)':>10}{'PSS (Mo)':>10}")
+    baseline = report['levels'][0]['texts_per_s'] if report['levels'] else 0
+    for level in report['levels']:
+        latency = level['request_latency_ms']
+        print(f"{level['workers']:>10}{level['threads_per_worker']:>9}{level['texts_per_s']:>11.0f}"
+              f"{level['texts_per_s'] / baseline if baseline else 0:>7.2f}x{latency.get('p50', 0):>10.1f}"
+              f"{latency.get('p99', 0):>10.1f}{level['errors']:>9}{level.get('rss_mb', 0):>10.0f}{level.get('pss_mb', 0):>10.0f}")
+
+
+if __name__ == "__main__":
+    cores = usable_cores()
+    parser = argparse.ArgumentParser(description="Mesurer le débit de serve.py selon le nombre de processus")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[count for count in (1, 2, 4, 8, 16) if count <= cores], help="Nombres de processus mesurés")
+    parser.add_argument('--clients', type=int, default=16, help="Nombre de clients concurrents")
+    parser.add_argument('--batch-size', type=int, default=32, help="Nombre de textes par requête")
+    parser.add_argument('--duration', type=float, default=20, help="Durée de chaque mesure (s)")
+    parser.add_argument('--port', type=int, default=55600, help="Port utilisé par le service mesuré")
+    parser.add_argument('--startup-timeout', type=float, default=300, help="Attente maximale du démarrage (s)")
+    parser.add_argument('--json', action='store_true', help="Afficher le résultat brut au format JSON")
+    args = parser.parse_args()
+
+    report = {'cores': cores, 'clients': args.clients, 'batch_size': args.batch_size, 'duration': args.duration,
+              'levels': [run_level(workers, args) for workers in args.workers]}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
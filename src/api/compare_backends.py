@@ -0,0 +1,155 @@
+"""
+Comparaison des moteurs d'inférence CPU: parité des prédictions et latence.
+
+Les textes et étiquettes sont construits à partir de la matrice de flux étiquetée
+(dtframe.csv) comme dans src/training/preparation.py. Chaque moteur est comparé au
+modèle PyTorch d'origine: exactitude sur les étiquettes, accord des prédictions,
+écart maximal des logits, puis latence par lot et débit.
+
+--token-lengths affiche seulement la distribution du nombre de jetons des flux, qui
+sert à choisir INFERENCE_MAX_LENGTH.
+
+Usage (depuis src/api, CPU uniquement):
+    python compare_backends.py
+    python compare_backends.py --backends pytorch int8 onnx --threads 4 --batch-size 32
+    python compare_backends.py --token-lengths
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+# Mesures sur CPU uniquement, même si un GPU est présent
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+
+import numpy as np
+
+from transformers import AutoTokenizer
+
+from backends import BACKENDS, load_backend
+from tokenization import FlowTokenizer
+
+LABELS = {'allow': 1, 'deny': 0}
+
+
+def load_flux_matrix(path, limit=None):
+    """
+    Lire la matrice de flux étiquetée.
+
+    Args:
+    path (str): Chemin de dtframe.csv.
+    limit (int): Nombre maximal de lignes lues.
+
+    Returns:
+    tuple: (textes, étiquettes 1 pour allow et 0 pour deny).
+    """
+    texts, labels = [], []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            texts.append(f"{row['domain']} {row['source_ip']} {row['source_port']} {row['destination_ip']} {row['destination_port']} {row['protocol']} {row['application_layer_protocol']}")
+            labels.append(LABELS[row['target']])
+            if limit and len(texts) >= limit:
+                break
+    return texts, np.array(labels)
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    samples = sorted(samples)
+    return {f'p{point}': samples[min(len(samples) - 1, int(len(samples) * point / 100))] for point in points}
+
+
+def evaluate_backend(backend, texts, batch_size, warmup=3):
+    """
+    Returns:
+    tuple: (logits de tous les textes, durées de chaque lot en secondes).
+    """
+    for start in range(0, min(len(texts), warmup * batch_size), batch_size):
+        backend.logits(texts[start:start + batch_size])
+    logits, durations = [], []
+    for start in range(0, len(texts), batch_size):
+        started_at = time.perf_counter()
+        logits.append(backend.logits(texts[start:start + batch_size]))
+        durations.append(time.perf_counter() - started_at)
+    return np.concatenate(logits), durations
+
+
+def token_lengths(model_path, data_path, limit=None):
+    """
+    Returns:
+    dict: Percentiles du nombre de jetons des flux et longueur maximale conseillée
+    (plus grande longueur observée, arrondie au multiple de 8 supérieur).
+    """
+    texts, _ = load_flux_matrix(data_path, limit)
+    flow_tokenizer = FlowTokenizer(AutoTokenizer.from_pretrained(model_path))
+    distribution = flow_tokenizer.length_distribution(texts)
+    return {'texts': len(texts), 'tokens': distribution, 'suggested_max_length': -(-distribution['p100'] // 8) * 8}
+
+
+def compare_backends(model_path, data_path, backend_names, threads=0, batch_size=32, limit=None, max_length=512):
+    """
+    Returns:
+    dict: Résultats par moteur (chargement, exactitude, parité, latence, débit).
+    """
+    texts, labels = load_flux_matrix(data_path, limit)
+    reference = None
+    results = {}
+    for name in ['pytorch'] + [name for name in backend_names if name != 'pytorch']:
+        started_at = time.perf_counter()
+        backend = load_backend(name, model_path, threads, max_length)
+        load_time = time.perf_counter() - started_at
+        logits, durations = evaluate_backend(backend, texts, batch_size)
+        predictions = logits.argmax(axis=-1)
+        if reference is None:
+            reference = (logits, predictions)
+        total = sum(durations)
+        results[name] = {
+            'load_s': load_time,
+            'accuracy': float((predictions == labels).mean()),
+            'agreement': float((predictions == reference[1]).mean()),
+            'disagreements': int((predictions != reference[1]).sum()),
+            'max_logit_diff': float(np.abs(logits - reference[0]).max()),
+            'batch_latency_ms': {point: value * 1000 for point, value in percentiles(durations).items()},
+            'texts_per_s': len(texts) / total if total > 0 else 0.0,
+            'padding_efficiency': backend.flow_tokenizer.stats()['padding_efficiency'],
+        }
+        del backend
+    results = {name: results[name] for name in results if name in backend_names}
+    return {'texts': len(texts), 'batch_size': batch_size, 'threads': threads, 'max_length': max_length,
+            'backends': results}
+
+
+def print_report(report):
+    print(f"Textes: {report['texts']}, lots de {report['batch_size']}, threads: {report['threads'] or 'défaut'}, "
+          f"au plus {report['max_length']} jetons par texte")
+    print(f"{'moteur':<12}{'chargement':>12}{'exactitude':>12}{'accord':>10}{'écart max':>12}"
+          f"{'p50 (ms)':>10}{'p90 (ms)':>10}{'textes/s':>10}{'remplissage':>13}")
+    for name, result in report['backends'].items():
+        latency = result['batch_latency_ms']
+        print(f"{name:<12}{result['load_s']:>11.1f}s{result['accuracy']:>12.4f}{result['agreement']:>10.4f}"
+              f"{result['max_logit_diff']:>12.4f}{latency['p50']:>10.1f}{latency['p90']:>10.1f}{result['texts_per_s']:>10.0f}"
+              f"{result['padding_efficiency']:>13.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comparer les moteurs d'inférence CPU du classifieur")
+    parser.add_argument('--model', default='./maudhuyAI/v2_2', help="Répertoire du modèle fine-tuné")
+    parser.add_argument('--data', default='../../data/matrice de flux/new/dtframe.csv', help="Matrice de flux étiquetée")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS), help="Moteurs à comparer")
+    parser.add_argument('--threads', type=int, default=0, help="Threads intra-opération (0: défaut)")
+    parser.add_argument('--batch-size', type=int, default=32, help="Nombre de textes par passe")
+    parser.add_argument('--limit', type=int, help="Nombre maximal de lignes de la matrice")
+    parser.add_argument('--max-length', type=int, default=512, help="Nombre maximal de jetons par texte")
+    parser.add_argument('--token-lengths', action='store_true', help="Afficher seulement la distribution des longueurs en jetons")
+    parser.add_argument('--json', action='store_true', help="Afficher le résultat brut au format JSON")
+    args = parser.parse_args()
+
+    if args.token_lengths:
+        print(json.dumps(token_lengths(args.model, args.data, args.limit), indent=2))
+    else:
+        report = compare_backends(args.model, args.data, args.backends, args.threads, args.batch_size, args.limit,
+                                  args.max_length)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
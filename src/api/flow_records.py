@@ -0,0 +1,28 @@
+"""
+Enregistrements de flux structurés reçus par /predict/flows.
+
+Un flux est un tableau de valeurs dans l'ordre de FLOW_FIELDS (celui de
+src/sniffing/flows.py) ou un dictionnaire indexé par ces noms; une valeur absente
+vaut None. Le texte soumis au modèle est construit exactement comme la chaîne que
+le renifleur envoie à /predict, valeurs absentes comprises ('none').
+"""
+FLOW_FIELDS = ('domain', 'source_ip', 'source_port', 'destination_ip', 'destination_port', 'protocol', 'application_layer_protocol')
+# Étiquettes du modèle, par identifiant
+LABELS = ('deny', 'allow')
+
+
+def flow_text(record):
+    """
+    Args:
+    record (list | dict): Flux structuré.
+
+    Returns:
+    str: Texte du flux tel qu'attendu par le modèle.
+    """
+    if isinstance(record, dict):
+        values = [record.get(field) for field in FLOW_FIELDS]
+    elif isinstance(record, (list, tuple)) and len(record) == len(FLOW_FIELDS):
+        values = record
+    else:
+        raise ValueError(f"A flow record must be a list of {len(FLOW_FIELDS)} values or an object with fields {', '.join(FLOW_FIELDS)}")
+    return ' '.join('none' if value is None else str(value) for value in values)
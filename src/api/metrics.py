@@ -0,0 +1,142 @@
+"""
+Métriques de l'API au format texte de Prometheus (route /metrics).
+
+Chaque mesure coûte une recherche dichotomique dans les bornes de l'histogramme et
+deux additions sous un verrou propre à la métrique; le rendu du texte n'a lieu qu'à
+la lecture de /metrics. Les jauges calculées (file d'attente, cache) sont lues au
+moment du rendu et ne coûtent rien sur le chemin des requêtes.
+
+Chaque processus a ses propres métriques. Avec serve.py, METRICS_PORT_BASE donne à
+chaque processus un port supplémentaire (base + numéro du processus) pour que
+Prometheus les interroge séparément, le port commun répartissant les connexions.
+"""
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bornes des histogrammes de durée (s) et de taille de lot
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Args:
+    name (str): Nom de la métrique.
+    documentation (str): Description (ligne HELP).
+    buckets (tuple): Bornes supérieures croissantes des intervalles.
+    labels (tuple): Noms des étiquettes, dont les valeurs sont passées à observe().
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.bounds = tuple(buckets)
+        self.labels = tuple(labels)
+        # Valeurs des étiquettes -> [effectifs par intervalle (dernier: au-delà de la borne maximale), somme]
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            child = self.children.get(label_values)
+            if child is None:
+                child = self.children[label_values] = [[0] * (len(self.bounds) + 1), 0.0]
+            child[0][index] += 1
+            child[1] += value
+
+    def samples(self):
+        with self.lock:
+            children = [(label_values, list(counts), total) for label_values, (counts, total) in self.children.items()]
+        for label_values, counts, total in sorted(children):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', format_labels(self.labels, label_values, [f'le="{format_value(bound)}"']), cumulative
+            yield f'{self.name}_sum', format_labels(self.labels, label_values), total
+            yield f'{self.name}_count', format_labels(self.labels, label_values), cumulative
+
+
+class Gauge:
+    """
+    Jauge modifiée par inc()/dec(), ou calculée au rendu par read_fn.
+
+    Args:
+    name (str): Nom de la métrique.
+    documentation (str): Description (ligne HELP).
+    read_fn (callable): Fonction sans argument qui renvoie la valeur (None: valeur tenue par inc/dec).
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, read_fn=None):
+        self.name = name
+        self.documentation = documentation
+        self.read_fn = read_fn
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def samples(self):
+        yield self.name, '', self.read_fn() if self.read_fn is not None else self.value
+
+
+class Counter(Gauge):
+    """
+    Compteur croissant, tenu par inc() ou lu au rendu par read_fn (compteur d'un autre composant).
+    """
+    kind = 'counter'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, labels=()):
+        return self.register(Histogram(name, documentation, buckets, labels))
+
+    def gauge(self, name, documentation, read_fn=None):
+        return self.register(Gauge(name, documentation, read_fn))
+
+    def counter(self, name, documentation, read_fn=None):
+        return self.register(Counter(name, documentation, read_fn))
+
+    def render(self):
+        """
+        Returns:
+        str: Toutes les métriques au format texte de Prometheus.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {format_value(value)}' for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,242 @@
+"""
+Versions du modèle fine-tuné et remplacement à chaud.
+
+Les versions sont les sous-répertoires de MODEL_DIRECTORY (v2_2, v2_3... tels
+qu'écrits par src/training/fineTune.py), ordonnées par leur numéro. Une version
+n'est retenue que complète (config.json et poids présents) et, pour remplacer le
+modèle en service, stable (aucun fichier modifié depuis settle_seconds), pour ne pas
+charger un modèle en cours d'écriture. Le premier chargement n'attend pas cette
+stabilité.
+
+Une nouvelle version est chargée et préchauffée pendant que l'ancienne continue de
+servir, puis mise en service par une simple affectation: le thread des passes lit
+la version courante une fois par passe, le changement a donc lieu entre deux passes.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+WEIGHT_FILES = ('model.safetensors', 'model.safetensors.index.json', 'pytorch_model.bin', 'pytorch_model.bin.index.json')
+# Sous-répertoire du modèle où sont conservés les exports (ignoré par l'empreinte du modèle)
+EXPORT_DIRECTORY = 'onnx'
+
+
+def model_fingerprint(path):
+    """
+    Calculer l'empreinte d'un répertoire de modèle (noms, tailles et dates des fichiers).
+
+    Args:
+    path (str): Répertoire du modèle.
+
+    Returns:
+    str: Empreinte hexadécimale courte, qui change dès qu'un fichier du modèle change.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for root, dirs, files in os.walk(path):
+        # Les exports dérivés du modèle (ONNX) ne changent pas ses prédictions
+        dirs[:] = sorted(name for name in dirs if not (root == path and name == EXPORT_DIRECTORY))
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            stat = os.stat(file_path)
+            digest.update(f"{os.path.relpath(file_path, path)}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def version_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def is_complete(path):
+    return os.path.isfile(os.path.join(path, 'config.json')) and \
+        any(os.path.isfile(os.path.join(path, name)) for name in WEIGHT_FILES)
+
+
+def last_modified(path):
+    return max((os.path.getmtime(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files), default=0.0)
+
+
+class ModelVersion:
+    """
+    Version chargée du modèle.
+
+    Args:
+    name (str): Nom de la version (répertoire).
+    path (str): Répertoire du modèle.
+    fingerprint (str): Empreinte des fichiers du modèle.
+    backend: Moteur d'inférence chargé (voir backends.py).
+    """
+    def __init__(self, name, path, fingerprint, backend):
+        self.name = name
+        self.path = path
+        self.fingerprint = fingerprint
+        self.backend = backend
+        # Portée du cache des prédictions: une version réécrite sur place change d'empreinte
+        self.cache_scope = f"{name}:{fingerprint}"
+        self.loaded_at = time.time()
+
+
+class ModelManager:
+    """
+    Args:
+    directory (str): Répertoire des versions, ou répertoire d'un modèle unique.
+    load_fn (callable): Charge un répertoire de modèle, load_fn(path, warm), et renvoie le moteur.
+    pinned_version (str): Version imposée (None: la plus récente).
+    settle_seconds (float): Ancienneté minimale des fichiers d'une version avant son chargement.
+    """
+    def __init__(self, directory, load_fn, pinned_version=None, settle_seconds=10.0):
+        self.directory = directory
+        self.load_fn = load_fn
+        self.pinned_version = pinned_version or None
+        self.settle_seconds = settle_seconds
+        self.current = None
+        self.loading = None
+        self.last_error = None
+        self.swaps = 0
+        self.history = deque(maxlen=20)
+        self.load_lock = threading.Lock()
+
+    def available_versions(self):
+        """
+        Returns:
+        list: Versions complètes (et stables, une fois un modèle en service), de la plus ancienne à la plus récente.
+        """
+        if is_complete(self.directory):
+            # Répertoire d'un modèle unique (ancienne organisation)
+            return [os.path.basename(os.path.normpath(self.directory))]
+        if not os.path.isdir(self.directory):
+            return []
+        versions = [name for name in os.listdir(self.directory) if is_complete(os.path.join(self.directory, name))]
+        if self.current is not None:
+            # Seul un remplacement à chaud attend que la version soit stable: au démarrage, un
+            # modèle copié juste avant reste chargé sans délai
+            now = time.time()
+            versions = [name for name in versions
+                        if now - last_modified(os.path.join(self.directory, name)) >= self.settle_seconds]
+        return sorted(versions, key=version_key)
+
+    def version_path(self, name):
+        if is_complete(self.directory):
+            return self.directory
+        return os.path.join(self.directory, name)
+
+    def latest(self):
+        versions = self.available_versions()
+        return versions[-1] if versions else None
+
+    def resolve(self, version=None):
+        """
+        Returns:
+        str: Version demandée, imposée ou, à défaut, la plus récente.
+        """
+        versions = self.available_versions()
+        name = version or self.pinned_version or (versions[-1] if versions else None)
+        if name is None or name not in versions:
+            raise LookupError(f"Model version '{name}' not found in {self.directory}" if name
+                              else f"No complete model version in {self.directory}")
+        return name
+
+    def load(self, version=None, warm=True, pin=False):
+        """
+        Charger une version puis la mettre en service (bloquant).
+
+        Args:
+        version (str): Version à charger (None: imposée ou la plus récente).
+        warm (bool): Préchauffer le moteur avant sa mise en service.
+        pin (bool): Demande explicite: la version demandée devient la version imposée, que la
+            surveillance du répertoire ne remplace plus (version None: la plus récente, sans version imposée).
+
+        Returns:
+        ModelVersion: Version en service.
+        """
+        with self.load_lock:
+            name = self.resolve(version or (self.latest() if pin else None))
+            if pin:
+                self.pinned_version = version or None
+            path = self.version_path(name)
+            fingerprint = model_fingerprint(path)
+            if self.current is not None and self.current.cache_scope == f"{name}:{fingerprint}":
+                return self.current
+            self.loading = name
+            started_at = time.perf_counter()
+            try:
+                backend = self.load_fn(path, warm)
+            except Exception as e:
+                self.last_error = f"{name}: {e}"
+                raise
+            finally:
+                self.loading = None
+            model = ModelVersion(name, path, fingerprint, backend)
+            previous = self.current
+            self.current = model
+            self.last_error = None
+            if previous is not None:
+                self.swaps += 1
+            self.history.append({'version': name, 'fingerprint': fingerprint, 'loaded_at': model.loaded_at,
+                                 'load_s': time.perf_counter() - started_at})
+            logger.info(f"Model version {name} in service ({time.perf_counter() - started_at:.1f}s to load"
+                        f"{f', replacing {previous.name}' if previous else ''})")
+            return model
+
+    def update_available(self):
+        """
+        Returns:
+        bool: True si une version plus récente (ou la version courante réécrite) est disponible.
+        """
+        if self.current is None:
+            return True
+        try:
+            name = self.resolve()
+        except LookupError:
+            return False
+        return name != self.current.name or model_fingerprint(self.version_path(name)) != self.current.fingerprint
+
+    def reload_async(self, version=None):
+        """
+        Charger une version dans un thread, l'ancienne continuant de servir. La demande est
+        explicite: la version demandée devient la version imposée (None: la plus récente).
+
+        Returns:
+        bool: False si un chargement est déjà en cours.
+        """
+        if self.load_lock.locked():
+            return False
+        self.resolve(version or self.latest())
+        threading.Thread(target=self.reload_quietly, args=(version, True), name='model-reload', daemon=True).start()
+        return True
+
+    def reload_quietly(self, version=None, pin=False):
+        try:
+            self.load(version, pin=pin)
+        except Exception as e:
+            logger.error(f"Model reload failed: {e}")
+
+    def watch(self, interval):
+        """
+        Surveiller le répertoire des versions et charger toute nouvelle version.
+        """
+        while True:
+            time.sleep(interval)
+            try:
+                if not self.load_lock.locked() and self.update_available():
+                    self.reload_quietly()
+            except OSError as e:
+                logger.error(f"Model directory check failed: {e}")
+
+    def stats(self):
+        current = self.current
+        return {
+            'directory': self.directory,
+            'pinned_version': self.pinned_version,
+            'version': current.name if current else None,
+            'fingerprint': current.fingerprint if current else None,
+            'loading': self.loading,
+            'last_error': self.last_error,
+            'swaps': self.swaps,
+            'history': list(self.history),
+        }
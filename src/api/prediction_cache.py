@@ -0,0 +1,105 @@
+"""
+Cache des prédictions par texte d'entrée, borné en mémoire, à éviction LRU et durée de vie.
+
+Les clés sont des empreintes BLAKE2b de 64 bits des textes afin que la taille d'une
+entrée ne dépende pas de la longueur du texte, associées à la portée de la version du
+modèle qui a produit la prédiction (voir models.ModelVersion.cache_scope). Après un
+remplacement du modèle, les entrées de l'ancienne version ne sont plus lues et
+sortent du cache par l'éviction LRU; un retour à cette version les retrouve.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Coût mémoire estimé d'une entrée (clé (portée, entier), couple étiquette/confiance, nœud de l'OrderedDict)
+ENTRY_SIZE_BYTES = 300
+
+
+def text_key(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class PredictionCache:
+    """
+    Args:
+    memory_budget_mb (float): Budget mémoire du cache, converti en nombre maximal d'entrées.
+    ttl (float): Durée de vie d'une entrée en secondes (None: pas d'expiration).
+    """
+    def __init__(self, memory_budget_mb=64, ttl=None):
+        self.max_entries = max(1, int(memory_budget_mb * 1024 * 1024 / ENTRY_SIZE_BYTES))
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def lookup(self, texts, scope):
+        """
+        Chercher les prédictions de textes, en regroupant les doublons du lot.
+
+        Args:
+        texts (list): Textes d'une requête.
+        scope (str): Portée de la version du modèle en service.
+
+        Returns:
+        tuple: (prédictions avec None pour les textes absents, dictionnaire texte absent -> positions).
+        """
+        predictions = [None] * len(texts)
+        missing = {}
+        now = time.monotonic()
+        with self.lock:
+            for index, text in enumerate(texts):
+                if text in missing:
+                    missing[text].append(index)
+                    self.deduplicated += 1
+                    continue
+                key = (scope, text_key(text))
+                entry = self.entries.get(key)
+                if entry is not None and entry[1] is not None and entry[1] <= now:
+                    del self.entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    missing[text] = [index]
+                    self.misses += 1
+                else:
+                    self.entries.move_to_end(key)
+                    predictions[index] = entry[0]
+                    self.hits += 1
+        return predictions, missing
+
+    def store(self, texts, predictions, scope):
+        """
+        Enregistrer des prédictions de la version du modèle de portée scope.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            for text, prediction in zip(texts, predictions):
+                key = (scope, text_key(text))
+                self.entries[key] = (prediction, expires_at)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'deduplicated': self.deduplicated,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -0,0 +1,172 @@
+"""
+Regroupement des requêtes /predict concurrentes en une seule passe du modèle.
+
+Chaque thread waitress dépose ses textes et attend son résultat. Un thread unique
+rassemble les requêtes en attente jusqu'à max_batch_size textes ou max_wait
+secondes après l'arrivée de la première, exécute une seule passe du modèle puis
+rend à chaque appelant la part qui lui revient. Les passes ne se concurrencent
+donc plus pour les cœurs CPU.
+
+Le thread ne survit pas à un fork: chaque processus créé par serve.py redémarre le
+sien avec une file vide.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class PendingRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """
+    Args:
+    predict_fn (callable): Fonction qui prend une liste de textes et renvoie la liste des prédictions.
+    max_batch_size (int): Nombre maximal de textes par passe du modèle.
+    max_wait (float): Attente maximale (s) d'une requête avant le départ de sa passe.
+    max_samples (int): Nombre de mesures conservées pour les statistiques.
+    on_batch (callable): Appelée après chaque passe avec le nombre de textes et les attentes en file (s) des requêtes.
+    """
+    def __init__(self, predict_fn, max_batch_size=64, max_wait=0.005, max_samples=10000, on_batch=None):
+        self.predict_fn = predict_fn
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batch_sizes = deque(maxlen=max_samples)
+        self.requests_per_batch = deque(maxlen=max_samples)
+        self.queue_waits = deque(maxlen=max_samples)
+        self.forward_times = deque(maxlen=max_samples)
+        self.batches = 0
+        self.texts = 0
+        self.merged_duplicates = 0
+        self.start()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.start)
+
+    def start(self):
+        """
+        Démarrer le thread des passes avec une file vide (au lancement et après un fork).
+        """
+        self.requests = queue.Queue()
+        self.carry_over = None
+        self.stats_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='predict-scheduler', daemon=True)
+        self.thread.start()
+
+    def submit(self, texts):
+        """
+        Déposer des textes et attendre leurs prédictions.
+
+        Args:
+        texts (list): Textes d'une requête.
+
+        Returns:
+        list: Prédictions, dans l'ordre des textes.
+        """
+        request = PendingRequest(list(texts))
+        self.requests.put(request)
+        return request.future.result()
+
+    def next_batch(self):
+        """
+        Rassembler les requêtes d'une passe: la première attendue sans limite, les
+        suivantes jusqu'à max_wait après elle ou jusqu'à max_batch_size textes.
+        """
+        first = self.carry_over if self.carry_over is not None else self.requests.get()
+        self.carry_over = None
+        batch = [first]
+        size = len(first.texts)
+        deadline = first.submitted_at + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if size + len(request.texts) > self.max_batch_size:
+                # La requête partira en tête de la passe suivante
+                self.carry_over = request
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            started_at = time.perf_counter()
+            texts = [text for request in batch for text in request.texts]
+            # Un texte présent dans plusieurs requêtes de la passe n'est prédit qu'une fois
+            unique_texts = list(dict.fromkeys(texts))
+            try:
+                # Une requête seule plus grande que max_batch_size est traitée en plusieurs passes
+                predictions = []
+                for start in range(0, len(unique_texts), self.max_batch_size):
+                    predictions.extend(self.predict_fn(unique_texts[start:start + self.max_batch_size]))
+            except Exception as e:
+                logger.error(f"Batched prediction failed: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            forward_time = time.perf_counter() - started_at
+
+            by_text = dict(zip(unique_texts, predictions))
+            for request in batch:
+                request.future.set_result([by_text[text] for text in request.texts])
+
+            queue_waits = [started_at - request.submitted_at for request in batch]
+            with self.stats_lock:
+                self.batches += 1
+                self.texts += len(unique_texts)
+                self.merged_duplicates += len(texts) - len(unique_texts)
+                self.batch_sizes.append(len(unique_texts))
+                self.requests_per_batch.append(len(batch))
+                self.forward_times.append(forward_time)
+                self.queue_waits.extend(queue_waits)
+            if self.on_batch is not None:
+                self.on_batch(len(unique_texts), queue_waits)
+
+    @staticmethod
+    def percentiles(samples, points=(50, 90, 99)):
+        samples = sorted(samples)
+        if not samples:
+            return {}
+        return {f'p{point}': samples[min(len(samples) - 1, int(len(samples) * point / 100))] for point in points}
+
+    def pending(self):
+        """
+        Returns:
+        int: Requêtes en attente d'une passe.
+        """
+        return self.requests.qsize() + (self.carry_over is not None)
+
+    def stats(self):
+        with self.stats_lock:
+            batch_sizes = list(self.batch_sizes)
+            requests_per_batch = list(self.requests_per_batch)
+            queue_waits = list(self.queue_waits)
+            forward_times = list(self.forward_times)
+            batches, texts, merged_duplicates = self.batches, self.texts, self.merged_duplicates
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': batches,
+            'texts': texts,
+            'merged_duplicates': merged_duplicates,
+            'mean_batch_size': texts / batches if batches else 0.0,
+            'mean_requests_per_batch': sum(requests_per_batch) / len(requests_per_batch) if requests_per_batch else 0.0,
+            'batch_size': self.percentiles(batch_sizes),
+            'queue_wait_ms': {name: value * 1000 for name, value in self.percentiles(queue_waits).items()},
+            'forward_ms': {name: value * 1000 for name, value in self.percentiles(forward_times).items()},
+            'pending_requests': self.pending(),
+        }
@@ -0,0 +1,313 @@
+"""
+Service de l'API par plusieurs processus qui partagent le modèle.
+
+Le processus maître charge le modèle une seule fois (app.load_model) puis crée N
+processus par fork: les poids restent partagés en copie sur écriture tant qu'ils ne
+sont pas modifiés, et les threads intra-opération sont répartis entre les processus.
+Chaque processus sert l'API avec waitress sur son propre socket ouvert avec
+SO_REUSEPORT, le noyau répartissant les connexions entre eux (à défaut, tous
+acceptent les connexions du socket du maître). Chaque processus se préchauffe avant
+d'accepter des connexions, les pools de threads ne survivant pas au fork. Le maître
+relance un processus qui s'arrête et arrête les processus à la réception de SIGTERM
+ou SIGINT.
+
+Remplacement du modèle: le maître charge la nouvelle version (nouvelle version
+apparue dans MODEL_DIRECTORY, SIGHUP, ou POST /model/reload reçu par un processus),
+crée une nouvelle génération de processus qui la partagent, puis arrête l'ancienne
+une fois la nouvelle prête. Un processus arrêté n'accepte plus de connexions et
+dispose de WORKER_GRACE_SECONDS pour terminer ses requêtes en cours.
+
+Linux et macOS uniquement (fork). Sous Windows, voir start.txt (waitress-serve).
+
+Usage (depuis src/api):
+    python serve.py --workers 4
+    python serve.py --workers 4 --threads-per-worker 2 --port 55555
+    kill -HUP <pid du maître>    # charger la version la plus récente
+"""
+import argparse
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+API_WORKERS = int(os.environ.get('API_WORKERS', 2))
+# Port propre à chaque processus en plus du port commun (base + numéro du processus),
+# pour interroger /metrics et /stats de chacun (0: désactivé)
+METRICS_PORT_BASE = int(os.environ.get('METRICS_PORT_BASE', 0))
+# Délai accordé aux requêtes en cours d'un processus arrêté (s)
+WORKER_GRACE_SECONDS = float(os.environ.get('WORKER_GRACE_SECONDS', 10))
+# Délai minimal entre deux relances d'un même processus
+RESPAWN_DELAY = 1.0
+# Intervalle de la boucle du maître (s)
+POLL_INTERVAL = 0.5
+
+
+def usable_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def open_socket(host, port, reuse_port, listen=True):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    if listen:
+        sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+class PreforkServer:
+    """
+    Args:
+    app_module (module): Module app, modèle déjà chargé.
+    host (str): Adresse d'écoute.
+    port (int): Port d'écoute.
+    workers (int): Nombre de processus.
+    threads_per_worker (int): Threads intra-opération de chaque processus.
+    request_threads (int): Threads waitress de chaque processus.
+    """
+    def __init__(self, app_module, host, port, workers, threads_per_worker, request_threads=8):
+        self.app_module = app_module
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.request_threads = request_threads
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        # Avec SO_REUSEPORT, le socket du maître n'écoute pas: il réserve seulement le port
+        self.socket = open_socket(host, port, self.reuse_port, listen=not self.reuse_port)
+        # Demandes de rechargement des processus, une ligne par demande (version, vide: la plus récente)
+        self.control_read, self.control_write = os.pipe()
+        os.set_blocking(self.control_read, False)
+        self.children = {}
+        self.retiring = set()
+        self.started_at = {}
+        self.stopping = False
+        self.reload_requested = None
+
+    def spawn(self, index):
+        """
+        Returns:
+        int: Descripteur qui devient lisible quand le processus accepte des connexions.
+        """
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            try:
+                self.run_worker(index, ready_write)
+            except BaseException as e:
+                logger.error(f"Worker {index} failed: {e}")
+            finally:
+                os._exit(1)
+        os.close(ready_write)
+        self.children[pid] = index
+        self.started_at[index] = time.monotonic()
+        logger.info(f"Started worker {index} (pid {pid}, model {self.app_module.manager.current.name})")
+        return ready_read
+
+    def spawn_generation(self):
+        """
+        Créer tous les processus puis attendre qu'ils acceptent des connexions.
+        """
+        pending = {self.spawn(index) for index in range(self.workers)}
+        deadline = time.monotonic() + self.app_module.READY_TIMEOUT
+        while pending and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(pending), [], [], max(0.0, deadline - time.monotonic()))
+            for fd in readable:
+                pending.discard(fd)
+                os.close(fd)
+        for fd in pending:
+            os.close(fd)
+        if pending:
+            logger.warning(f"{len(pending)} of {self.workers} workers not ready after {self.app_module.READY_TIMEOUT:.0f}s")
+
+    def run_worker(self, index, ready_write):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        # Ctrl-C est traité par le maître, qui arrête les processus avec SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        os.close(self.control_read)
+        control_write = self.control_write
+        self.app_module.reload_handler = lambda version: os.write(control_write, f"{version or ''}\n".encode('utf-8'))
+        self.app_module.manager.current.backend.set_threads(self.threads_per_worker)
+        self.app_module.warm_up()
+        if self.reuse_port:
+            self.socket.close()
+            sock = open_socket(self.host, self.port, reuse_port=True)
+        else:
+            sock = self.socket
+        sockets = [sock]
+        if METRICS_PORT_BASE:
+            # SO_REUSEPORT: le processus qui remplace celui-ci peut ouvrir le port avant qu'il ne le libère
+            sockets.append(open_socket(self.host, METRICS_PORT_BASE + index, self.reuse_port))
+        from waitress.channel import HTTPChannel
+        from waitress.server import BaseWSGIServer, create_server
+        channels = {}
+        server = create_server(self.app_module.app, map=channels, sockets=sockets, threads=self.request_threads,
+                               ident=f'api-worker-{index}')
+        listeners = [channel for channel in channels.values() if isinstance(channel, BaseWSGIServer)]
+
+        def close_listeners():
+            for listener in listeners:
+                listener.del_channel()
+                listener.socket.close()
+
+        def finish():
+            # Les sockets sont fermés par la boucle de waitress elle-même, entre deux attentes,
+            # puis le processus quitte dès qu'il ne reste plus de connexion ouverte
+            listeners[0].trigger.pull_trigger(close_listeners)
+            deadline = time.monotonic() + WORKER_GRACE_SECONDS
+            while time.monotonic() < deadline and any(isinstance(channel, HTTPChannel) for channel in list(channels.values())):
+                time.sleep(0.1)
+            os._exit(0)
+
+        def drain(signum, frame):
+            # Ne plus accepter de connexions; les requêtes en cours ont WORKER_GRACE_SECONDS pour se terminer
+            threading.Thread(target=finish, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, drain)
+        try:
+            os.write(ready_write, b'1')
+            os.close(ready_write)
+        except OSError:
+            pass
+        server.run()
+
+    def terminate(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        self.terminate(list(self.children) + list(self.retiring))
+
+    def request_reload(self, signum=None, frame=None):
+        if self.reload_requested is None:
+            self.reload_requested = ''
+
+    def read_control(self):
+        try:
+            data = os.read(self.control_read, 4096).decode('utf-8')
+        except BlockingIOError:
+            return
+        for line in data.splitlines():
+            # Une version nommée l'emporte sur une demande de la plus récente
+            self.reload_requested = line or self.reload_requested or ''
+
+    def reload(self, version=None, pin=True):
+        """
+        Charger une version dans le maître puis remplacer les processus par une nouvelle génération.
+
+        Args:
+        version (str): Version à charger (vide: la plus récente).
+        pin (bool): Demande explicite (voir ModelManager.load), False pour la surveillance du répertoire.
+        """
+        manager = self.app_module.manager
+        previous = manager.current
+        try:
+            model = manager.load(version or None, warm=False, pin=pin)
+        except Exception as e:
+            logger.error(f"Model reload failed: {e}")
+            return
+        if model is previous:
+            logger.info(f"Model version {model.name} already in service")
+            return
+        old_generation = list(self.children)
+        self.retiring.update(old_generation)
+        self.children.clear()
+        gc.freeze()
+        self.spawn_generation()
+        self.terminate(old_generation)
+        logger.info(f"Workers replaced, model version {model.name} in service")
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            index = self.children.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            time.sleep(max(0.0, self.started_at[index] + RESPAWN_DELAY - time.monotonic()))
+            if not self.stopping:
+                os.close(self.spawn(index))
+
+    def run(self, watch_interval=0):
+        """
+        Args:
+        watch_interval (float): Intervalle de recherche d'une nouvelle version du modèle (s, 0: désactivée).
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.request_reload)
+        # Les objets du modèle ne sont plus parcourus par le ramasse-miettes, qui
+        # sinon écrirait dans leurs pages et casserait le partage après le fork
+        gc.freeze()
+        self.spawn_generation()
+        logger.info(f"Serving on {self.host}:{self.port} with {self.workers} workers, "
+                    f"{self.threads_per_worker} intra-op threads each "
+                    f"({'SO_REUSEPORT' if self.reuse_port else 'shared socket'})")
+        next_check = time.monotonic() + watch_interval
+        while self.children or self.retiring or not self.stopping:
+            time.sleep(POLL_INTERVAL)
+            self.reap()
+            if self.stopping:
+                continue
+            self.read_control()
+            if watch_interval and time.monotonic() >= next_check:
+                next_check = time.monotonic() + watch_interval
+                try:
+                    if self.app_module.manager.update_available():
+                        self.reload(pin=False)
+                except OSError as e:
+                    logger.error(f"Model directory check failed: {e}")
+            if self.reload_requested is not None:
+                version, self.reload_requested = self.reload_requested, None
+                self.reload(version)
+        self.socket.close()
+        logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servir l'API par plusieurs processus partageant le modèle")
+    parser.add_argument('--host', default='0.0.0.0', help="Adresse d'écoute")
+    parser.add_argument('--port', type=int, default=55555, help="Port d'écoute")
+    parser.add_argument('--workers', type=int, default=API_WORKERS, help="Nombre de processus")
+    parser.add_argument('--threads-per-worker', type=int, default=0,
+                        help="Threads intra-opération par processus (0: cœurs disponibles / processus)")
+    parser.add_argument('--request-threads', type=int, default=8, help="Threads waitress par processus")
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        raise SystemExit("Multi-process serving requires os.fork, use waitress-serve on this platform")
+    threads_per_worker = args.threads_per_worker or max(1, usable_cores() // args.workers)
+    # Le maître ne sert pas: ses threads intra-opération sont limités pendant le chargement
+    os.environ.setdefault('INFERENCE_THREADS', str(threads_per_worker))
+    os.environ['API_LOAD_IN_BACKGROUND'] = '0'
+
+    import app as app_module
+    app_module.load_model()
+    app_module.clear_cache()
+    PreforkServer(app_module, args.host, args.port, args.workers, threads_per_worker,
+                  args.request_threads).run(app_module.MODEL_WATCH_INTERVAL)
@@ -0,0 +1,81 @@
+"""
+Suivi du démarrage de l'API: étapes chronométrées et état de préparation.
+
+/health indique seulement que le processus répond; /ready n'indique prêt qu'une
+fois le modèle chargé et préchauffé, ce que les renifleurs attendent avant
+d'envoyer leurs lots.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+STARTING, LOADING, WARMING_UP, READY, FAILED = 'starting', 'loading', 'warming_up', 'ready', 'failed'
+
+
+class StartupState:
+    def __init__(self):
+        self.status = STARTING
+        self.error = None
+        self.phases = {}
+        self.started_at = time.perf_counter()
+        self.ready_after = None
+        self.ready = threading.Event()
+        # Démarrage terminé, avec succès ou en échec: réveille les attentes de wait_ready
+        self.settled = threading.Event()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Chronométrer une étape du démarrage.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started_at)
+
+    def record(self, name, duration):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def set_status(self, status):
+        with self.lock:
+            self.status = status
+
+    def mark_ready(self):
+        with self.lock:
+            self.status = READY
+            self.ready_after = time.perf_counter() - self.started_at
+        self.ready.set()
+        self.settled.set()
+
+    def fail(self, error):
+        with self.lock:
+            self.status = FAILED
+            self.error = str(error)
+        self.settled.set()
+
+    def wait_ready(self, timeout):
+        """
+        Returns:
+        bool: True si le modèle est prêt, au plus tard après timeout secondes; False dès
+        l'échec du chargement.
+        """
+        self.settled.wait(timeout)
+        return self.ready.is_set() and self.status != FAILED
+
+    def summary(self):
+        with self.lock:
+            phases = ', '.join(f"{name} {duration:.2f}s" for name, duration in self.phases.items())
+            total = self.ready_after if self.ready_after is not None else time.perf_counter() - self.started_at
+        return f"{phases}, ready after {total:.2f}s"
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'status': self.status,
+                'error': self.error,
+                'phases_s': dict(self.phases),
+                'ready_after_s': self.ready_after,
+            }
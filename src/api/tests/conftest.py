@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Les modules de l'API s'importent par leur nom, comme depuis src/api
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+transformers = pytest.importorskip('transformers')
+safetensors_torch = pytest.importorskip('safetensors.torch')
+
+from backends import SAFETENSORS_FILE, PyTorchBackend
+
+
+def mapped_backend(model_path):
+    # Seul load_mapped_model est éprouvé: ni tokenizer ni passes du modèle
+    backend = PyTorchBackend.__new__(PyTorchBackend)
+    backend.model_path = str(model_path)
+    return backend
+
+
+@pytest.fixture
+def tiny_model():
+    config = transformers.BertConfig(vocab_size=32, hidden_size=8, num_hidden_layers=1, num_attention_heads=2,
+                                     intermediate_size=16, num_labels=2)
+    return transformers.BertForSequenceClassification(config).eval()
+
+
+def test_mapped_weights_match_the_checkpoint(tmp_path, tiny_model):
+    tiny_model.save_pretrained(tmp_path)
+    model = mapped_backend(tmp_path).load_mapped_model(str(tmp_path / SAFETENSORS_FILE))
+    assert torch.equal(model.classifier.weight, tiny_model.classifier.weight)
+
+
+def test_renamed_checkpoint_keys_are_refused(tmp_path, tiny_model):
+    tiny_model.save_pretrained(tmp_path)
+    state_dict = {name.replace('classifier.', 'legacy_classifier.'): tensor.contiguous()
+                  for name, tensor in tiny_model.state_dict().items()}
+    safetensors_torch.save_file(state_dict, str(tmp_path / SAFETENSORS_FILE), metadata={'format': 'pt'})
+    with pytest.raises(ValueError, match=r'missing: classifier\..*unexpected: legacy_classifier\.'):
+        mapped_backend(tmp_path).load_mapped_model(str(tmp_path / SAFETENSORS_FILE))
@@ -0,0 +1,48 @@
+from metrics import MetricsRegistry
+
+
+def test_histogram_buckets_are_cumulative_per_label_values():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('api_request_duration_seconds', "Durée des requêtes", buckets=(0.01, 0.1),
+                                   labels=('route', 'status'))
+    histogram.observe(0.005, '/predict', 200)
+    histogram.observe(0.05, '/predict', 200)
+    histogram.observe(0.5, '/ready', 503)
+    assert registry.render().splitlines() == [
+        '# HELP api_request_duration_seconds Durée des requêtes',
+        '# TYPE api_request_duration_seconds histogram',
+        'api_request_duration_seconds_bucket{route="/predict",status="200",le="0.01"} 1',
+        'api_request_duration_seconds_bucket{route="/predict",status="200",le="0.1"} 2',
+        'api_request_duration_seconds_bucket{route="/predict",status="200",le="+Inf"} 2',
+        'api_request_duration_seconds_sum{route="/predict",status="200"} 0.055',
+        'api_request_duration_seconds_count{route="/predict",status="200"} 2',
+        'api_request_duration_seconds_bucket{route="/ready",status="503",le="0.01"} 0',
+        'api_request_duration_seconds_bucket{route="/ready",status="503",le="0.1"} 0',
+        'api_request_duration_seconds_bucket{route="/ready",status="503",le="+Inf"} 1',
+        'api_request_duration_seconds_sum{route="/ready",status="503"} 0.5',
+        'api_request_duration_seconds_count{route="/ready",status="503"} 1',
+    ]
+
+
+def test_gauges_and_counters_are_rendered():
+    registry = MetricsRegistry()
+    in_flight = registry.gauge('api_in_flight_requests', "Requêtes en cours")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    hits = [0]
+    registry.counter('api_prediction_cache_hits_total', "Textes trouvés dans le cache", lambda: hits[0])
+    registry.gauge('api_prediction_cache_hit_ratio', "Part des textes trouvés", lambda: 0.25)
+    hits[0] = 7
+    lines = registry.render().splitlines()
+    assert lines[:3] == ['# HELP api_in_flight_requests Requêtes en cours', '# TYPE api_in_flight_requests gauge',
+                         'api_in_flight_requests 1']
+    assert '# TYPE api_prediction_cache_hits_total counter' in lines
+    assert 'api_prediction_cache_hits_total 7' in lines
+    assert 'api_prediction_cache_hit_ratio 0.25' in lines
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.histogram('api_request_decode_seconds', "Décodage", buckets=(), labels=('format',)).observe(0.1, 'a"b\\c\n')
+    assert 'api_request_decode_seconds_count{format="a\\"b\\\\c\\n"} 1' in registry.render().splitlines()
@@ -0,0 +1,95 @@
+import os
+import time
+
+import pytest
+
+from models import ModelManager
+
+
+def write_version(directory, name, age=60.0):
+    path = directory / name
+    path.mkdir()
+    for file_name in ('config.json', 'model.safetensors'):
+        (path / file_name).write_text(name)
+        # Ancienneté des fichiers, comparée à settle_seconds
+        modified_at = time.time() - age
+        os.utime(path / file_name, (modified_at, modified_at))
+    return path
+
+
+class RecordingLoader:
+    def __init__(self, failing=()):
+        self.loaded = []
+        self.failing = failing
+
+    def __call__(self, path, warm):
+        name = os.path.basename(path)
+        if name in self.failing:
+            raise RuntimeError(f"cannot load {name}")
+        self.loaded.append(name)
+        return name
+
+
+def test_latest_complete_version_is_picked(tmp_path):
+    write_version(tmp_path, 'v2_9')
+    write_version(tmp_path, 'v2_10')
+    (tmp_path / 'v2_11').mkdir()
+    manager = ModelManager(str(tmp_path), RecordingLoader())
+    assert manager.available_versions() == ['v2_9', 'v2_10']
+    assert manager.load().name == 'v2_10'
+
+
+def test_pinned_version_is_picked_over_the_latest(tmp_path):
+    write_version(tmp_path, 'v1')
+    write_version(tmp_path, 'v2')
+    manager = ModelManager(str(tmp_path), RecordingLoader(), pinned_version='v1')
+    assert manager.load().name == 'v1'
+    assert not manager.update_available()
+
+
+def test_initial_load_does_not_wait_for_settled_files(tmp_path):
+    write_version(tmp_path, 'v1', age=0.0)
+    manager = ModelManager(str(tmp_path), RecordingLoader(), settle_seconds=10.0)
+    assert manager.load().name == 'v1'
+
+
+def test_newer_version_is_swapped_in_once_settled(tmp_path):
+    write_version(tmp_path, 'v1')
+    loader = RecordingLoader()
+    manager = ModelManager(str(tmp_path), loader, settle_seconds=10.0)
+    manager.load()
+    # Une version en cours d'écriture n'est pas encore candidate au remplacement
+    write_version(tmp_path, 'v2', age=0.0)
+    assert not manager.update_available()
+    for file_name in ('config.json', 'model.safetensors'):
+        os.utime(tmp_path / 'v2' / file_name, (time.time() - 60, time.time() - 60))
+    assert manager.update_available()
+    manager.reload_quietly()
+    assert manager.current.name == 'v2'
+    assert manager.swaps == 1
+    assert loader.loaded == ['v1', 'v2']
+
+
+def test_failed_load_keeps_the_version_in_service(tmp_path):
+    write_version(tmp_path, 'v1')
+    manager = ModelManager(str(tmp_path), RecordingLoader(failing=('v2',)))
+    manager.load()
+    write_version(tmp_path, 'v2')
+    with pytest.raises(RuntimeError):
+        manager.load()
+    assert manager.current.name == 'v1'
+    assert manager.last_error == 'v2: cannot load v2'
+
+
+def test_rollback_pins_an_older_version(tmp_path):
+    write_version(tmp_path, 'v1')
+    write_version(tmp_path, 'v2')
+    manager = ModelManager(str(tmp_path), RecordingLoader())
+    manager.load()
+    assert manager.load('v1', pin=True).name == 'v1'
+    assert manager.pinned_version == 'v1'
+    # La surveillance du répertoire ne remplace plus la version imposée
+    assert not manager.update_available()
+    with pytest.raises(LookupError):
+        manager.load('v3', pin=True)
+    assert manager.current.name == 'v1'
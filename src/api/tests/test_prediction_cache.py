@@ -0,0 +1,48 @@
+import pytest
+
+import prediction_cache
+from prediction_cache import PredictionCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(prediction_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_lookup_groups_duplicates_and_reports_missing_positions():
+    cache = PredictionCache(memory_budget_mb=1)
+    cache.store(['a'], [('allow', 0.9)], 'v1')
+    predictions, missing = cache.lookup(['a', 'b', 'b'], 'v1')
+    assert predictions == [('allow', 0.9), None, None]
+    assert missing == {'b': [1, 2]}
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['deduplicated']) == (1, 1, 1)
+
+
+def test_entries_are_scoped_by_model_version():
+    cache = PredictionCache(memory_budget_mb=1)
+    cache.store(['a'], [('deny', 0.8)], 'v1')
+    assert cache.lookup(['a'], 'v2')[0] == [None]
+    assert cache.lookup(['a'], 'v1')[0] == [('deny', 0.8)]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(memory_budget_mb=1)
+    cache.max_entries = 2
+    cache.store(['a', 'b'], [('allow', 0.9), ('deny', 0.8)], 'v1')
+    cache.lookup(['a'], 'v1')
+    cache.store(['c'], [('deny', 0.7)], 'v1')
+    assert cache.lookup(['a', 'b', 'c'], 'v1')[0] == [('allow', 0.9), None, ('deny', 0.7)]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PredictionCache(memory_budget_mb=1, ttl=5)
+    cache.store(['a'], [('allow', 0.9)], 'v1')
+    clock[0] += 4.9
+    assert cache.lookup(['a'], 'v1')[0] == [('allow', 0.9)]
+    clock[0] += 0.1
+    assert cache.lookup(['a'], 'v1')[0] == [None]
+    assert cache.stats()['expirations'] == 1
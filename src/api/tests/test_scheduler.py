@@ -0,0 +1,68 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scheduler import MicroBatchScheduler
+
+
+class RecordingModel:
+    def __init__(self, release=None):
+        self.calls = []
+        self.release = release
+        self.entered = threading.Event()
+
+    def __call__(self, texts):
+        self.entered.set()
+        if self.release is not None:
+            self.release.wait(5)
+        self.calls.append(list(texts))
+        return [text.upper() for text in texts]
+
+
+def test_predictions_follow_request_order():
+    scheduler = MicroBatchScheduler(RecordingModel(), max_batch_size=8, max_wait=0.001)
+    assert scheduler.submit(['b', 'a', 'b']) == ['B', 'A', 'B']
+
+
+def test_queued_requests_share_a_pass_and_duplicates_are_merged():
+    release = threading.Event()
+    model = RecordingModel(release)
+    scheduler = MicroBatchScheduler(model, max_batch_size=64, max_wait=0.001)
+    with ThreadPoolExecutor(5) as executor:
+        # La première passe occupe le modèle pendant que les requêtes suivantes s'accumulent
+        first = executor.submit(scheduler.submit, ['x'])
+        assert model.entered.wait(5)
+        futures = []
+        for texts in (['a', 'b'], ['b', 'c'], ['a'], ['d']):
+            futures.append(executor.submit(scheduler.submit, texts))
+            deadline = time.monotonic() + 5
+            while scheduler.pending() < len(futures) and time.monotonic() < deadline:
+                time.sleep(0.001)
+        release.set()
+        results = [future.result(5) for future in futures]
+    assert first.result() == ['X']
+    assert results == [['A', 'B'], ['B', 'C'], ['A'], ['D']]
+    assert model.calls == [['x'], ['a', 'b', 'c', 'd']]
+    assert scheduler.stats()['merged_duplicates'] == 2
+
+
+def test_large_request_is_split_into_max_batch_size_passes():
+    model = RecordingModel()
+    scheduler = MicroBatchScheduler(model, max_batch_size=3, max_wait=0.001)
+    texts = [str(number) for number in range(7)]
+    assert scheduler.submit(texts) == texts
+    assert [len(call) for call in model.calls] == [3, 3, 1]
+
+
+def test_model_errors_reach_every_request_of_the_pass():
+    def failing(texts):
+        raise RuntimeError('boom')
+
+    scheduler = MicroBatchScheduler(failing, max_batch_size=8, max_wait=0.001)
+    with pytest.raises(RuntimeError, match='boom'):
+        scheduler.submit(['a'])
+    # Le thread des passes continue après l'échec
+    scheduler.predict_fn = RecordingModel()
+    assert scheduler.submit(['a']) == ['A']
@@ -0,0 +1,163 @@
+"""
+Tokenisation des chaînes de flux adaptée à leur longueur.
+
+Les chaînes de flux sont courtes mais de longueurs très variables (adresses IPv6,
+noms DNS longs): avec padding=True, un seul texte long fait compléter tout le lot à
+sa longueur. FlowTokenizer:
+
+- borne la longueur des séquences à max_length (512 par défaut, la troncature
+  d'origine; une valeur plus basse ne se choisit qu'après avoir vérifié avec
+  compare_backends.py --token-lengths qu'aucun flux réel ne la dépasse);
+- trie les textes par nombre de jetons et les répartit en sous-lots dont le volume
+  complété (textes x longueur) reste sous max_batch_tokens, puis rend les résultats
+  dans l'ordre d'origine;
+- met en cache la tokenisation de chaque champ (domaine, adresse, port...), ces
+  champs se répétant d'un flux à l'autre.
+
+La tokenisation champ par champ n'est utilisée que si elle donne exactement les
+mêmes jetons que celle de la chaîne complète (tokenizers qui découpent d'abord sur
+les espaces, comme celui de BERT).
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+SAMPLE_FLOWS = (
+    "example.com 10.0.0.1 53 10.0.0.2 53 UDP DNS",
+    "none fe80::1c2b:3aff:fe4d:5e6f 5353 ff02::fb 5353 UDP mDNS",
+    "login.microsoftonline.com 192.168.1.20 50432 20.190.160.1 443 TCP HTTPS",
+    "none 172.16.0.4 none 172.16.0.9 none none unknown",
+)
+
+
+class FlowTokenizer:
+    """
+    Args:
+    tokenizer: Tokenizer Hugging Face du modèle.
+    max_length (int): Nombre maximal de jetons par séquence, jetons spéciaux compris.
+    max_batch_tokens (int): Volume maximal (textes x longueur complétée) d'un sous-lot.
+    cache_size (int): Nombre maximal de champs dont la tokenisation est conservée.
+    """
+    def __init__(self, tokenizer, max_length=512, max_batch_tokens=8192, cache_size=100000):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+        self.cache_size = cache_size
+        self.input_names = list(tokenizer.model_input_names)
+        self.special_tokens = tokenizer.num_special_tokens_to_add(pair=False)
+        self.pad_id = tokenizer.pad_token_id or 0
+        self.field_cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.texts = 0
+        self.truncated = 0
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.sub_batches = 0
+        self.split_fields = all(self.text_ids(flow, split_fields=True) == self.text_ids(flow, split_fields=False)
+                                for flow in SAMPLE_FLOWS)
+
+    def field_ids(self, field):
+        with self.lock:
+            ids = self.field_cache.get(field)
+            if ids is not None:
+                self.field_cache.move_to_end(field)
+                self.cache_hits += 1
+                return ids
+            self.cache_misses += 1
+        ids = self.tokenizer(field, add_special_tokens=False)['input_ids']
+        with self.lock:
+            self.field_cache[field] = ids
+            if len(self.field_cache) > self.cache_size:
+                self.field_cache.popitem(last=False)
+        return ids
+
+    def text_ids(self, text, split_fields=None):
+        """
+        Returns:
+        list: Jetons du texte, sans jetons spéciaux ni troncature.
+        """
+        if split_fields is None:
+            split_fields = self.split_fields
+        if not split_fields:
+            return self.tokenizer(text, add_special_tokens=False)['input_ids']
+        ids = []
+        for field in text.split():
+            ids.extend(self.field_ids(field))
+        return ids
+
+    def sequence(self, text):
+        ids = self.text_ids(text)
+        limit = self.max_length - self.special_tokens
+        if len(ids) > limit:
+            ids = ids[:limit]
+            with self.lock:
+                self.truncated += 1
+        return self.tokenizer.build_inputs_with_special_tokens(ids)
+
+    def sub_batches_for(self, texts):
+        """
+        Découper des textes en sous-lots de longueurs voisines.
+
+        Returns:
+        list: Couples (positions des textes dans la liste d'origine, entrées du modèle
+        sous forme de tableaux NumPy int64).
+        """
+        sequences = [self.sequence(text) for text in texts]
+        order = sorted(range(len(texts)), key=lambda index: len(sequences[index]))
+        sub_batches = []
+        current = []
+        for index in order:
+            # Les longueurs étant croissantes, le texte courant fixe la longueur complétée
+            if current and (len(current) + 1) * len(sequences[index]) > self.max_batch_tokens:
+                sub_batches.append(self.pad(current, sequences))
+                current = []
+            current.append(index)
+        if current:
+            sub_batches.append(self.pad(current, sequences))
+        return sub_batches
+
+    def pad(self, indices, sequences):
+        length = max(len(sequences[index]) for index in indices)
+        input_ids = np.full((len(indices), length), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(indices), length), dtype=np.int64)
+        real_tokens = 0
+        for row, index in enumerate(indices):
+            sequence = sequences[index]
+            input_ids[row, :len(sequence)] = sequence
+            attention_mask[row, :len(sequence)] = 1
+            real_tokens += len(sequence)
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            inputs['token_type_ids'] = np.zeros_like(input_ids)
+        with self.lock:
+            self.texts += len(indices)
+            self.real_tokens += real_tokens
+            self.padded_tokens += input_ids.size
+            self.sub_batches += 1
+        return indices, inputs
+
+    def length_distribution(self, texts, points=(50, 90, 99, 99.9, 100)):
+        """
+        Returns:
+        dict: Percentiles du nombre de jetons (jetons spéciaux compris) des textes.
+        """
+        lengths = sorted(len(self.text_ids(text)) + self.special_tokens for text in texts)
+        return {f'p{point:g}': lengths[min(len(lengths) - 1, int(len(lengths) * point / 100))] for point in points}
+
+    def stats(self):
+        with self.lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                'max_length': self.max_length,
+                'max_batch_tokens': self.max_batch_tokens,
+                'split_fields': self.split_fields,
+                'texts': self.texts,
+                'sub_batches': self.sub_batches,
+                'truncated': self.truncated,
+                'padding_efficiency': self.real_tokens / self.padded_tokens if self.padded_tokens else 1.0,
+                'field_cache_entries': len(self.field_cache),
+                'field_cache_hit_ratio': self.cache_hits / lookups if lookups else 0.0,
+            }
@@ -17,7 +17,13 @@ CREATE TABLE IF NOT EXISTS new_data (
     destination_port VARCHAR(50),
     protocol VARCHAR(10),
     application_layer_protocol VARCHAR(50),
-    prediction VARCHAR(50)
+    prediction VARCHAR(50),
+    model_version VARCHAR(64),
+    decision_source VARCHAR(16),
+    packets INT UNSIGNED,
+    bytes BIGINT UNSIGNED,
+    first_seen DOUBLE,
+    last_seen DOUBLE
 );
 
 CREATE TABLE IF NOT EXISTS blocked_frames (
@@ -29,7 +35,13 @@ CREATE TABLE IF NOT EXISTS blocked_frames (
     destination_port VARCHAR(50),
     protocol VARCHAR(10),
     application_layer_protocol VARCHAR(50),
-    prediction VARCHAR(50)
+    prediction VARCHAR(50),
+    model_version VARCHAR(64),
+    decision_source VARCHAR(16),
+    packets INT UNSIGNED,
+    bytes BIGINT UNSIGNED,
+    first_seen DOUBLE,
+    last_seen DOUBLE
 );
 
 CREATE TABLE IF NOT EXISTS passed_frames (
@@ -41,7 +53,13 @@ CREATE TABLE IF NOT EXISTS passed_frames (
     destination_port VARCHAR(50),
     protocol VARCHAR(10),
     application_layer_protocol VARCHAR(50),
-    prediction VARCHAR(50)
+    prediction VARCHAR(50),
+    model_version VARCHAR(64),
+    decision_source VARCHAR(16),
+    packets INT UNSIGNED,
+    bytes BIGINT UNSIGNED,
+    first_seen DOUBLE,
+    last_seen DOUBLE
 );
 
 CREATE TABLE IF NOT EXISTS false_positive_frames (
@@ -53,5 +71,11 @@ CREATE TABLE IF NOT EXISTS false_positive_frames (
     destination_port VARCHAR(50),
     protocol VARCHAR(10),
     application_layer_protocol VARCHAR(50),
-    prediction VARCHAR(50)
+    prediction VARCHAR(50),
+    model_version VARCHAR(64),
+    decision_source VARCHAR(16),
+    packets INT UNSIGNED,
+    bytes BIGINT UNSIGNED,
+    first_seen DOUBLE,
+    last_seen DOUBLE
 );
@@ -0,0 +1,111 @@
+"""
+Constitution adaptative des lots envoyés à l'API.
+
+Un lot part dès qu'il atteint la taille cible ou que son plus ancien élément a
+attendu plus de max_linger secondes. La taille cible suit le nombre d'éléments
+qui arrivent pendant un aller-retour API (débit d'arrivée x latence observée),
+multiplié par une marge, réparti entre les requêtes simultanées et borné entre
+min_size et max_size: petits lots sur un lien calme, lots plus gros en pointe
+pour amortir le coût HTTP et modèle.
+
+La marge est nécessaire car, quand l'envoi est saturé, le débit d'arrivée mesuré
+est lui-même limité par la taille des lots; sans elle la taille cible resterait
+bloquée à sa valeur courante.
+"""
+import math
+
+
+class AdaptiveBatcher:
+    """
+    Args:
+    min_size (int): Taille cible minimale (et initiale) d'un lot.
+    max_size (int): Taille maximale d'un lot.
+    max_linger (float): Attente maximale (s) d'un élément avant l'envoi de son lot.
+    rate_window (float): Fenêtre (s) de mesure du débit d'arrivée.
+    smoothing (float): Coefficient des moyennes mobiles exponentielles (débit et latence).
+    headroom (float): Marge appliquée au nombre d'éléments attendus pendant un appel.
+    concurrency (int): Nombre de requêtes API simultanées qui se partagent les éléments.
+    """
+    def __init__(self, min_size, max_size, max_linger, rate_window=1.0, smoothing=0.3, headroom=2.0, concurrency=1):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.max_linger = max_linger
+        self.rate_window = rate_window
+        self.smoothing = smoothing
+        self.headroom = headroom
+        self.concurrency = max(1, concurrency)
+        self.items = []
+        self.opened_at = None
+        self.target_size = min_size
+        self.arrival_rate = 0.0
+        self.api_latency = None
+        self.window_started_at = None
+        self.window_count = 0
+
+    def add(self, item, now):
+        """
+        Ajouter un élément au lot courant.
+
+        Returns:
+        list: Le lot complet s'il a atteint la taille cible, sinon None.
+        """
+        self._count_arrival(now)
+        if not self.items:
+            self.opened_at = now
+        self.items.append(item)
+        if len(self.items) >= self.target_size:
+            return self.take()
+        return None
+
+    def poll(self, now):
+        """
+        Returns:
+        list: Le lot courant si son plus ancien élément a dépassé max_linger, sinon None.
+        """
+        if self.items and now - self.opened_at >= self.max_linger:
+            return self.take()
+        return None
+
+    def take(self):
+        batch = self.items
+        self.items = []
+        self.opened_at = None
+        return batch
+
+    def observe_latency(self, seconds):
+        """
+        Prendre en compte la durée d'un appel à l'API pour ajuster la taille cible.
+        """
+        self.api_latency = self._smooth(self.api_latency, seconds)
+        self._resize()
+
+    def _smooth(self, average, seconds):
+        if average is None:
+            return seconds
+        return average + self.smoothing * (seconds - average)
+
+    def _count_arrival(self, now):
+        if self.window_started_at is None:
+            self.window_started_at = now
+        self.window_count += 1
+        elapsed = now - self.window_started_at
+        if elapsed >= self.rate_window:
+            rate = self.window_count / elapsed
+            self.arrival_rate += self.smoothing * (rate - self.arrival_rate)
+            self.window_started_at = now
+            self.window_count = 0
+            self._resize()
+
+    def _resize(self):
+        if self.api_latency is None:
+            return
+        wanted = math.ceil(self.arrival_rate * self.api_latency * self.headroom / self.concurrency)
+        self.target_size = min(self.max_size, max(self.min_size, wanted))
+
+    def stats(self):
+        return {
+            'target_size': self.target_size,
+            'pending': len(self.items),
+            'arrival_rate': self.arrival_rate,
+            'api_latency': self.api_latency,
+        }
@@ -0,0 +1,764 @@
+"""
+Banc d'essai de débit du pipeline capture -> dédoublonnage -> lot -> API -> base de données.
+
+Une capture pcap/pcapng est rejouée dans PacketProcessor. L'API /predict et MySQL
+peuvent être remplacés par des substituts locaux pour tourner sur une machine Linux
+quelconque.
+
+Usage (depuis la racine du dépôt):
+    python src/sniffing/benchmark.py capture.pcap
+    python src/sniffing/benchmark.py capture.pcap --flow-aggregation
+    python src/sniffing/benchmark.py capture.pcap --realtime --api-latency-ms 20 --db-latency-ms 5
+    python src/sniffing/benchmark.py capture.pcap --real-api --real-db
+    python src/sniffing/benchmark.py capture.pcap --compare-decoders
+    python src/sniffing/benchmark.py --compare-db --db-connect-latency-ms 3 --db-latency-ms 0.3 --db-commit-latency-ms 1
+    python src/sniffing/benchmark.py --compare-inference --api-format msgpack
+    python src/sniffing/benchmark.py capture.pcap --compare-shards 1 2 4 8
+    python src/sniffing/benchmark.py capture.pcap --distributed 3 --collector-delay 5
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import msgpack
+import mysql.connector
+from scapy.all import RawPcapReader, conf
+
+from distributed import CollectorServer
+from shedding import OVERLOAD_POLICIES
+from sniffing import ConfigLoader, DatabaseManager, KnownPortsLoader, MainApp, PacketProcessor, PipelineStats, Sniffer, PERSISTED_COLUMNS, \
+    API_FORMATS, INFERENCE_MODES
+
+
+class StubPredictionServer:
+    """
+    Substitut local de l'API: /predict (JSON) et /predict/flows (msgpack).
+
+    Les prédictions sont déterministes (dérivées d'un CRC32 du texte) et la latence
+    du modèle est simulée par une attente fixe par requête et par élément.
+    """
+    def __init__(self, latency_ms=0.0, per_item_latency_ms=0.0):
+        self.latency = latency_ms / 1000
+        self.per_item_latency = per_item_latency_ms / 1000
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/predict"
+        self.flows_url = f"{self.url}/flows"
+        self.thread = None
+
+    @staticmethod
+    def predict(text):
+        return 'deny' if zlib.crc32(text.encode('utf-8')) % 4 == 0 else 'allow'
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                compact = self.path.endswith('/flows')
+                if compact:
+                    texts = [' '.join('none' if value is None else str(value) for value in record)
+                             for record in msgpack.unpackb(body, raw=False)]
+                else:
+                    texts = json.loads(body or b'{}').get('input_text', [])
+                delay = stub.latency + stub.per_item_latency * len(texts)
+                if delay:
+                    time.sleep(delay)
+                predictions = [stub.predict(text) for text in texts]
+                if compact:
+                    payload = msgpack.packb({'labels': [int(prediction == 'allow') for prediction in predictions],
+                                             'confidences': [1.0] * len(predictions), 'model_version': 'stub'},
+                                            use_single_float=True)
+                else:
+                    payload = json.dumps({'predictions': predictions, 'model_version': 'stub'}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/msgpack' if compact else 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class InMemoryConnection:
+    """
+    Connexion MySQL simulée: les requêtes INSERT multi-lignes produites par
+    DatabaseManager sont décodées et leurs lignes conservées en mémoire à la
+    validation de la transaction.
+
+    Les coûts d'ouverture de connexion, d'aller-retour par requête et de validation
+    sont simulés par des attentes fixes.
+    """
+    INSERT_PATTERN = re.compile(r"INSERT INTO (\w+) \(([^)]*)\) VALUES")
+
+    def __init__(self, database, pooled):
+        self.database = database
+        self.pooled = pooled
+        self.pending = []
+        if database.connect_latency:
+            time.sleep(database.connect_latency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def cursor(self, dictionary=False):
+        return InMemoryCursor(self)
+
+    def commit(self):
+        if self.database.commit_latency:
+            time.sleep(self.database.commit_latency)
+        with self.database.lock:
+            for table, row in self.pending:
+                self.database.tables[table].append(row)
+            self.database.commits += 1
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        self.pending = []
+        if self.pooled:
+            with self.database.lock:
+                self.database.idle_connections.append(self)
+
+
+class InMemoryCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def execute(self, sql, values=()):
+        database = self.connection.database
+        if database.latency:
+            time.sleep(database.latency)
+        with database.lock:
+            database.statements += 1
+        match = InMemoryConnection.INSERT_PATTERN.match(sql)
+        if match is None:
+            return
+        columns = [column.strip() for column in match.group(2).split(',')]
+        values = list(values)
+        for start in range(0, len(values), len(columns)):
+            row = {column: 'none' if value is None else value for column, value in zip(columns, values[start:start + len(columns)])}
+            self.connection.pending.append((match.group(1), row))
+
+    def executemany(self, sql, rows):
+        for values in rows:
+            self.execute(sql, values)
+
+
+class InMemoryDatabaseManager(DatabaseManager):
+    """
+    Substitut de DatabaseManager qui conserve les lignes en mémoire.
+
+    Seules les connexions sont simulées (InMemoryConnection): la construction des
+    requêtes, les transactions et la réutilisation des connexions (db_pool_size)
+    passent par le code de DatabaseManager. Les ports connus sont lus depuis le
+    fichier JSON. Une indisponibilité de la base peut être simulée: outage=(début, durée)
+    en secondes après la création.
+    """
+    def __init__(self, config, latency_ms=0.0, connect_latency_ms=0.0, commit_latency_ms=0.0, outage=None):
+        super().__init__(config)
+        self.outage = outage
+        self.created_at = time.monotonic()
+        self.latency = latency_ms / 1000
+        self.connect_latency = connect_latency_ms / 1000
+        self.commit_latency = commit_latency_ms / 1000
+        self.known_ports = KnownPortsLoader(config).load_known_ports() or {}
+        self.tables = defaultdict(list)
+        self.idle_connections = []
+        self.connections_opened = 0
+        self.statements = 0
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    def check_available(self):
+        if self.outage is None:
+            return
+        elapsed = time.monotonic() - self.created_at
+        if self.outage[0] <= elapsed < self.outage[0] + self.outage[1]:
+            raise mysql.connector.errors.InterfaceError("Base de données indisponible (simulation)")
+
+    def open_connection(self, **overrides):
+        self.check_available()
+        with self.lock:
+            self.connections_opened += 1
+        return InMemoryConnection(self, pooled=False)
+
+    def connect(self):
+        self.check_available()
+        if not self.pool_size:
+            return self.open_connection()
+        with self.lock:
+            if self.idle_connections:
+                return self.idle_connections.pop()
+            self.connections_opened += 1
+        return InMemoryConnection(self, pooled=True)
+
+    def load_known_ports(self):
+        return dict(self.known_ports)
+
+
+def run_benchmark(config, pcap_path, realtime=False, api_latency_ms=0.0, api_per_item_latency_ms=0.0,
+                  db_latency_ms=0.0, real_api=False, real_db=False, db_connect_latency_ms=0.0, db_commit_latency_ms=0.0,
+                  db_outage=None):
+    """
+    Rejouer une capture dans le pipeline complet et mesurer chaque étape.
+
+    Returns:
+    dict: Résumé PipelineStats complété du nombre de trames rejouées.
+    """
+    stub_server = None
+    if not real_api:
+        stub_server = StubPredictionServer(api_latency_ms, api_per_item_latency_ms)
+        stub_server.start()
+        config['api_url'] = stub_server.url
+        config['api_flows_url'] = stub_server.flows_url
+
+    if real_db:
+        db_manager = DatabaseManager(config)
+    else:
+        db_manager = InMemoryDatabaseManager(config, db_latency_ms, db_connect_latency_ms, db_commit_latency_ms, db_outage)
+        # Journal de débordement propre à la mesure, hors du répertoire de production
+        config['spill_journal_dir'] = tempfile.mkdtemp(prefix='spill_journal_')
+        config.setdefault('spill_retry_interval', 1)
+        # La base substitut ne conserve pas false_positive_frames: seules les règles des fichiers s'appliquent
+        config['rules_use_false_positives'] = False
+    processor = PacketProcessor(db_manager, config)
+    if processor.rule_index is not None:
+        processor.rule_index.refresh()
+    stats = PipelineStats()
+    processor.register_metrics(stats)
+    db_manager.register_metrics(stats)
+    sniffer = Sniffer(processor, config)
+    sniffer.start_workers()
+
+    sender = threading.Thread(target=processor.send_packet_batches)
+    sender.start()
+    writer = threading.Thread(target=processor.write_results)
+    writer.start()
+    persister = threading.Thread(target=processor.persist_writes)
+    persister.start()
+    maintenance = threading.Thread(target=processor.run_maintenance)
+    maintenance.start()
+    try:
+        frames = sniffer.replay(pcap_path, realtime)
+    finally:
+        processor.stop()
+        sender.join()
+        writer.join()
+        persister.join()
+        maintenance.join()
+        if stub_server is not None:
+            stub_server.stop()
+
+    summary = processor.stats.summary()
+    summary['frames'] = frames
+    summary['caches'] = processor.cache_stats()
+    summary['batcher'] = processor.batcher.stats()
+    summary['overload'] = processor.overload_stats()
+    summary['write_behind'] = processor.write_behind.stats()
+    return summary
+
+
+def compare_sharding(config, pcap_path, worker_counts=(1, 2, 4)):
+    """
+    Mesurer le débit de l'étage de capture (décodage, flux, dédoublonnage, lots) selon
+    le nombre de processus de capture. Les lots sont consommés sans appel à l'API ni
+    écriture, pour que seul l'étage réparti soit mesuré; le rejeu est sans perte.
+
+    Returns:
+    list: Par nombre de processus, durée, débit, flux émis et accélération par rapport à un seul processus.
+    """
+    results = []
+    for workers in worker_counts:
+        run_config = dict(config, capture_workers=workers, fast_decoder=True, rules_enabled=False,
+                          first_stage_enabled=False, inference_mode='http')
+        processor = PacketProcessor(InMemoryDatabaseManager(run_config), run_config)
+        processor.register_metrics(PipelineStats())
+        sniffer = Sniffer(processor, run_config)
+        sniffer.start_workers()
+        emitted = []
+
+        def drain():
+            while True:
+                item = processor.packet_queue.get()
+                if item is None:
+                    break
+                emitted.append(len(item[1]))
+
+        drainer = threading.Thread(target=drain)
+        drainer.start()
+        started_at = time.perf_counter()
+        frames = sniffer.replay(pcap_path)
+        processor.stop()
+        drainer.join()
+        elapsed = time.perf_counter() - started_at
+        result = {'workers': workers, 'frames': frames, 'elapsed_s': elapsed, 'frames_per_s': frames / elapsed,
+                  'records': sum(emitted), 'batches': len(emitted)}
+        if sniffer.shards is not None:
+            result['dispatch_imbalance'] = sniffer.shards.stats()['dispatch_imbalance']
+        results.append(result)
+    for result in results:
+        result['speedup'] = result['frames_per_s'] / results[0]['frames_per_s']
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_sensor(config, results):
+    """
+    Processus capteur de run_distributed: rejouer la capture avec le rôle sensor de MainApp.
+    """
+    app = MainApp(config)
+    started_at = time.perf_counter()
+    app.run()
+    results.put(dict(app.forwarder.writer.stats(), sensor=app.forwarder.name, elapsed_s=time.perf_counter() - started_at))
+
+
+def run_distributed(config, pcap_path, sensors=2, collector_delay=0.0, api_latency_ms=0.0):
+    """
+    Rejouer la même capture dans plusieurs capteurs (processus distincts, rôle sensor) qui
+    envoient leurs flux en local à un collecteur de ce processus (API et base substituts).
+    Tous les capteurs voyant le même trafic, le collecteur ne doit écrire chaque flux
+    qu'une fois. Avec collector_delay, le collecteur démarre après les capteurs, qui
+    gardent entre-temps leurs lots dans leur journal local.
+
+    Returns:
+    dict: Bilan de chaque capteur (envoyés, versés au journal, rejoués) et du collecteur.
+    """
+    port = free_port()
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = []
+    for index in range(sensors):
+        sensor_config = dict(config, role='sensor', collector_url=f'http://127.0.0.1:{port}/flows', sensor_name=f'capteur-{index}',
+                             sensor_journal_dir=tempfile.mkdtemp(prefix='sensor_journal_'), sensor_retry_interval=0.5,
+                             sensor_drain_timeout=collector_delay + 30, replay_pcap_path=pcap_path, replay_realtime=False,
+                             metrics_enabled=False)
+        process = context.Process(target=run_sensor, args=(sensor_config, results), name=f'capteur-{index}')
+        process.start()
+        processes.append(process)
+    time.sleep(collector_delay)
+
+    stub_server = StubPredictionServer(api_latency_ms)
+    stub_server.start()
+    collector_config = dict(config, role='collector', api_url=stub_server.url, api_flows_url=stub_server.flows_url,
+                            spill_journal_dir=tempfile.mkdtemp(prefix='spill_journal_'), rules_enabled=False,
+                            first_stage_enabled=False, inference_mode='http')
+    db_manager = InMemoryDatabaseManager(collector_config)
+    processor = PacketProcessor(db_manager, collector_config)
+    stats = PipelineStats()
+    processor.register_metrics(stats)
+    collector = CollectorServer(processor, '127.0.0.1', port)
+    collector.register_metrics(stats)
+    threads = [threading.Thread(target=target) for target in (processor.send_packet_batches, processor.write_results,
+                                                              processor.persist_writes, processor.run_maintenance)]
+    for thread in threads:
+        thread.start()
+    collector.start()
+    started_at = time.perf_counter()
+    try:
+        sensor_results = sorted((results.get() for _ in processes), key=lambda result: result['sensor'])
+        for process in processes:
+            process.join()
+    finally:
+        collector.stop()
+        processor.stop()
+        for thread in threads:
+            thread.join()
+        stub_server.stop()
+    counters = stats.summary()['counters']
+    return {
+        'sensors': sensor_results,
+        'collector': {
+            'elapsed_s': time.perf_counter() - started_at,
+            'received': counters.get('collector_records_received', 0),
+            'unique': counters.get('packets_unique', 0),
+            'duplicate': counters.get('packets_duplicate', 0),
+            'persisted': counters.get('packets_persisted', 0),
+            'per_sensor': collector.stats(),
+        },
+    }
+
+
+def print_distributed_report(result):
+    print(f"{'capteur':>12}{'envoyés':>10}{'au journal':>12}{'rejoués':>10}{'restants':>10}")
+    for sensor in result['sensors']:
+        print(f"{sensor['sensor']:>12}{sensor['written']:>10}{sensor['spilled']:>12}{sensor['replayed']:>10}"
+              f"{sensor['journal_records']:>10}")
+    collector = result['collector']
+    print(f"Collecteur: {collector['received']} flux reçus, {collector['unique']} uniques, "
+          f"{collector['duplicate']} doublons entre capteurs, {collector['persisted']} persistés")
+
+
+def print_sharding_report(results):
+    print(f"{'processus':>10}{'trames/s':>12}{'accélération':>14}{'enregistrements':>17}{'déséquilibre':>14}")
+    for result in results:
+        imbalance = f"{result['dispatch_imbalance']:.2f}" if 'dispatch_imbalance' in result else '-'
+        print(f"{result['workers']:>10}{result['frames_per_s']:>12.0f}{'x' + format(result['speedup'], '.2f'):>14}"
+              f"{result['records']:>17}{imbalance:>14}")
+
+
+def compare_decoders(config, pcap_path):
+    """
+    Comparer la dissection scapy et le décodeur rapide sur les mêmes trames.
+
+    Les trames sont chargées en mémoire au préalable pour ne mesurer que
+    l'extraction de packet_details. Chaque résultat du décodeur rapide est
+    confronté à celui de scapy.
+
+    Returns:
+    dict: Débits, accélération, nombre de replis vers scapy et de divergences.
+    """
+    processor = PacketProcessor(InMemoryDatabaseManager(config), config)
+    with RawPcapReader(pcap_path) as reader:
+        frames = [(data, getattr(metadata, 'linktype', None) or reader.linktype) for data, metadata in reader]
+
+    scapy_details = []
+    started_at = time.perf_counter()
+    for data, linktype in frames:
+        scapy_details.append(processor.extract_packet_details(conf.l2types.num2layer.get(linktype, conf.raw_layer)(data)))
+    scapy_elapsed = time.perf_counter() - started_at
+
+    fast_details = []
+    fallbacks = 0
+    started_at = time.perf_counter()
+    for data, linktype in frames:
+        packet_details = processor.decoder.decode(data, linktype)
+        if packet_details is None:
+            fallbacks += 1
+            packet_details = processor.extract_packet_details(conf.l2types.num2layer.get(linktype, conf.raw_layer)(data))
+        fast_details.append(packet_details)
+    fast_elapsed = time.perf_counter() - started_at
+
+    mismatches = [(index, expected, actual) for index, (expected, actual) in enumerate(zip(scapy_details, fast_details)) if expected != actual]
+    return {
+        'frames': len(frames),
+        'scapy_pps': len(frames) / scapy_elapsed if scapy_elapsed > 0 else 0,
+        'fast_pps': len(frames) / fast_elapsed if fast_elapsed > 0 else 0,
+        'speedup': scapy_elapsed / fast_elapsed if fast_elapsed > 0 else 0,
+        'fallbacks': fallbacks,
+        'mismatches': len(mismatches),
+        'first_mismatches': mismatches[:5],
+    }
+
+
+def synthetic_packet(rng):
+    return {
+        'domain': rng.choice(['none', 'example.com', 'api.example.org', 'cdn.example.net']),
+        'source_ip': f"10.0.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+        'source_port': rng.randrange(1024, 65536),
+        'destination_ip': f"192.168.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+        'destination_port': rng.choice([53, 80, 443, 8080]),
+        'protocol': rng.choice(['TCP', 'UDP']),
+        'application_layer_protocol': rng.choice(['HTTP', 'HTTPS', 'DNS', 'unknown']),
+        'prediction': rng.choice(['allow', 'allow', 'allow', 'deny']),
+        'model_version': 'v2_2',
+        'decision_source': rng.choice(['model', 'model', 'rule']),
+    }
+
+
+def compare_persistence(config, batches=200, batch_size=50, latency_ms=0.0, connect_latency_ms=0.0,
+                        commit_latency_ms=0.0, real_db=False):
+    """
+    Comparer l'écriture des lots table par table (une connexion et une transaction
+    par insertion) et en une seule transaction sur une connexion du pool.
+
+    Avec real_db, les lignes sont réellement insérées dans la base de db_config.
+
+    Returns:
+    dict: Durée, débits et, pour le substitut, connexions ouvertes, requêtes et validations.
+    """
+    rng = random.Random(0)
+    workload = [[synthetic_packet(rng) for _ in range(batch_size)] for _ in range(batches)]
+    results = {}
+    for name, pool_size, single_transaction in (('per_table', 0, False), ('pooled_transaction', config.get('db_pool_size') or 4, True)):
+        run_config = dict(config, db_pool_size=pool_size)
+        if real_db:
+            db_manager = DatabaseManager(run_config)
+        else:
+            db_manager = InMemoryDatabaseManager(run_config, latency_ms, connect_latency_ms, commit_latency_ms)
+        rows = 0
+        started_at = time.perf_counter()
+        for packets in workload:
+            writes = [
+                ('new_data', packets, True),
+                ('blocked_frames', [packet for packet in packets if packet['prediction'] == 'deny'], True),
+                ('passed_frames', [packet for packet in packets if packet['prediction'] != 'deny'], True),
+            ]
+            if single_transaction:
+                db_manager.insert_packets_batches(writes)
+            else:
+                for table, table_packets, include_prediction in writes:
+                    if table_packets:
+                        db_manager.insert_packets_batch(table_packets, table, include_prediction)
+            rows += sum(len(write[1]) for write in writes)
+        elapsed = time.perf_counter() - started_at
+        result = {'elapsed_s': elapsed, 'batches_per_s': batches / elapsed, 'rows_per_s': rows / elapsed}
+        if not real_db:
+            result.update(connections_opened=db_manager.connections_opened, statements=db_manager.statements,
+                          commits=db_manager.commits)
+        results[name] = result
+    results['speedup'] = results['per_table']['elapsed_s'] / results['pooled_transaction']['elapsed_s']
+    return results
+
+
+def compare_inference(config, batch_sizes=(1, 10, 50, 200), rounds=20):
+    """
+    Comparer la latence des lots de prédictions par l'API HTTP (api_url, qui doit déjà
+    servir le même modèle) et par l'inférence intégrée. Chaque appel porte sur des flux
+    inédits, pour que les deux chemins passent par le modèle plutôt que par le cache.
+
+    Returns:
+    dict: Par taille de lot, percentiles de latence (s) et débit (flux/s) de chaque mode.
+    """
+    rng = random.Random(0)
+    processors = {}
+    for mode in INFERENCE_MODES:
+        run_config = dict(config, inference_mode=mode, first_stage_enabled=False, rules_enabled=False)
+        processors[mode] = PacketProcessor(InMemoryDatabaseManager(run_config), run_config)
+    embedded = processors['embedded'].embedded
+    if not embedded.wait_ready(config.get('api_ready_timeout', 120)):
+        raise RuntimeError(f"Modèle intégré non prêt: {embedded.status()}")
+    sessions = {mode: processor.create_session() for mode, processor in processors.items()}
+    results = {}
+    for batch_size in batch_sizes:
+        results[batch_size] = {}
+        for mode, processor in processors.items():
+            # Passe à vide: connexion HTTP et formes de lot déjà préparées
+            processor.request_predictions(sessions[mode], [synthetic_packet(rng) for _ in range(batch_size)])
+            latencies = []
+            for _ in range(rounds):
+                packets = [synthetic_packet(rng) for _ in range(batch_size)]
+                started_at = time.perf_counter()
+                processor.request_predictions(sessions[mode], packets)
+                latencies.append(time.perf_counter() - started_at)
+            latencies.sort()
+            results[batch_size][mode] = {
+                'p50_s': latencies[len(latencies) // 2],
+                'p99_s': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+                'flows_per_s': batch_size * len(latencies) / sum(latencies),
+            }
+    for session in sessions.values():
+        session.close()
+    return results
+
+
+def print_inference_report(results):
+    print(f"{'lot':>6}{'mode':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}{'flux/s':>10}")
+    for batch_size, modes in results.items():
+        for mode, result in modes.items():
+            print(f"{batch_size:>6}{mode:>10}{result['p50_s'] * 1000:>12.2f}{result['p99_s'] * 1000:>12.2f}"
+                  f"{result['flows_per_s']:>10.0f}")
+        http, embedded = modes['http']['p50_s'], modes['embedded']['p50_s']
+        print(f"{'':>6}{'écart':>10}{(http - embedded) * 1000:>12.2f}{'':>12}{'x' + format(http / embedded, '.1f'):>10}")
+
+
+def print_persistence_report(results):
+    for name, label in (('per_table', 'Table par table'), ('pooled_transaction', 'Pool + transaction')):
+        result = results[name]
+        line = f"{label:<22}: {result['batches_per_s']:.0f} lots/s, {result['rows_per_s']:.0f} lignes/s"
+        if 'commits' in result:
+            line += (f" ({result['connections_opened']} connexions, {result['statements']} requêtes,"
+                     f" {result['commits']} validations)")
+        print(line)
+    print(f"Accélération          : x{results['speedup']:.1f}")
+
+
+def print_decoder_report(result):
+    print(f"Trames comparées      : {result['frames']}")
+    print(f"Dissection scapy      : {result['scapy_pps']:.0f} paquets/s")
+    print(f"Décodeur rapide       : {result['fast_pps']:.0f} paquets/s")
+    print(f"Accélération          : x{result['speedup']:.1f}")
+    print(f"Replis vers scapy     : {result['fallbacks']}")
+    print(f"Divergences           : {result['mismatches']}")
+    for index, expected, actual in result['first_mismatches']:
+        print(f"  trame {index}: scapy={expected} rapide={actual}")
+
+
+def print_report(summary):
+    counters = summary['counters']
+    elapsed = summary['elapsed_s']
+    print(f"Trames rejouées       : {summary['frames']}")
+    print(f"Durée totale          : {elapsed:.3f} s")
+    print(f"Débit capture         : {counters.get('packets_captured', 0) / elapsed:.0f} paquets/s")
+    if 'flows_emitted' in counters:
+        print(f"Flux émis             : {counters['flows_emitted']} (x{counters.get('packets_captured', 0) / max(1, counters['flows_emitted']):.1f} paquets par flux)")
+    print(f"Paquets uniques       : {counters.get('packets_unique', 0)} ({counters.get('packets_duplicate', 0)} doublons)")
+    print(f"Lots envoyés          : {counters.get('batches', 0)} ({counters.get('api_requests', 0)} requêtes API, "
+          f"{counters.get('packets_unique', 0) / max(1, counters.get('batches', 0)):.1f} éléments par lot en moyenne)")
+    overload = summary.get('overload')
+    if overload:
+        print(f"Délestage ({overload['policy']:<11}): {overload['packets_dropped']} paquets abandonnés en {overload['batches_dropped']} lots, "
+              f"{overload['packets_sampled_out']} écartés par échantillonnage (taux final {overload['sampling_rate']:.2f})")
+    print(f"Lignes persistées     : {counters.get('packets_persisted', 0)} ({counters.get('packets_persisted', 0) / elapsed:.0f} lignes/s)")
+    write_behind = summary.get('write_behind')
+    if write_behind:
+        print(f"Écriture différée     : {write_behind['written']}/{write_behind['submitted']} écrits, {write_behind['spilled']} versés au journal, "
+              f"{write_behind['replayed']} rejoués, {write_behind['journal_records']} restant dans le journal, "
+              f"{write_behind['write_failures']} échecs d'écriture")
+    if 'rule_hits' in counters:
+        decided = counters['rule_hits'] + counters.get('rule_misses', 0)
+        print(f"Règles déterministes  : {counters['rule_hits']}/{decided} flux tranchés sans le modèle ({counters['rule_hits'] / max(1, decided):.1%})")
+    if 'first_stage_decided' in counters:
+        first_stage = counters['first_stage_decided'] + counters.get('first_stage_escalated', 0)
+        print(f"Premier étage         : {counters['first_stage_decided']}/{first_stage} flux tranchés localement, "
+              f"{counters.get('first_stage_escalated', 0) / max(1, first_stage):.1%} envoyés à l'API")
+    for name, cache in summary.get('caches', {}).items():
+        print(f"Cache {name:<16}: {cache['entries']}/{cache['max_entries']} entrées, taux de succès {cache['hit_ratio']:.1%}, "
+              f"{cache['evictions']} évictions, {cache['expirations']} expirations")
+    print()
+    print(f"{'étape':<12}{'échantillons':>14}{'p50 (ms)':>12}{'p90 (ms)':>12}{'p99 (ms)':>12}")
+    for stage in ('capture', 'dedup', 'batch', 'first_stage', 'api', 'db', 'db_connect', 'db_insert'):
+        points = summary['latency_s'].get(stage)
+        if not points:
+            continue
+        print(f"{stage:<12}{counters.get(f'{stage}_samples', 0):>14}"
+              f"{points['p50'] * 1000:>12.3f}{points['p90'] * 1000:>12.3f}{points['p99'] * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banc d'essai de débit du pipeline de capture")
+    parser.add_argument('pcap', nargs='?', help="Fichier pcap/pcapng à rejouer")
+    parser.add_argument('--config', default='./src/sniffing/config.json', help="Chemin du fichier de configuration")
+    parser.add_argument('--realtime', action='store_true', help="Respecter l'espacement d'origine des trames")
+    parser.add_argument('--batch-size', type=int, help="Remplacer batch_size de la configuration")
+    parser.add_argument('--max-in-flight', type=int, help="Remplacer api_max_in_flight de la configuration")
+    parser.add_argument('--overload-policy', choices=OVERLOAD_POLICIES, help="Remplacer overload_policy de la configuration")
+    parser.add_argument('--api-format', choices=API_FORMATS, help="Remplacer api_format de la configuration")
+    parser.add_argument('--fast-decoder', action='store_true', help="Utiliser le décodeur rapide d'en-têtes")
+    parser.add_argument('--capture-workers', type=int, help="Remplacer capture_workers de la configuration")
+    parser.add_argument('--compare-shards', type=int, nargs='+', metavar='PROCESSUS',
+                        help="Mesurer uniquement le débit de l'étage de capture pour chaque nombre de processus")
+    parser.add_argument('--distributed', type=int, metavar='CAPTEURS',
+                        help="Rejouer la capture dans autant de capteurs reliés en local à un collecteur")
+    parser.add_argument('--collector-delay', type=float, default=0.0,
+                        help="Démarrage retardé (s) du collecteur de --distributed, pour éprouver le journal des capteurs")
+    parser.add_argument('--flow-aggregation', action='store_true', help="Activer l'agrégation en flux (flow_aggregation)")
+    parser.add_argument('--compare-decoders', action='store_true', help="Comparer uniquement la dissection scapy et le décodeur rapide")
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help="Latence simulée par requête de l'API substitut")
+    parser.add_argument('--api-per-item-latency-ms', type=float, default=0.0, help="Latence simulée par élément de l'API substitut")
+    parser.add_argument('--db-latency-ms', type=float, default=0.0, help="Latence simulée par requête de la base substitut")
+    parser.add_argument('--db-connect-latency-ms', type=float, default=0.0, help="Latence simulée d'ouverture de connexion de la base substitut")
+    parser.add_argument('--db-commit-latency-ms', type=float, default=0.0, help="Latence simulée de validation de transaction de la base substitut")
+    parser.add_argument('--db-outage', type=float, nargs=2, metavar=('DEBUT', 'DUREE'),
+                        help="Simuler une indisponibilité de la base substitut (secondes après le démarrage)")
+    parser.add_argument('--compare-db', action='store_true', help="Comparer uniquement l'écriture table par table et en transaction unique")
+    parser.add_argument('--db-batches', type=int, default=200, help="Nombre de lots écrits par --compare-db")
+    parser.add_argument('--compare-inference', action='store_true',
+                        help="Comparer uniquement la latence de l'API HTTP (api_url) et de l'inférence intégrée")
+    parser.add_argument('--inference-batch-sizes', type=int, nargs='+', default=[1, 10, 50, 200],
+                        help="Tailles de lot mesurées par --compare-inference")
+    parser.add_argument('--inference-rounds', type=int, default=20, help="Lots mesurés par taille et par mode")
+    parser.add_argument('--real-api', action='store_true', help="Utiliser api_url de la configuration au lieu du substitut")
+    parser.add_argument('--real-db', action='store_true', help="Utiliser MySQL (db_config) au lieu du substitut en mémoire")
+    parser.add_argument('--logging-level', default='WARNING', help="Niveau de journalisation pendant la mesure")
+    parser.add_argument('--json', action='store_true', help="Afficher le résumé brut au format JSON")
+    args = parser.parse_args()
+
+    config = ConfigLoader.load_config(args.config)
+    config['logging_level'] = args.logging_level
+    if args.batch_size:
+        config['batch_size'] = args.batch_size
+    if args.overload_policy:
+        config['overload_policy'] = args.overload_policy
+    if args.max_in_flight:
+        config['api_max_in_flight'] = args.max_in_flight
+    if args.api_format:
+        config['api_format'] = args.api_format
+    if args.fast_decoder:
+        config['fast_decoder'] = True
+    if args.flow_aggregation:
+        config['flow_aggregation'] = True
+    if args.capture_workers:
+        config['capture_workers'] = args.capture_workers
+
+    if args.compare_db:
+        results = compare_persistence(config, args.db_batches, args.batch_size or config['batch_size'], args.db_latency_ms,
+                                      args.db_connect_latency_ms, args.db_commit_latency_ms, args.real_db)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_persistence_report(results)
+        raise SystemExit(0)
+
+    if args.compare_inference:
+        results = compare_inference(config, args.inference_batch_sizes, args.inference_rounds)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_inference_report(results)
+        raise SystemExit(0)
+
+    if not args.pcap:
+        parser.error("un fichier pcap/pcapng est nécessaire sauf avec --compare-db ou --compare-inference")
+
+    if args.compare_shards:
+        results = compare_sharding(config, args.pcap, args.compare_shards)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_sharding_report(results)
+        raise SystemExit(0)
+
+    if args.distributed:
+        result = run_distributed(config, args.pcap, args.distributed, args.collector_delay, args.api_latency_ms)
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print_distributed_report(result)
+        raise SystemExit(0)
+
+    if args.compare_decoders:
+        result = compare_decoders(config, args.pcap)
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print_decoder_report(result)
+        raise SystemExit(0)
+
+    summary = run_benchmark(config, args.pcap, args.realtime, args.api_latency_ms, args.api_per_item_latency_ms,
+                            args.db_latency_ms, args.real_api, args.real_db, args.db_connect_latency_ms, args.db_commit_latency_ms,
+                            args.db_outage)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
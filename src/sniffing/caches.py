@@ -0,0 +1,121 @@
+"""
+Caches bornés (taille et durée de vie) à éviction LRU et clés entières compactes.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Coût mémoire estimé d'une entrée (clé entière, valeur, nœud de l'OrderedDict)
+ENTRY_SIZE_BYTES = 160
+
+
+def packet_key(packet_details, fields):
+    """
+    Calculer la clé entière 64 bits d'un paquet à partir des champs donnés.
+
+    La clé est stable d'un processus à l'autre (BLAKE2b), contrairement à hash().
+
+    Args:
+    packet_details (dict): Champs du paquet.
+    fields (tuple): Noms des champs qui identifient le paquet.
+
+    Returns:
+    int: Clé sur 64 bits.
+    """
+    packet_str = '\x1f'.join(str(packet_details[field]) for field in fields)
+    return int.from_bytes(hashlib.blake2b(packet_str.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def entries_for_budget(memory_budget_mb):
+    return max(1, int(memory_budget_mb * 1024 * 1024 / ENTRY_SIZE_BYTES))
+
+
+class BoundedCache:
+    """
+    Cache LRU borné en nombre d'entrées, avec expiration optionnelle.
+
+    Args:
+    max_entries (int): Nombre maximal d'entrées; la moins récemment utilisée est évincée au-delà.
+    ttl (float): Durée de vie d'une entrée en secondes (None: pas d'expiration).
+    """
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _lookup(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self.entries[key]
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, value, now):
+        self.entries[key] = (value, now + self.ttl if self.ttl is not None else None)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self._lookup(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self._store(key, value, time.monotonic())
+
+    def add(self, key):
+        """
+        Ajouter une clé si elle est absente.
+
+        Returns:
+        bool: True si la clé était absente (ou expirée) et vient d'être ajoutée.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self._lookup(key, now) is not None:
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._store(key, True, now)
+            return True
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
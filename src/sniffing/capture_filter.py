@@ -0,0 +1,126 @@
+"""
+Filtrage BPF de la capture et compteurs de trames filtrées/délivrées.
+
+Le filtre est attaché à la socket de capture: le noyau écarte les trames sans
+intérêt (dont le trafic du pipeline lui-même vers l'API et MySQL) avant qu'elles
+n'atteignent le callback Python.
+"""
+import logging
+import socket
+import struct
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+MYSQL_DEFAULT_PORT = 3306
+
+
+class CaptureFilter:
+    """
+    Construire l'expression BPF de capture à partir de la configuration.
+
+    Args:
+    config (dict): Configuration du sniffer. Clés utilisées: capture_filter,
+    exclude_pipeline_traffic, api_url, db_config, role et collector_url.
+    """
+    def __init__(self, config):
+        self.user_filter = (config.get('capture_filter') or '').strip()
+        self.endpoints = self.pipeline_endpoints(config) if config.get('exclude_pipeline_traffic', True) else []
+        self.expression = self.build_expression()
+
+    @staticmethod
+    def resolve(host):
+        try:
+            return sorted({info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)})
+        except socket.gaierror as e:
+            logger.warning(f"Impossible de résoudre {host} pour l'exclusion de capture: {e}")
+            return []
+
+    @classmethod
+    def pipeline_endpoints(cls, config):
+        """
+        Lister les couples (adresse, port TCP) de l'API, de la base de données et, pour un
+        capteur, du collecteur.
+
+        Returns:
+        list: Couples (ip, port) dont le trafic doit être exclu de la capture.
+        """
+        endpoints = []
+        urls = [config['api_url']]
+        if config.get('role') == 'sensor' and config.get('collector_url'):
+            urls.append(config['collector_url'])
+        for url in urls:
+            url = urlparse(url)
+            if url.hostname:
+                port = url.port or DEFAULT_PORTS.get(url.scheme, 80)
+                endpoints.extend((address, port) for address in cls.resolve(url.hostname))
+        db_config = config.get('db_config', {})
+        db_port = int(db_config.get('port', MYSQL_DEFAULT_PORT))
+        endpoints.extend((address, db_port) for address in cls.resolve(db_config.get('host', 'localhost')))
+        return sorted(set(endpoints))
+
+    def build_expression(self):
+        """
+        Returns:
+        str: Expression BPF combinant le filtre utilisateur et les exclusions, ou None.
+        """
+        parts = [f"({self.user_filter})"] if self.user_filter else []
+        parts.extend(f"not (host {address} and tcp port {port})" for address, port in self.endpoints)
+        return ' and '.join(parts) or None
+
+
+class CaptureCounters:
+    """
+    Compteurs de trames vues par l'interface, acceptées par le filtre noyau,
+    perdues par le noyau et délivrées au callback Python.
+
+    Les compteurs noyau proviennent de PACKET_STATISTICS (sockets PF_PACKET Linux)
+    et le total de l'interface de /sys/class/net; ils valent None ailleurs.
+    """
+    def __init__(self, interface):
+        self.interface = interface
+        self.delivered = 0
+        self.kernel_accepted = None
+        self.kernel_dropped = None
+        self.interface_baseline = self.read_interface_frames()
+
+    def read_interface_frames(self):
+        total = 0
+        try:
+            for direction in ('rx_packets', 'tx_packets'):
+                with open(f"/sys/class/net/{self.interface}/statistics/{direction}", 'r') as f:
+                    total += int(f.read())
+        except (OSError, ValueError):
+            return None
+        return total
+
+    def poll_socket(self, sock):
+        """
+        Cumuler les statistiques noyau de la socket (remises à zéro à chaque lecture).
+        """
+        try:
+            accepted, dropped = struct.unpack('II', sock.ins.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+        except (AttributeError, OSError):
+            return
+        self.kernel_accepted = (self.kernel_accepted or 0) + accepted
+        self.kernel_dropped = (self.kernel_dropped or 0) + dropped
+
+    def snapshot(self):
+        interface_frames = None
+        current = self.read_interface_frames()
+        if current is not None and self.interface_baseline is not None:
+            interface_frames = current - self.interface_baseline
+        filtered = None
+        if interface_frames is not None and self.kernel_accepted is not None:
+            filtered = max(0, interface_frames - self.kernel_accepted)
+        return {
+            'interface_frames': interface_frames,
+            'kernel_accepted': self.kernel_accepted,
+            'kernel_dropped': self.kernel_dropped,
+            'filtered': filtered,
+            'delivered': self.delivered,
+        }
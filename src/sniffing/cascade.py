@@ -0,0 +1,164 @@
+"""
+Premier étage de la cascade de classification: une régression logistique sur des
+caractéristiques hachées des flux, évaluée avec NumPy dans le processus du renifleur.
+
+Seuls les flux dont la confiance du premier étage est inférieure au seuil
+(first_stage_threshold) sont envoyés à l'API; les autres sont tranchés localement.
+Le modèle est entraîné par src/training/first_stage.py à partir des jeux de données
+de preparation.py, avec les mêmes caractéristiques que celles calculées ici.
+
+Caractéristiques d'un flux: la valeur de chaque champ de FLOW_FIELDS, le préfixe /24
+des adresses IPv4, la classe des ports (système, enregistré, dynamique) et les couples
+protocole/port et protocole/protocole applicatif. Chacune est hachée (CRC32, stable
+d'un processus à l'autre) dans un vecteur de n_features poids.
+"""
+import zlib
+
+import numpy as np
+
+from flows import FLOW_FIELDS
+
+DEFAULT_FEATURES = 2 ** 18
+
+
+def port_class(port):
+    if not port.isdigit():
+        return port
+    port = int(port)
+    return 'system' if port < 1024 else ('registered' if port < 49152 else 'dynamic')
+
+
+def ipv4_prefix(address):
+    parts = address.split('.')
+    return '.'.join(parts[:3]) if len(parts) == 4 else address
+
+
+def flow_tokens(values):
+    """
+    Args:
+    values (list): Valeurs des champs dans l'ordre de FLOW_FIELDS.
+
+    Returns:
+    list: Caractéristiques textuelles du flux.
+    """
+    domain, source_ip, source_port, destination_ip, destination_port, protocol, application = \
+        (str(value).strip().lower() for value in values)
+    tokens = [f'{field}={value}' for field, value in zip(FLOW_FIELDS, (domain, source_ip, source_port, destination_ip,
+                                                                         destination_port, protocol, application))]
+    tokens += [
+        f'source_net={ipv4_prefix(source_ip)}',
+        f'destination_net={ipv4_prefix(destination_ip)}',
+        f'source_port_class={port_class(source_port)}',
+        f'destination_port_class={port_class(destination_port)}',
+        f'protocol_source_port={protocol}/{source_port}',
+        f'protocol_destination_port={protocol}/{destination_port}',
+        f'protocol_application={protocol}/{application}',
+        'bias',
+    ]
+    return tokens
+
+
+def text_values(text):
+    """
+    Champs d'un texte de flux de preparation.py ("domain source_ip ... application_layer_protocol").
+    """
+    values = text.rsplit(' ', len(FLOW_FIELDS) - 1)
+    if len(values) != len(FLOW_FIELDS):
+        raise ValueError(f"Texte de flux invalide: {text!r}")
+    return values
+
+
+class FirstStageModel:
+    """
+    Args:
+    weights (np.ndarray): Poids des caractéristiques hachées (float32).
+    name (str): Nom du modèle, enregistré comme model_version des flux qu'il tranche.
+    """
+    def __init__(self, weights, name='first_stage'):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.n_features = len(self.weights)
+        self.name = name
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['weights'], str(data['name']))
+
+    def save(self, path):
+        np.savez_compressed(path, weights=self.weights, name=np.array(self.name))
+
+    def feature_indexes(self, rows):
+        """
+        Args:
+        rows (list): Valeurs des champs de chaque flux, dans l'ordre de FLOW_FIELDS.
+
+        Returns:
+        np.ndarray: Indices des caractéristiques hachées, une ligne par flux.
+        """
+        return np.array([[zlib.crc32(token.encode('utf-8')) % self.n_features for token in flow_tokens(values)]
+                         for values in rows], dtype=np.int64).reshape(len(rows), -1)
+
+    def predict_indexes(self, indexes):
+        scores = self.weights[indexes].sum(axis=1, dtype=np.float64)
+        return 1.0 / (1.0 + np.exp(-scores))
+
+    def predict_proba(self, packets):
+        """
+        Returns:
+        np.ndarray: Probabilité que chaque flux soit autorisé ('allow').
+        """
+        return self.predict_indexes(self.feature_indexes([[packet[field] for field in FLOW_FIELDS] for packet in packets]))
+
+    def split(self, packets, threshold):
+        """
+        Trancher les flux dont la confiance atteint le seuil.
+
+        Returns:
+        tuple: (couples (flux, étiquette) tranchés, flux à envoyer à l'API).
+        """
+        if not packets:
+            return [], []
+        probabilities = self.predict_proba(packets)
+        decided, escalated = [], []
+        for packet, probability in zip(packets, probabilities):
+            if max(probability, 1.0 - probability) >= threshold:
+                decided.append((packet, 'allow' if probability >= 0.5 else 'deny'))
+            else:
+                escalated.append(packet)
+        return decided, escalated
+
+    @classmethod
+    def fit(cls, rows, labels, name='first_stage', n_features=DEFAULT_FEATURES, epochs=5, learning_rate=0.5,
+            l2=1e-6, batch_size=256, seed=42):
+        """
+        Entraîner par descente de gradient stochastique (pas AdaGrad par caractéristique).
+
+        Args:
+        rows (list): Valeurs des champs de chaque flux, dans l'ordre de FLOW_FIELDS.
+        labels (list): 1 pour 'allow', 0 pour 'deny' (étiquettes de preparation.py).
+
+        Returns:
+        FirstStageModel: Modèle entraîné.
+        """
+        model = cls(np.zeros(n_features, dtype=np.float32), name)
+        indexes = model.feature_indexes(rows)
+        labels = np.asarray(labels, dtype=np.float64)
+        weights = np.zeros(n_features, dtype=np.float64)
+        squared_gradients = np.full(n_features, 1e-8)
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            order = rng.permutation(len(labels))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                batch_indexes = indexes[batch]
+                scores = weights[batch_indexes].sum(axis=1)
+                errors = 1.0 / (1.0 + np.exp(-scores)) - labels[batch]
+                # Gradient limité aux caractéristiques présentes dans le lot
+                touched, inverse = np.unique(batch_indexes, return_inverse=True)
+                gradient = np.bincount(inverse.ravel(), weights=np.repeat(errors / len(batch), batch_indexes.shape[1]),
+                                       minlength=len(touched))
+                gradient += l2 * weights[touched]
+                squared_gradients[touched] += gradient ** 2
+                weights[touched] -= learning_rate * gradient / np.sqrt(squared_gradients[touched])
+        model.weights = weights.astype(np.float32)
+        return model
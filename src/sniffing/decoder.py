@@ -0,0 +1,299 @@
+"""
+Décodage rapide des en-têtes à partir des octets bruts d'une trame.
+
+RawPacketDecoder extrait les mêmes champs que PacketProcessor.extract_packet_details
+(adresses IPv4/IPv6, ports TCP/UDP, QNAME DNS) avec struct/memoryview, sans construire
+les couches scapy. Les trames que le décodeur ne sait pas traiter à l'identique de
+scapy (tunnels, fragments, erreurs ICMP, DNS malformé, liens exotiques...) sont
+signalées par un retour None afin que l'appelant se rabatte sur la dissection scapy.
+"""
+import socket
+import struct
+
+# Types de lien (DLT) pris en charge
+DLT_EN10MB = 1
+DLT_RAW = 101
+DLT_RAW_ALT = 12
+DLT_LINUX_SLL = 113
+DLT_IPV4 = 228
+DLT_IPV6 = 229
+DLT_LINUX_SLL2 = 276
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_ARP = 0x0806
+VLAN_ETHERTYPES = (0x8100, 0x88A8)
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+# Protocoles IPv4 sans charge utile TCP/UDP/DNS pour scapy (hors messages d'erreur ICMP)
+IPV4_LEAF_PROTOCOLS = frozenset((1, 2))
+ICMP_ERROR_TYPES = frozenset((3, 4, 5, 11, 12))
+# En-têtes d'extension IPv6 de longueur (hdr_ext_len + 1) * 8
+IPV6_EXTENSION_HEADERS = frozenset((0, 43, 60))
+IPV6_FRAGMENT_HEADER = 44
+IPV6_NO_NEXT_HEADER = 59
+IPPROTO_ICMPV6 = 58
+
+DNS_PORTS = frozenset((53,))
+MDNS_PORT = 5353
+# Ports UDP que scapy dissèque en protocoles d'encapsulation (GRE, L2TP, MobileIP, VXLAN)
+UDP_ENCAPSULATION_PORTS = frozenset((434, 1701, 4754, 4789, 4790, 6633, 8472, 48879))
+
+_unpack_h = struct.Struct('!H').unpack_from
+_unpack_hh = struct.Struct('!HH').unpack_from
+_unpack_hhh = struct.Struct('!HHH').unpack_from
+
+
+class RawPacketDecoder:
+    """
+    Décodeur d'en-têtes IPv4/IPv6, TCP/UDP et DNS à partir des octets bruts.
+
+    Args:
+    known_ports (dict): Ports connus (clé: port en chaîne, valeur: protocole applicatif).
+    """
+    def __init__(self, known_ports):
+        self.known_ports = known_ports
+
+    def decode(self, data, linktype=DLT_EN10MB):
+        """
+        Construire le dictionnaire packet_details d'une trame brute.
+
+        Args:
+        data (bytes): Octets de la trame telle que capturée.
+        linktype (int): Type de lien (DLT) de la capture.
+
+        Returns:
+        dict: packet_details identique à celui produit via scapy, ou None si la trame
+        doit être disséquée par scapy.
+        """
+        frame = memoryview(data)
+        try:
+            if linktype == DLT_EN10MB:
+                return self._decode_ethernet(frame)
+            if linktype == DLT_LINUX_SLL:
+                return self._decode_ethertype(frame, _unpack_h(frame, 14)[0], 16)
+            if linktype == DLT_LINUX_SLL2:
+                return self._decode_ethertype(frame, _unpack_h(frame, 0)[0], 20)
+            if linktype in (DLT_RAW, DLT_RAW_ALT):
+                version = frame[0] >> 4
+                if version == 4:
+                    return self._decode_ipv4(frame, 0)
+                if version == 6:
+                    return self._decode_ipv6(frame, 0)
+                return None
+            if linktype == DLT_IPV4:
+                return self._decode_ipv4(frame, 0)
+            if linktype == DLT_IPV6:
+                return self._decode_ipv6(frame, 0)
+        except (struct.error, IndexError, ValueError):
+            return None
+        return None
+
+    def _decode_ethernet(self, frame):
+        ethertype = _unpack_h(frame, 12)[0]
+        if ethertype <= 1500:
+            return None
+        return self._decode_ethertype(frame, ethertype, 14)
+
+    def _decode_ethertype(self, frame, ethertype, offset):
+        while ethertype in VLAN_ETHERTYPES:
+            ethertype = _unpack_h(frame, offset + 2)[0]
+            offset += 4
+            if ethertype <= 1500:
+                return None
+        if ethertype == ETH_P_IP:
+            return self._decode_ipv4(frame, offset)
+        if ethertype == ETH_P_IPV6:
+            return self._decode_ipv6(frame, offset)
+        if ethertype == ETH_P_ARP:
+            return self._details('none', 'none', 'none', 'none', 'none', 'none')
+        return None
+
+    def _decode_ipv4(self, frame, offset):
+        if len(frame) < offset + 20 or frame[offset] >> 4 != 4:
+            return None
+        header_length = (frame[offset] & 0x0F) * 4
+        total_length, = _unpack_h(frame, offset + 2)
+        if header_length < 20 or total_length < header_length:
+            return None
+        flags_fragment, = _unpack_h(frame, offset + 6)
+        protocol = frame[offset + 9]
+        source_ip = socket.inet_ntoa(frame[offset + 12:offset + 16])
+        destination_ip = socket.inet_ntoa(frame[offset + 16:offset + 20])
+        end = min(len(frame), offset + total_length)
+
+        if flags_fragment & 0x1FFF:
+            # Fragment non initial: scapy ne dissèque pas la charge utile
+            return self._details('none', source_ip, 'none', destination_ip, 'none', 'none')
+        if flags_fragment & 0x2000:
+            return None
+        if protocol in (IPPROTO_TCP, IPPROTO_UDP):
+            return self._decode_transport(frame, offset + header_length, end, protocol, source_ip, destination_ip)
+        if protocol in IPV4_LEAF_PROTOCOLS:
+            if protocol == 1 and (offset + header_length >= end or frame[offset + header_length] in ICMP_ERROR_TYPES):
+                return None
+            return self._details('none', source_ip, 'none', destination_ip, 'none', 'none')
+        return None
+
+    def _decode_ipv6(self, frame, offset):
+        if len(frame) < offset + 40 or frame[offset] >> 4 != 6:
+            return None
+        payload_length, = _unpack_h(frame, offset + 4)
+        next_header = frame[offset + 6]
+        if payload_length == 0:
+            return None
+        source_ip = socket.inet_ntop(socket.AF_INET6, frame[offset + 8:offset + 24])
+        destination_ip = socket.inet_ntop(socket.AF_INET6, frame[offset + 24:offset + 40])
+        end = min(len(frame), offset + 40 + payload_length)
+        offset += 40
+
+        while True:
+            if next_header in (IPPROTO_TCP, IPPROTO_UDP):
+                return self._decode_transport(frame, offset, end, next_header, source_ip, destination_ip)
+            if next_header in IPV6_EXTENSION_HEADERS:
+                if offset + 8 > end:
+                    return None
+                next_header, extension_length = frame[offset], (frame[offset + 1] + 1) * 8
+                offset += extension_length
+            elif next_header == IPV6_FRAGMENT_HEADER:
+                if offset + 8 > end:
+                    return None
+                fragment_offset = _unpack_h(frame, offset + 2)[0] >> 3
+                if fragment_offset:
+                    return self._details('none', source_ip, 'none', destination_ip, 'none', 'none')
+                next_header = frame[offset]
+                offset += 8
+            elif next_header == IPPROTO_ICMPV6:
+                if offset >= end or frame[offset] < 128 or frame[offset] == 137:
+                    return None
+                return self._details('none', source_ip, 'none', destination_ip, 'none', 'none')
+            elif next_header == IPV6_NO_NEXT_HEADER:
+                return self._details('none', source_ip, 'none', destination_ip, 'none', 'none')
+            else:
+                return None
+
+    def _decode_transport(self, frame, offset, end, protocol, source_ip, destination_ip):
+        if protocol == IPPROTO_UDP:
+            if offset + 8 > end:
+                return None
+            source_port, destination_port, udp_length = _unpack_hhh(frame, offset)
+            if udp_length < 8:
+                return None
+            if source_port in UDP_ENCAPSULATION_PORTS or destination_port in UDP_ENCAPSULATION_PORTS:
+                return None
+            payload_start = offset + 8
+            payload_end = min(end, offset + udp_length)
+            is_dns = (source_port in DNS_PORTS or destination_port in DNS_PORTS
+                      or source_port == MDNS_PORT or destination_port == MDNS_PORT)
+            name = 'UDP'
+        else:
+            if offset + 20 > end:
+                return None
+            source_port, destination_port = _unpack_hh(frame, offset)
+            data_offset = (frame[offset + 12] >> 4) * 4
+            if data_offset < 20 or offset + data_offset > end:
+                return None
+            payload_start = offset + data_offset
+            payload_end = end
+            is_dns = source_port in DNS_PORTS or destination_port in DNS_PORTS
+            name = 'TCP'
+
+        domain = 'none'
+        if is_dns and payload_end > payload_start:
+            message = frame[payload_start:payload_end]
+            if protocol == IPPROTO_TCP:
+                if len(message) < 2 or _unpack_h(message, 0)[0] != len(message) - 2:
+                    return None
+                message = message[2:]
+            domain = self._decode_dns(message)
+            if domain is None:
+                return None
+
+        return self._details(domain, source_ip, source_port, destination_ip, destination_port, name)
+
+    @staticmethod
+    def _skip_name(message, offset):
+        """
+        Renvoyer la position qui suit un nom DNS encodé à partir de offset.
+        """
+        while True:
+            length = message[offset]
+            if length == 0:
+                return offset + 1
+            if length & 0xC0 == 0xC0:
+                return offset + 2
+            if length & 0xC0:
+                raise ValueError("label DNS invalide")
+            offset += 1 + length
+
+    @staticmethod
+    def _read_name(message, offset):
+        labels = []
+        jumps = 0
+        while True:
+            length = message[offset]
+            if length == 0:
+                break
+            if length & 0xC0 == 0xC0:
+                jumps += 1
+                if jumps > 16:
+                    raise ValueError("boucle de compression DNS")
+                offset = _unpack_h(message, offset)[0] & 0x3FFF
+                continue
+            if length & 0xC0:
+                raise ValueError("label DNS invalide")
+            label = bytes(message[offset + 1:offset + 1 + length])
+            if len(label) != length:
+                raise ValueError("label DNS tronqué")
+            labels.append(label)
+            offset += 1 + length
+        return b'.'.join(labels) + b'.'
+
+    def _decode_dns(self, message):
+        """
+        Lire le QNAME de la première question DNS.
+
+        Toutes les sections du message sont parcourues: un message que scapy ne
+        pourrait pas disséquer entièrement est renvoyé vers scapy.
+
+        Returns:
+        str: Nom sans point final, 'none' s'il n'y a pas de question, ou None si le
+        message doit être disséqué par scapy.
+        """
+        if len(message) < 12:
+            return None
+        qdcount, ancount, nscount, arcount = struct.unpack_from('!HHHH', message, 4)
+        try:
+            qname = self._read_name(message, 12) if qdcount else None
+            offset = 12
+            for _ in range(qdcount):
+                offset = self._skip_name(message, offset) + 4
+            for _ in range(ancount + nscount + arcount):
+                offset = self._skip_name(message, offset)
+                offset += 10 + _unpack_h(message, offset + 8)[0]
+            if offset > len(message):
+                return None
+            return qname.decode('utf-8').rstrip('.') if qname is not None else 'none'
+        except (ValueError, IndexError, struct.error):
+            return None
+
+    def _details(self, domain, source_ip, source_port, destination_ip, destination_port, protocol):
+        protocol_l7 = 'unknown'
+        if protocol != 'none':
+            if str(source_port) in self.known_ports:
+                protocol_l7 = self.known_ports[str(source_port)]
+            elif str(destination_port) in self.known_ports:
+                protocol_l7 = self.known_ports[str(destination_port)]
+        return {
+            'domain': domain,
+            'source_ip': source_ip,
+            'source_port': source_port,
+            'destination_ip': destination_ip,
+            'destination_port': destination_port,
+            'protocol': protocol,
+            'application_layer_protocol': protocol_l7,
+            'prediction': None,
+            'model_version': None,
+            'decision_source': None
+        }
@@ -0,0 +1,217 @@
+"""
+Mode distribué: capteurs (role "sensor") et collecteur central (role "collector").
+
+Un capteur capture les paquets (agrégés en flux avec flow_aggregation) puis envoie
+ses lots, en msgpack, au collecteur (collector_url, route /flows); il n'a besoin ni
+de MySQL ni de l'API. Quand le collecteur est injoignable, les lots sont conservés dans un journal local
+(sensor_journal_dir, voir persistence.py) et rejoués dans l'ordre à son retour; à
+l'arrêt, le capteur attend encore sensor_drain_timeout secondes que le collecteur
+revienne, puis garde le reste du journal pour son prochain démarrage.
+
+Le collecteur reçoit les flux de tous les capteurs, dédoublonne ensemble les paquets
+des capteurs sans agrégation en flux (les flux agrégés, porteurs de leurs compteurs,
+sont tous gardés), puis les classifie et les écrit avec les étapes habituelles du
+renifleur (lots vers /predict, écriture différée en base). Quand sa file d'envoi est pleine, il répond 503: les
+capteurs conservent alors leurs lots plutôt que de les voir délestés.
+
+Corps d'une requête /flows: {"sensor": nom, "records": [[valeurs dans l'ordre de
+FLOW_FIELDS puis FLOW_COUNTERS, None si absentes], ...]}. Si collector_token est défini, il doit être
+présent dans l'en-tête X-Collector-Token.
+"""
+import hmac
+import logging
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import msgpack
+import requests
+
+from flows import FLOW_FIELDS, FLOW_COUNTERS
+from persistence import SpillJournal, WriteBehindWriter
+
+logger = logging.getLogger(__name__)
+
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+TOKEN_HEADER = 'X-Collector-Token'
+# Champs transmis par les capteurs: le flux et ses compteurs
+SENSOR_FIELDS = FLOW_FIELDS + FLOW_COUNTERS
+
+
+def compact_records(packets):
+    return [[None if packet.get(field) == 'none' else packet.get(field) for field in SENSOR_FIELDS] for packet in packets]
+
+
+class SensorForwarder:
+    """
+    Envoi des lots d'un capteur au collecteur, avec journal local quand il est injoignable.
+
+    Args:
+    packet_processor (PacketProcessor): Processeur dont la file d'envoi fournit les lots.
+    config (dict): Configuration (collector_url, collector_token, sensor_name, sensor_journal_dir, ...).
+    """
+    def __init__(self, packet_processor, config):
+        self.packet_processor = packet_processor
+        self.collector_url = config['collector_url']
+        self.token = config.get('collector_token')
+        self.name = config.get('sensor_name') or socket.gethostname()
+        self.timeout = config.get('collector_timeout', 10)
+        journal = SpillJournal(config.get('sensor_journal_dir', './data/sensor_journal'), SENSOR_FIELDS,
+                               config.get('spill_segment_max_records', 5000), config.get('spill_fsync', False))
+        self.writer = WriteBehindWriter(self.send_records, journal, config.get('write_buffer_max_records', 50000),
+                                        config.get('sensor_batch_records', 2000), config.get('sensor_retry_interval', 5),
+                                        config.get('sensor_drain_timeout', 30))
+        self.session = requests.Session()
+        if self.token:
+            self.session.headers[TOKEN_HEADER] = self.token
+
+    def register_metrics(self, stats):
+        stats.gauge('sniffer_sensor', "Envoi au collecteur et journal local du capteur", self.writer.stats)
+
+    def forward_batches(self):
+        """
+        Remplace l'étape d'inférence: les lots de la file d'envoi sont confiés sans attente
+        au tampon d'envoi. La fin de file arrête l'envoi une fois le tampon vidé.
+        """
+        stats = self.packet_processor.stats
+        while True:
+            item = self.packet_processor.packet_queue.get()
+            if item is None:
+                break
+            enqueued_at, batch = item
+            if stats is not None:
+                stats.record('batch', time.perf_counter() - enqueued_at)
+                stats.incr('batches')
+            self.writer.submit([{field: packet.get(field) for field in SENSOR_FIELDS} for packet in batch])
+        self.writer.stop()
+
+    def send_batches(self):
+        """
+        Thread d'envoi: vider le tampon vers le collecteur et rejouer le journal local.
+        """
+        self.writer.run()
+        self.session.close()
+
+    def send_records(self, records):
+        """
+        Returns:
+        bool: True si le collecteur a accepté les enregistrements.
+        """
+        stats = self.packet_processor.stats
+        started_at = time.perf_counter()
+        try:
+            response = self.session.post(self.collector_url, data=msgpack.packb({'sensor': self.name, 'records': compact_records(records)}),
+                                         headers={'Content-Type': MSGPACK_CONTENT_TYPE}, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if getattr(e.response, 'status_code', None) == 503:
+                logger.info(f"Collecteur saturé ({self.collector_url}), lot conservé")
+            else:
+                logger.warning(f"Collecteur injoignable ({self.collector_url}): {e}")
+            if stats is not None:
+                stats.incr('sensor_send_errors')
+            return False
+        if stats is not None:
+            stats.record('sensor_send', time.perf_counter() - started_at)
+            stats.incr('sensor_records_sent', len(records))
+        return True
+
+
+class CollectorHTTPServer(ThreadingHTTPServer):
+    # Threads de réception non démons: server_close() attend que les flux en cours de réception soient en file
+    daemon_threads = False
+
+
+class CollectorServer:
+    """
+    Serveur HTTP du collecteur, dans un thread de fond.
+
+    Args:
+    packet_processor (PacketProcessor): Processeur qui dédoublonne, classifie et écrit les flux reçus.
+    host (str): Adresse d'écoute.
+    port (int): Port d'écoute (0: port libre choisi par le système).
+    token (str): Jeton attendu dans l'en-tête X-Collector-Token (None: aucun).
+    """
+    def __init__(self, packet_processor, host='127.0.0.1', port=9109, token=None):
+        self.packet_processor = packet_processor
+        # Un lot de capteur n'est jamais délesté: la réception attend une place dans la file d'envoi
+        packet_processor.lossless = True
+        self.sensors = {}
+        self.lock = threading.Lock()
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != '/flows':
+                    self.send_error(404)
+                    return
+                if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), token):
+                    self.send_error(401)
+                    return
+                try:
+                    payload = msgpack.unpackb(self.rfile.read(int(self.headers.get('Content-Length', 0))), raw=False)
+                    status, body = collector.receive(payload)
+                except (ValueError, TypeError, KeyError, msgpack.UnpackException) as e:
+                    status, body = 400, {'error': str(e) or type(e).__name__}
+                body = msgpack.packb(body)
+                self.send_response(status)
+                self.send_header('Content-Type', MSGPACK_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = CollectorHTTPServer((host, port), Handler)
+        self.address = self.server.server_address
+
+    def register_metrics(self, stats):
+        stats.gauge('sniffer_collector_sensors', "Capteurs ayant envoyé des flux au collecteur", lambda: len(self.sensors))
+
+    def receive(self, payload):
+        """
+        Dédoublonner et mettre en lot les flux d'un capteur.
+
+        Returns:
+        tuple: (code HTTP, corps de la réponse).
+        """
+        packet_processor = self.packet_processor
+        packet_queue = packet_processor.packet_queue
+        if packet_queue.maxsize and packet_queue.qsize() >= packet_queue.maxsize:
+            # Le capteur garde ses lots et les renverra: rien n'est délesté ici
+            return 503, {'error': 'Collector overloaded'}
+        sensor, records = str(payload['sensor']), payload['records']
+        for record in records:
+            if len(record) != len(SENSOR_FIELDS):
+                raise ValueError(f"A flow record must have {len(SENSOR_FIELDS)} values")
+        for record in records:
+            packet_details = {field: 'none' if value is None else value for field, value in zip(FLOW_FIELDS, record)}
+            packet_details.update(zip(FLOW_COUNTERS, record[len(FLOW_FIELDS):]))
+            packet_details.update(prediction=None, model_version=None, decision_source=None)
+            # Un flux agrégé par son capteur (compteurs présents) est toujours gardé, comme dans
+            # PacketProcessor.enqueue_flow_records; seuls les paquets sont dédoublonnés entre capteurs
+            packet_processor.enqueue_packet_details(packet_details, dedup=packet_details['packets'] is None)
+        with self.lock:
+            received = self.sensors.get(sensor, 0) + len(records)
+            self.sensors[sensor] = received
+        if packet_processor.stats is not None:
+            packet_processor.stats.incr('collector_records_received', len(records))
+        return 200, {'accepted': len(records)}
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='collector-server', daemon=True).start()
+        logger.info(f"Collecteur à l'écoute sur http://{self.address[0]}:{self.address[1]}/flows")
+
+    def stop(self):
+        """
+        Cesser d'accepter des requêtes et attendre celles en cours, pour que tous les flux
+        acquittés aux capteurs soient en file avant l'arrêt du PacketProcessor.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.sensors)
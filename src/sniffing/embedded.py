@@ -0,0 +1,89 @@
+"""
+Inférence intégrée au renifleur (inference_mode: "embedded"), pour les déploiements
+sur une seule machine.
+
+Le module app de l'API (src/api) est importé dans le processus du renifleur: le
+chargement et le préchauffage du modèle, la surveillance des versions, le cache des
+prédictions, le regroupement des requêtes concurrentes et la tokenisation sont ceux
+de l'API, seul l'aller-retour HTTP (sérialisation, connexion, second processus)
+disparaît. Le texte soumis au modèle est construit par flow_records.flow_text, comme
+pour /predict/flows.
+
+L'API se configure par ses variables d'environnement (voir src/api/app.py), fixées
+depuis embedded_api_env si elles ne le sont pas déjà. Les chemins relatifs, comme
+MODEL_DIRECTORY, partent du répertoire de lancement du renifleur.
+"""
+import importlib
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Modules de l'API dont le nom est aussi celui d'un module du renifleur
+SHADOWED_MODULES = ('metrics',)
+
+
+class InferenceUnavailable(RuntimeError):
+    pass
+
+
+def import_api(api_path):
+    """
+    Importer le module app de l'API sans confondre ses modules avec ceux du renifleur
+    de même nom: ceux-ci sont écartés de sys.modules le temps de l'import puis remis
+    en place, app gardant ses propres références.
+
+    Returns:
+    module: Module app de l'API.
+    """
+    api_path = os.path.abspath(api_path)
+    shadowed = {name: sys.modules.pop(name) for name in SHADOWED_MODULES if name in sys.modules}
+    sys.path.insert(0, api_path)
+    try:
+        return importlib.import_module('app')
+    finally:
+        for name in SHADOWED_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(shadowed)
+        # Les modules de l'API importés plus tard (backends) restent accessibles, après ceux du renifleur
+        sys.path.remove(api_path)
+        sys.path.append(api_path)
+
+
+class EmbeddedPredictor:
+    """
+    Args:
+    api_path (str): Répertoire de l'API (src/api).
+    environment (dict): Variables d'environnement de l'API, appliquées si elles ne sont pas déjà fixées.
+    ready_timeout (float): Attente maximale (s) du modèle par un lot arrivé avant la fin du préchauffage.
+    """
+    def __init__(self, api_path='./src/api', environment=None, ready_timeout=120):
+        for name, value in (environment or {}).items():
+            os.environ.setdefault(name, str(value))
+        self.ready_timeout = ready_timeout
+        # Le chargement du modèle démarre en arrière-plan à l'import (API_LOAD_IN_BACKGROUND)
+        self.app = import_api(api_path)
+        self.app.clear_cache()
+
+    def wait_ready(self, timeout):
+        return self.app.startup.wait_ready(timeout)
+
+    def status(self):
+        return self.app.startup.snapshot()
+
+    def predict(self, records):
+        """
+        Args:
+        records (list): Flux structurés (valeurs dans l'ordre de FLOW_FIELDS, None si absentes).
+
+        Returns:
+        tuple: (prédictions 'allow' ou 'deny' dans l'ordre des flux, version du modèle).
+        """
+        if not self.wait_ready(self.ready_timeout):
+            raise InferenceUnavailable(f"Modèle non prêt ({self.app.startup.status})")
+        predictions, model_version = self.app.predict([self.app.flow_text(record) for record in records])
+        return [self.app.LABELS[label] for label, _ in predictions], model_version
+
+    def stats(self):
+        return self.app.prediction_cache.stats()
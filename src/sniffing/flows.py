@@ -0,0 +1,116 @@
+"""
+Agrégation des paquets en flux bidirectionnels avant classification.
+
+Les deux sens d'une connexion partagent une même entrée de la table, indexée par
+le 5-tuple canonique (protocole, extrémités triées) et le domaine DNS. Chaque flux
+compte paquets et octets et retient ses instants de première et dernière
+observation; il est émis une seule fois pour classification quand il expire
+(inactivité, durée active maximale ou table pleine).
+
+L'agrégation est désactivée par défaut: chaque paquet unique reste une ligne de
+new_data, comme dans les déploiements existants. Avec "flow_aggregation": true dans
+config.json, chaque ligne est un flux et porte ses compteurs (colonnes packets,
+bytes, first_seen et last_seen, vides sans agrégation); flow_idle_timeout,
+flow_active_timeout et flow_table_max_flows règlent alors son expiration.
+"""
+from collections import OrderedDict
+
+FLOW_FIELDS = ('domain', 'source_ip', 'source_port', 'destination_ip', 'destination_port', 'protocol', 'application_layer_protocol')
+# Compteurs d'un flux agrégé, enregistrés avec lui (absents sans agrégation en flux)
+FLOW_COUNTERS = ('packets', 'bytes', 'first_seen', 'last_seen')
+
+
+class FlowTable:
+    """
+    Table de flux bidirectionnels à expiration.
+
+    Args:
+    idle_timeout (float): Délai d'inactivité (s) au-delà duquel un flux est émis.
+    active_timeout (float): Durée (s) au-delà de laquelle un flux toujours actif est émis puis recommencé.
+    max_flows (int): Nombre maximal de flux suivis; le moins récemment vu est émis au-delà.
+    sweep_interval (float): Intervalle minimal (s) entre deux recherches de flux inactifs.
+    """
+    def __init__(self, idle_timeout=30, active_timeout=300, max_flows=100000, sweep_interval=1.0):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max_flows
+        self.sweep_interval = sweep_interval
+        self.flows = OrderedDict()
+        self.last_sweep = None
+        self.packets_seen = 0
+        self.flows_emitted = 0
+
+    @staticmethod
+    def flow_key(packet_details):
+        a = (str(packet_details['source_ip']), str(packet_details['source_port']))
+        b = (str(packet_details['destination_ip']), str(packet_details['destination_port']))
+        return (packet_details['protocol'], packet_details['domain']) + ((a, b) if a <= b else (b, a))
+
+    def update(self, packet_details, length, timestamp):
+        """
+        Comptabiliser un paquet dans son flux.
+
+        Args:
+        packet_details (dict): Champs du paquet (voir FLOW_FIELDS).
+        length (int): Taille de la trame en octets.
+        timestamp (float): Instant de capture (secondes epoch).
+
+        Returns:
+        list: Enregistrements de flux émis suite à cette mise à jour.
+        """
+        self.packets_seen += 1
+        emitted = []
+        key = self.flow_key(packet_details)
+        flow = self.flows.get(key)
+        # Un flux inactif depuis idle_timeout ou actif depuis active_timeout est émis avant de
+        # compter ce paquet, qui commence un nouveau flux, sans attendre le prochain balayage
+        if flow is not None and (timestamp - flow['last_seen'] >= self.idle_timeout
+                                 or timestamp - flow['first_seen'] >= self.active_timeout):
+            emitted.append(self._emit(key))
+            flow = None
+        if flow is None:
+            flow = {field: packet_details[field] for field in FLOW_FIELDS}
+            flow.update(packets=0, bytes=0, first_seen=timestamp, last_seen=timestamp, prediction=None,
+                        model_version=None, decision_source=None)
+            self.flows[key] = flow
+            if len(self.flows) > self.max_flows:
+                emitted.append(self._emit(next(iter(self.flows))))
+        else:
+            self.flows.move_to_end(key)
+        flow['packets'] += 1
+        flow['bytes'] += length
+        if timestamp > flow['last_seen']:
+            flow['last_seen'] = timestamp
+
+        if self.last_sweep is None:
+            self.last_sweep = timestamp
+        elif timestamp - self.last_sweep >= self.sweep_interval:
+            emitted.extend(self.expire(timestamp))
+        return emitted
+
+    def expire(self, now):
+        """
+        Émettre les flux inactifs depuis plus de idle_timeout.
+
+        Les flux sont ordonnés par dernière observation: le parcours s'arrête au
+        premier flux encore actif.
+        """
+        self.last_sweep = now
+        emitted = []
+        while self.flows:
+            key, flow = next(iter(self.flows.items()))
+            if now - flow['last_seen'] < self.idle_timeout:
+                break
+            emitted.append(self._emit(key))
+        return emitted
+
+    def flush(self):
+        """
+        Émettre tous les flux en cours (arrêt de la capture).
+        """
+        emitted = [self._emit(key) for key in list(self.flows)]
+        return emitted
+
+    def _emit(self, key):
+        self.flows_emitted += 1
+        return self.flows.pop(key)
@@ -0,0 +1,219 @@
+"""
+Métriques du renifleur: compteurs et durées par étape du pipeline, jauges des files,
+caches et composants, exposés en HTTP local et résumés périodiquement dans le journal.
+
+Une mesure coûte un ajout dans une fenêtre bornée (percentiles) et l'incrément d'un
+intervalle d'histogramme sous un verrou unique; les jauges ne sont lues qu'au rendu.
+
+Routes du serveur (metrics_host:metrics_port, 127.0.0.1 par défaut):
+- /metrics: format texte de Prometheus;
+- /stats: résumé JSON (compteurs, débits, percentiles, jauges).
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Bornes des histogrammes de durée par étape (s)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class PipelineStats:
+    """
+    Mesures par étape du pipeline (capture, dédoublonnage, lot, API, base de données).
+
+    Les durées sont conservées dans une fenêtre bornée par étape afin de calculer
+    des percentiles sans faire grossir la mémoire indéfiniment, et comptées dans un
+    histogramme à intervalles fixes pour Prometheus.
+    """
+    def __init__(self, max_samples=100000, buckets=LATENCY_BUCKETS):
+        self.max_samples = max_samples
+        self.buckets = tuple(buckets)
+        self.samples = defaultdict(list)
+        self.histograms = {}
+        self.counters = defaultdict(int)
+        # Jauges lues au rendu: nom -> (description, fonction renvoyant un nombre ou un dictionnaire)
+        self.gauges = {}
+        self.started_at = time.perf_counter()
+        self.last_report = (self.started_at, {})
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            samples = self.samples[stage]
+            if len(samples) >= self.max_samples:
+                samples[self.counters[f'{stage}_samples'] % self.max_samples] = seconds
+            else:
+                samples.append(seconds)
+            self.counters[f'{stage}_samples'] += 1
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def gauge(self, name, documentation, read_fn):
+        """
+        Enregistrer une jauge lue au rendu. Si read_fn renvoie un dictionnaire, chacune de
+        ses valeurs numériques devient une jauge name_<clé>.
+        """
+        self.gauges[name] = (documentation, read_fn)
+
+    def gauge_values(self):
+        """
+        Lire les jauges.
+
+        Returns:
+        list: Triplets (nom, description, valeur) des jauges numériques.
+        """
+        values = []
+        for name, (documentation, read_fn) in self.gauges.items():
+            try:
+                value = read_fn()
+            except Exception as e:
+                logger.debug(f"Jauge {name} illisible: {e}")
+                continue
+            items = value.items() if isinstance(value, dict) else [(None, value)]
+            for key, item in items:
+                if isinstance(item, (bool, int, float)):
+                    values.append((f'{name}_{key}' if key is not None else name, documentation, item))
+        return values
+
+    def read_gauges(self):
+        return {name: value for name, _, value in self.gauge_values()}
+
+    def percentiles(self, stage, points=(50, 90, 99)):
+        with self.lock:
+            samples = sorted(self.samples.get(stage, []))
+        if not samples:
+            return {}
+        return {f'p{point}': samples[min(len(samples) - 1, int(len(samples) * point / 100))] for point in points}
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started_at
+        with self.lock:
+            counters = dict(self.counters)
+            stages = list(self.samples)
+        return {
+            'elapsed_s': elapsed,
+            'counters': counters,
+            'rates': {name: value / elapsed for name, value in counters.items() if not name.endswith('_samples')} if elapsed > 0 else {},
+            'latency_s': {stage: self.percentiles(stage) for stage in stages},
+            'gauges': self.read_gauges(),
+        }
+
+    def summary_line(self):
+        """
+        Résumé d'une ligne depuis le résumé précédent: débits, taux de doublons, occupation
+        des files et percentiles récents de l'API et de la base de données.
+        """
+        now = time.perf_counter()
+        with self.lock:
+            counters = dict(self.counters)
+            previous_at, previous = self.last_report
+            self.last_report = (now, counters)
+        elapsed = max(now - previous_at, 1e-9)
+        delta = {name: value - previous.get(name, 0) for name, value in counters.items()}
+        seen = delta.get('packets_unique', 0) + delta.get('packets_duplicate', 0)
+        gauges = self.read_gauges()
+        parts = [f"capture {delta.get('packets_captured', 0) / elapsed:.0f} paquets/s",
+                 f"doublons {delta.get('packets_duplicate', 0) / seen if seen else 0:.1%}",
+                 f"file d'envoi {gauges.get('sniffer_packet_queue_depth', 0)}/{gauges.get('sniffer_packet_queue_capacity', 0)}",
+                 f"lots {delta.get('batches', 0) / elapsed:.1f}/s"]
+        escalated = delta.get('first_stage_escalated', 0)
+        first_stage = delta.get('first_stage_decided', 0) + escalated
+        if first_stage:
+            parts.append(f"envoyés à l'API par le premier étage {escalated / first_stage:.1%}")
+        for stage, label in (('api', 'API'), ('db_insert', 'base')):
+            latency = self.percentiles(stage)
+            if latency:
+                parts.append(f"{label} p50 {latency['p50'] * 1000:.1f} ms p99 {latency['p99'] * 1000:.1f} ms")
+        if 'sensor_records_sent' in counters:
+            parts.append(f"envoyés au collecteur {delta.get('sensor_records_sent', 0) / elapsed:.0f} flux/s")
+        else:
+            parts.append(f"persistés {delta.get('packets_persisted', 0) / elapsed:.0f} lignes/s")
+        dropped = delta.get('packets_dropped', 0) + delta.get('packets_sampled_out', 0)
+        if dropped:
+            parts.append(f"délestés {dropped}")
+        return ', '.join(parts)
+
+    def render(self):
+        """
+        Returns:
+        str: Compteurs, histogrammes par étape et jauges au format texte de Prometheus.
+        """
+        with self.lock:
+            counters = {name: value for name, value in self.counters.items() if not name.endswith('_samples')}
+            histograms = {stage: (list(counts), total) for stage, (counts, total) in self.histograms.items()}
+        lines = []
+        for name, value in sorted(counters.items()):
+            lines += [f'# TYPE sniffer_{name}_total counter', f'sniffer_{name}_total {format_value(value)}']
+        lines += ['# HELP sniffer_stage_duration_seconds Durée de chaque étape du pipeline',
+                  '# TYPE sniffer_stage_duration_seconds histogram']
+        for stage, (counts, total) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'sniffer_stage_duration_seconds_bucket{{stage="{stage}",le="{format_value(bound)}"}} {cumulative}')
+            lines.append(f'sniffer_stage_duration_seconds_sum{{stage="{stage}"}} {format_value(total)}')
+            lines.append(f'sniffer_stage_duration_seconds_count{{stage="{stage}"}} {cumulative}')
+        for name, documentation, value in self.gauge_values():
+            lines += [f'# HELP {name} {documentation}', f'# TYPE {name} gauge', f'{name} {format_value(value)}']
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Serveur HTTP local des métriques, dans un thread de fond.
+
+    Args:
+    stats (PipelineStats): Métriques exposées.
+    host (str): Adresse d'écoute.
+    port (int): Port d'écoute (0: port libre choisi par le système).
+    """
+    def __init__(self, stats, host='127.0.0.1', port=9108):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = stats.render().encode('utf-8'), PROMETHEUS_CONTENT_TYPE
+                elif self.path == '/stats':
+                    body, content_type = json.dumps(stats.summary()).encode('utf-8'), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True).start()
+        logger.info(f"Métriques exposées sur http://{self.address[0]}:{self.address[1]}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
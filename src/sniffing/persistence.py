@@ -0,0 +1,257 @@
+"""
+Persistance différée (write-behind) avec journal de débordement sur disque.
+
+Les enregistrements classifiés sont déposés sans attente dans un tampon mémoire
+borné; un thread d'écriture le vide vers la base par gros lots. Quand la base est
+indisponible ou que le tampon déborde, les enregistrements sont ajoutés à un
+journal local (segments JSON lignes) qui est rejoué automatiquement, dans l'ordre,
+dès que la base répond de nouveau, y compris au démarrage suivant.
+
+L'ordre d'écriture est préservé: tant que le journal n'est pas vide, tout nouvel
+enregistrement y est ajouté à la suite, et un lot dont l'écriture échoue est
+replacé en tête du journal. Un segment est supprimé après la validation de son
+insertion; un arrêt brutal entre les deux peut donc réinsérer un segment.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.jsonl'
+
+
+class SpillJournal:
+    """
+    Journal sur disque découpé en segments numérotés, rejoués du plus petit au plus grand.
+
+    Args:
+    directory (str): Répertoire des segments.
+    columns (tuple): Champs conservés pour chaque enregistrement.
+    segment_max_records (int): Nombre d'enregistrements au-delà duquel un nouveau segment est ouvert.
+    fsync (bool): Forcer l'écriture sur disque à chaque ajout.
+    """
+    def __init__(self, directory, columns, segment_max_records=5000, fsync=False):
+        self.directory = directory
+        self.columns = columns
+        self.segment_max_records = segment_max_records
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.segments = deque(sorted(self._segment_number(name) for name in os.listdir(directory)
+                                     if name.endswith(SEGMENT_SUFFIX)))
+        self.records = sum(self._count_records(number) for number in self.segments)
+        self.tail_records = self._count_records(self.segments[-1]) if self.segments else 0
+
+    @staticmethod
+    def _segment_number(name):
+        return int(name[:-len(SEGMENT_SUFFIX)])
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{number:012d}{SEGMENT_SUFFIX}")
+
+    def _count_records(self, number):
+        with open(self._segment_path(number), 'r', encoding='utf-8') as f:
+            return sum(1 for line in f if line.strip())
+
+    def __len__(self):
+        return self.records
+
+    def _write(self, number, records, mode):
+        with open(self._segment_path(number), mode, encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps({column: record.get(column) for column in self.columns}) + '\n')
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def append(self, records):
+        """
+        Ajouter des enregistrements en fin de journal.
+        """
+        if not records:
+            return
+        if not self.segments or self.tail_records >= self.segment_max_records:
+            self.segments.append(self.segments[-1] + 1 if self.segments else 1)
+            self.tail_records = 0
+        self._write(self.segments[-1], records, 'a')
+        self.tail_records += len(records)
+        self.records += len(records)
+
+    def push_front(self, records):
+        """
+        Placer des enregistrements en tête du journal (lot plus ancien que tout le contenu).
+        """
+        if not records:
+            return
+        if not self.segments:
+            self.append(records)
+            return
+        self.segments.appendleft(self.segments[0] - 1)
+        self._write(self.segments[0], records, 'w')
+        self.records += len(records)
+
+    def oldest(self):
+        """
+        Returns:
+        tuple: (numéro, enregistrements) du segment le plus ancien, ou None si le journal est vide.
+        """
+        if not self.segments:
+            return None
+        number = self.segments[0]
+        if number == self.segments[-1]:
+            # Segment en cours de remplissage: les ajouts suivants iront dans un nouveau segment
+            self.tail_records = self.segment_max_records
+        with open(self._segment_path(number), 'r', encoding='utf-8') as f:
+            return number, [json.loads(line) for line in f if line.strip()]
+
+    def remove(self, number, count):
+        """
+        Supprimer un segment rejoué.
+        """
+        os.remove(self._segment_path(number))
+        self.segments.remove(number)
+        self.records -= count
+        if not self.segments:
+            self.tail_records = 0
+
+
+class WriteBehindWriter:
+    """
+    Args:
+    persist (callable): Écrit une liste d'enregistrements en base et renvoie True si elle a réussi.
+    journal (SpillJournal): Journal de débordement.
+    max_buffered (int): Nombre maximal d'enregistrements en mémoire avant débordement vers le journal.
+    batch_records (int): Nombre maximal d'enregistrements écrits par transaction.
+    retry_interval (float): Délai (s) entre deux tentatives de rejeu quand la base ne répond pas.
+    drain_timeout (float): Durée (s) pendant laquelle le rejeu est encore tenté après la demande d'arrêt.
+    """
+    def __init__(self, persist, journal, max_buffered=50000, batch_records=5000, retry_interval=5.0, drain_timeout=0.0):
+        self.persist = persist
+        self.journal = journal
+        self.max_buffered = max_buffered
+        self.batch_records = batch_records
+        self.retry_interval = retry_interval
+        self.drain_timeout = drain_timeout
+        self.stop_deadline = None
+        self.buffer = deque()
+        # Tant que le journal contient des enregistrements, les nouveaux y sont ajoutés à la suite
+        self.spilling = len(journal) > 0
+        self.stopping = False
+        self.stop_event = threading.Event()
+        self.condition = threading.Condition()
+        self.records_submitted = 0
+        self.records_written = 0
+        self.records_spilled = 0
+        self.records_replayed = 0
+        self.write_failures = 0
+        if self.spilling:
+            logger.warning(f"Journal de débordement non vide au démarrage: {len(journal)} enregistrements à rejouer")
+
+    def submit(self, records):
+        """
+        Déposer des enregistrements classifiés sans attendre la base de données.
+        """
+        with self.condition:
+            self.records_submitted += len(records)
+            if self.spilling:
+                self._spill(records)
+            elif len(self.buffer) + len(records) > self.max_buffered:
+                logger.warning(f"Tampon d'écriture plein ({len(self.buffer)} enregistrements), débordement vers le journal")
+                self._spill(list(self.buffer) + list(records))
+                self.buffer.clear()
+                self.spilling = True
+            else:
+                self.buffer.extend(records)
+            self.condition.notify()
+
+    def _spill(self, records):
+        self.journal.append(records)
+        self.records_spilled += len(records)
+
+    def run(self):
+        """
+        Boucle du thread d'écriture: vider le tampon vers la base ou rejouer le journal.
+        """
+        while True:
+            with self.condition:
+                while not self.buffer and not self.spilling and not self.stopping:
+                    self.condition.wait()
+                if not self.buffer and not self.spilling:
+                    break
+                batch = None
+                if not self.spilling:
+                    batch = [self.buffer.popleft() for _ in range(min(self.batch_records, len(self.buffer)))]
+            if batch is not None:
+                self._write(batch)
+            elif not self._replay_oldest_segment():
+                if self.stopping:
+                    remaining = self.stop_deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.warning(f"Base de données indisponible à l'arrêt: {len(self.journal)} enregistrements conservés dans le journal")
+                        break
+                    time.sleep(min(self.retry_interval, remaining))
+                else:
+                    self.stop_event.wait(self.retry_interval)
+
+    def _write(self, batch):
+        if self.persist(batch):
+            self.records_written += len(batch)
+            return
+        with self.condition:
+            self.write_failures += 1
+            logger.warning(f"Écriture en base impossible, {len(batch) + len(self.buffer)} enregistrements versés au journal")
+            # Le lot en échec précède tout ce qui a pu être versé au journal pendant son écriture
+            self.journal.push_front(batch)
+            self.records_spilled += len(batch)
+            self._spill(list(self.buffer))
+            self.buffer.clear()
+            self.spilling = True
+
+    def _replay_oldest_segment(self):
+        """
+        Returns:
+        bool: True si un segment a été rejoué (ou si le journal est vide), False si la base ne répond pas.
+        """
+        with self.condition:
+            segment = self.journal.oldest()
+            if segment is None:
+                self.spilling = False
+                return True
+        number, records = segment
+        if records and not self.persist(records):
+            self.write_failures += 1
+            return False
+        with self.condition:
+            self.journal.remove(number, len(records))
+            self.records_replayed += len(records)
+            self.records_written += len(records)
+            if len(self.journal) == 0:
+                self.spilling = False
+                logger.info("Journal de débordement rejoué entièrement, retour à l'écriture directe")
+        return True
+
+    def stop(self):
+        """
+        Demander l'arrêt: le tampon est vidé, puis le journal rejoué tant que la base répond.
+        """
+        with self.condition:
+            self.stopping = True
+            self.stop_deadline = time.monotonic() + self.drain_timeout
+            self.condition.notify()
+        self.stop_event.set()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'buffered': len(self.buffer),
+                'journal_records': len(self.journal),
+                'spilling': self.spilling,
+                'submitted': self.records_submitted,
+                'written': self.records_written,
+                'spilled': self.records_spilled,
+                'replayed': self.records_replayed,
+                'write_failures': self.write_failures,
+            }
@@ -0,0 +1,362 @@
+"""
+Index des règles déterministes consulté avant l'API: un flux déjà tranché n'a pas
+besoin du modèle.
+
+Sources, de la plus prioritaire à la moins prioritaire:
+- false_positive_frames: corrections validées (voir src/évaluation/evaluation.py),
+  les valeurs NULL valant 'any';
+- la matrice de flux étiquetée (dtframe.csv), données d'entraînement du modèle;
+- des fichiers de règles supplémentaires, comme ceux complétés par junk/recup.py
+  (règles 'any' par port et protocole, séparateur ';').
+
+Valeurs d'une règle: 'any' (ou vide) accepte tout; une adresse IP peut être un
+préfixe CIDR (10.0.0.0/8); un port peut être un intervalle (1024-65535); les autres
+champs sont comparés sans tenir compte de la casse.
+
+Compilation: les règles sans joker sont indexées par leur tuple complet; les autres
+sont regroupées par forme (champs jokers, longueurs de préfixe) et indexées, pour
+chaque forme, par la projection du flux sur les champs qui restent. Une recherche
+coûte ainsi un accès par forme, et les formes sont peu nombreuses. Seules les règles
+à intervalle de ports sont parcourues une à une.
+
+Mise à jour incrémentale: les fichiers qui grandissent (ajouts en fin de fichier)
+ne sont relus qu'à partir de la position précédente, et seules les lignes de
+false_positive_frames d'identifiant supérieur au dernier lu sont chargées. Une source
+réécrite (fichier raccourci ou remplacé, table vidée) est recompilée seule puis
+remplacée d'un bloc.
+"""
+import csv
+import io
+import ipaddress
+import logging
+import os
+import threading
+
+from flows import FLOW_FIELDS
+
+logger = logging.getLogger(__name__)
+
+WILDCARDS = ('', 'any', '*')
+IP_FIELDS = ('source_ip', 'destination_ip')
+PORT_FIELDS = ('source_port', 'destination_port')
+IP_INDEXES = tuple(FLOW_FIELDS.index(field) for field in IP_FIELDS)
+ANY = ('any',)
+EXACT = ('exact',)
+
+
+def normalize(value):
+    return str(value).strip().lower()
+
+
+def parse_label(target):
+    target = normalize(target)
+    if 'deny' in target:
+        return 'deny'
+    if 'allow' in target:
+        return 'allow'
+    return None
+
+
+def parse_field(field, value):
+    """
+    Returns:
+    tuple: (forme du champ, valeur indexée): ANY, EXACT, ('prefix', version, longueur) ou ('range', début, fin).
+    """
+    value = normalize(value) if value is not None else ''
+    if value in WILDCARDS:
+        return ANY, None
+    if field in IP_FIELDS and '/' in value:
+        network = ipaddress.ip_network(value, strict=False)
+        if network.prefixlen == 0:
+            return ANY, None
+        if network.prefixlen < network.max_prefixlen:
+            return ('prefix', network.version, network.prefixlen), int(network.network_address) >> (network.max_prefixlen - network.prefixlen)
+        value = str(network.network_address)
+    if field in PORT_FIELDS:
+        if '-' in value:
+            start, end = (int(bound) for bound in value.split('-', 1))
+            return ('range', start, end), None
+        return EXACT, str(int(value))
+    return EXACT, value
+
+
+class RuleSet:
+    """
+    Règles compilées d'une source.
+
+    Args:
+    name (str): Nom de la source, enregistré avec les décisions qu'elle rend.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.exact = {}
+        # Forme -> {projection du flux: étiquette}, formes les plus spécifiques en premier
+        self.shapes = {}
+        self.shape_order = ()
+        self.ranges = []
+        self.rules = 0
+        self.conflicts = 0
+        # Règles à préfixe IP: sans elles, les adresses du flux ne sont pas converties
+        self.prefixes = 0
+
+    def add(self, values, label):
+        """
+        Args:
+        values (dict): Valeur de chaque champ de FLOW_FIELDS.
+        label (str): 'allow' ou 'deny'.
+        """
+        parsed = [parse_field(field, values.get(field)) for field in FLOW_FIELDS]
+        shape = tuple(kind for kind, _ in parsed)
+        self.rules += 1
+        self.prefixes += any(kind[0] == 'prefix' for kind in shape)
+        if any(kind[0] == 'range' for kind in shape):
+            self.ranges.append((parsed, label))
+            return
+        key = tuple(value for kind, value in parsed if kind is not ANY)
+        if all(kind is EXACT for kind in shape):
+            table = self.exact
+        else:
+            table = self.shapes.get(shape)
+            if table is None:
+                table = self.shapes[shape] = {}
+                self.shape_order = tuple(sorted(self.shapes, key=self.specificity, reverse=True))
+        if table.get(key, label) != label:
+            # Deux règles contradictoires: la dernière lue, ajoutée le plus récemment, l'emporte
+            self.conflicts += 1
+        table[key] = label
+
+    @staticmethod
+    def specificity(shape):
+        return (sum(kind is not ANY for kind in shape), sum(kind[2] for kind in shape if kind[0] == 'prefix'))
+
+    def lookup(self, flow, addresses):
+        """
+        Args:
+        flow (tuple): Valeurs normalisées du flux dans l'ordre de FLOW_FIELDS.
+        addresses (dict): Adresses IP du flux déjà converties, par indice de champ (None si invalide).
+
+        Returns:
+        str: Étiquette de la règle la plus spécifique, None si aucune ne s'applique.
+        """
+        label = self.exact.get(flow)
+        if label is not None:
+            return label
+        for shape in self.shape_order:
+            key = []
+            for index, kind in enumerate(shape):
+                if kind is ANY:
+                    continue
+                if kind is EXACT:
+                    key.append(flow[index])
+                    continue
+                address = addresses.get(index)
+                if address is None or address.version != kind[1]:
+                    break
+                key.append(int(address) >> (address.max_prefixlen - kind[2]))
+            else:
+                label = self.shapes[shape].get(tuple(key))
+                if label is not None:
+                    return label
+        for parsed, label in self.ranges:
+            if all(self.matches(kind, value, flow[index], addresses.get(index)) for index, (kind, value) in enumerate(parsed)):
+                return label
+        return None
+
+    @staticmethod
+    def matches(kind, value, flow_value, address):
+        if kind is ANY:
+            return True
+        if kind is EXACT:
+            return flow_value == value
+        if kind[0] == 'prefix':
+            return address is not None and address.version == kind[1] and \
+                int(address) >> (address.max_prefixlen - kind[2]) == value
+        return flow_value.isdigit() and kind[1] <= int(flow_value) <= kind[2]
+
+
+class CsvRuleSource:
+    """
+    Fichier CSV de règles (colonnes de FLOW_FIELDS et target, séparateur ',' ou ';').
+
+    Args:
+    name (str): Nom de la source.
+    path (str): Chemin du fichier.
+    """
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.identity = None
+        self.offset = 0
+        self.fieldnames = None
+        self.delimiter = ','
+
+    def load(self, rule_set, full):
+        """
+        Ajouter à rule_set les règles du fichier, ou seulement celles ajoutées depuis le dernier appel.
+
+        Returns:
+        bool: False si le fichier a été réécrit et doit être rechargé entièrement (full=True).
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self.identity is None:
+                return True
+            self.identity, self.offset = None, 0
+            return False
+        identity = (stat.st_dev, stat.st_ino)
+        if full or self.identity is None:
+            self.identity, self.offset, self.fieldnames = identity, 0, None
+        elif identity != self.identity or stat.st_size < self.offset:
+            return False
+        if stat.st_size == self.offset:
+            return True
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        # Une ligne en cours d'écriture sera lue au passage suivant
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return True
+        self.offset += end
+        lines = data[:end].decode('utf-8', errors='replace').splitlines()
+        if self.fieldnames is None:
+            header = lines.pop(0)
+            self.delimiter = ';' if header.count(';') > header.count(',') else ','
+            self.fieldnames = [normalize(name) for name in next(csv.reader([header], delimiter=self.delimiter))]
+            missing = [field for field in FLOW_FIELDS + ('target',) if field not in self.fieldnames]
+            if missing:
+                logger.error(f"Règles {self.path}: colonnes manquantes {', '.join(missing)}")
+                return True
+        invalid = 0
+        for row in csv.DictReader(io.StringIO('\n'.join(lines)), fieldnames=self.fieldnames, delimiter=self.delimiter):
+            label = parse_label(row.get('target') or '')
+            try:
+                if label is None:
+                    raise ValueError(row.get('target'))
+                rule_set.add(row, label)
+            except ValueError:
+                invalid += 1
+        if invalid:
+            logger.warning(f"Règles {self.path}: {invalid} lignes invalides ignorées")
+        return True
+
+
+class FalsePositiveRuleSource:
+    """
+    Corrections de la table false_positive_frames.
+
+    Args:
+    name (str): Nom de la source.
+    db_manager (DatabaseManager): Accès à la base.
+    """
+    def __init__(self, name, db_manager):
+        self.name = name
+        self.db_manager = db_manager
+        self.last_id = 0
+
+    def load(self, rule_set, full):
+        if full:
+            self.last_id = 0
+        columns = ', '.join(FLOW_FIELDS)
+        with self.db_manager.connect() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM false_positive_frames")
+                count, max_id = cursor.fetchone()
+                if max_id < self.last_id or (not full and rule_set.rules > count):
+                    # Lignes supprimées ou table vidée
+                    return False
+                cursor.execute(f"SELECT id, {columns}, prediction FROM false_positive_frames WHERE id > %s ORDER BY id",
+                               (self.last_id,))
+                rows = cursor.fetchall()
+        for row in rows:
+            self.last_id = row[0]
+            label = parse_label(row[-1] or '')
+            if label is not None:
+                try:
+                    rule_set.add(dict(zip(FLOW_FIELDS, row[1:-1])), label)
+                except ValueError:
+                    pass
+        return True
+
+
+class RuleIndex:
+    """
+    Args:
+    sources (list): Sources de règles, de la plus prioritaire à la moins prioritaire.
+    """
+    def __init__(self, sources):
+        self.sources = list(sources)
+        self.rule_sets = {source.name: RuleSet(source.name) for source in self.sources}
+        self.refresh_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config, db_manager):
+        sources = []
+        if config.get('rules_use_false_positives', True):
+            sources.append(FalsePositiveRuleSource('false_positive_frames', db_manager))
+        flux_matrix_path = config.get('rules_flux_matrix_path', './data/matrice de flux/new/dtframe.csv')
+        if flux_matrix_path:
+            sources.append(CsvRuleSource('flux_matrix', flux_matrix_path))
+        for path in config.get('rules_extra_paths', []):
+            sources.append(CsvRuleSource(path, path))
+        return cls(sources)
+
+    def refresh(self):
+        """
+        Charger les règles ajoutées à chaque source, et recompiler les sources réécrites.
+        """
+        with self.refresh_lock:
+            for source in self.sources:
+                try:
+                    rule_set = self.rule_sets[source.name]
+                    rules_before = rule_set.rules
+                    if not source.load(rule_set, full=False):
+                        rule_set = RuleSet(source.name)
+                        source.load(rule_set, full=True)
+                        self.rule_sets[source.name] = rule_set
+                        logger.info(f"Règles {source.name} recompilées: {rule_set.rules} règles")
+                    elif rule_set.rules > rules_before:
+                        logger.info(f"Règles {source.name}: {rule_set.rules - rules_before} règles ajoutées")
+                except Exception as e:
+                    logger.error(f"Erreur lors du chargement des règles {source.name}: {e}")
+
+    def watch(self, interval, stop_event):
+        while not stop_event.wait(interval):
+            self.refresh()
+
+    def lookup(self, packet_details):
+        """
+        Returns:
+        tuple: (étiquette, nom de la source) de la règle qui s'applique, None sinon.
+        """
+        flow = tuple(normalize(packet_details[field]) for field in FLOW_FIELDS)
+        rule_sets = [self.rule_sets[source.name] for source in self.sources]
+        addresses = {}
+        if any(rule_set.prefixes for rule_set in rule_sets):
+            for index in IP_INDEXES:
+                try:
+                    addresses[index] = ipaddress.ip_address(flow[index])
+                except ValueError:
+                    addresses[index] = None
+        for rule_set in rule_sets:
+            label = rule_set.lookup(flow, addresses)
+            if label is not None:
+                self.hits += 1
+                return label, rule_set.name
+        self.misses += 1
+        return None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        rule_sets = list(self.rule_sets.values())
+        return {
+            'rules': sum(rule_set.rules for rule_set in rule_sets),
+            'shapes': sum(len(rule_set.shapes) for rule_set in rule_sets),
+            'conflicts': sum(rule_set.conflicts for rule_set in rule_sets),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,310 @@
+"""
+Répartition de la capture sur plusieurs processus (capture_workers > 1).
+
+Le processus principal ne fait que lire les trames brutes (interface ou fichier) et
+les répartir selon un hachage symétrique du 5-tuple: les deux sens d'une connexion
+arrivent au même processus de travail. Chaque processus de travail décode les trames,
+tient sa propre table de flux, son cache de dédoublonnage et son lot adaptatif, puis
+renvoie ses lots au processus principal, qui les classifie et les écrit avec ses
+étapes habituelles (API, base de données). Le décodage, l'agrégation et le
+dédoublonnage ne partagent ainsi plus le GIL d'un seul processus.
+
+Les processus de travail sont créés par fork à partir du PacketProcessor du
+processus principal, avant le démarrage de ses threads: chacun en hérite une copie
+dont seuls l'étage de capture et la maintenance (expiration des flux, lots en
+attente) sont utilisés. Les trames voyagent par paquets de shard_chunk_frames pour
+amortir le coût des files entre processus.
+
+Le processus principal lit et hache chaque trame (quelques µs), les processus de travail
+la décodent et l'agrègent (plusieurs fois plus long): la répartition n'est rentable que
+si chaque processus de travail dispose d'un cœur libre en plus de celui du processus
+principal. Avec moins de capture_workers + 1 cœurs, les processus se partagent les mêmes
+cœurs et la capture répartie est plus lente qu'un seul processus; benchmark.py
+--compare-shards mesure le gain sur la machine cible.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import struct
+import threading
+import time
+import zlib
+
+from decoder import (DLT_EN10MB, DLT_IPV4, DLT_IPV6, DLT_LINUX_SLL, DLT_LINUX_SLL2, DLT_RAW, DLT_RAW_ALT, ETH_P_IP,
+                     ETH_P_IPV6, IPPROTO_TCP, IPPROTO_UDP, IPV6_EXTENSION_HEADERS, VLAN_ETHERTYPES)
+from metrics import PipelineStats
+
+logger = logging.getLogger(__name__)
+
+_unpack_h = struct.Struct('!H').unpack_from
+# Version/longueur d'en-tête, fragmentation, protocole et adresses d'un en-tête IPv4
+_unpack_ipv4 = struct.Struct('!B5xHxB2x4s4s').unpack_from
+# En-tête suivant et adresses d'un en-tête IPv6
+_unpack_ipv6 = struct.Struct('!6xBx16s16s').unpack_from
+# Les processus de travail héritent du PacketProcessor par fork, absent sous Windows
+FORK_AVAILABLE = 'fork' in multiprocessing.get_all_start_methods()
+# Compteurs des processus de travail remontés au processus principal
+WORKER_COUNTERS = ('packets_captured', 'packets_unique', 'packets_duplicate', 'packets_sampled_out', 'packets_dropped',
+                   'packets_decoder_fallback', 'flows_emitted')
+
+
+def network_offset(frame, linktype):
+    """
+    Returns:
+    tuple: (version IP, position de l'en-tête IP), ou None pour une trame non IP.
+    """
+    if linktype == DLT_EN10MB:
+        ethertype, offset = _unpack_h(frame, 12)[0], 14
+        while ethertype in VLAN_ETHERTYPES:
+            ethertype, offset = _unpack_h(frame, offset + 2)[0], offset + 4
+    elif linktype == DLT_LINUX_SLL:
+        ethertype, offset = _unpack_h(frame, 14)[0], 16
+    elif linktype == DLT_LINUX_SLL2:
+        ethertype, offset = _unpack_h(frame, 0)[0], 20
+    elif linktype in (DLT_RAW, DLT_RAW_ALT, DLT_IPV4, DLT_IPV6):
+        version = frame[0] >> 4
+        return (version, 0) if version in (4, 6) else None
+    else:
+        return None
+    if ethertype == ETH_P_IP:
+        return 4, offset
+    if ethertype == ETH_P_IPV6:
+        return 6, offset
+    return None
+
+
+def flow_hash(data, linktype):
+    """
+    Hachage symétrique (protocole, extrémités triées) d'une trame brute, identique dans
+    les deux sens d'une connexion. Les fragments non initiaux et les protocoles sans
+    ports sont hachés sur les seules adresses.
+
+    Appelé pour chaque trame par le seul processus principal: les en-têtes sont lus
+    d'un bloc (struct) et Ethernet/IPv4, le cas courant, évite network_offset.
+
+    Returns:
+    int: Hachage de la trame, 0 pour une trame non IP ou illisible.
+    """
+    try:
+        if linktype == DLT_EN10MB and data[12:14] == b'\x08\x00':
+            version, offset = 4, 14
+        else:
+            network = network_offset(data, linktype)
+            if network is None:
+                return 0
+            version, offset = network
+        if version == 4:
+            version_ihl, fragment, protocol, source, destination = _unpack_ipv4(data, offset)
+            transport = offset + (version_ihl & 0x0F) * 4 if not fragment & 0x1FFF else None
+        else:
+            protocol, source, destination = _unpack_ipv6(data, offset)
+            transport = offset + 40
+            while protocol in IPV6_EXTENSION_HEADERS:
+                protocol, transport = data[transport], transport + (data[transport + 1] + 1) * 8
+        if transport is not None and (protocol == IPPROTO_TCP or protocol == IPPROTO_UDP):
+            source += data[transport:transport + 2]
+            destination += data[transport + 2:transport + 4]
+    except (struct.error, IndexError):
+        return 0
+    if source > destination:
+        source, destination = destination, source
+    return zlib.crc32(destination, zlib.crc32(source, protocol))
+
+
+def run_worker(packet_processor, index, frames, output, counters_interval):
+    """
+    Boucle d'un processus de travail: décoder les trames reçues dans la copie du
+    PacketProcessor et renvoyer ses lots au processus principal.
+    """
+    # L'arrêt passe par le processus principal, qui envoie les dernières trames puis la fin de file
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Objets de synchronisation propres au processus, ceux hérités du fork pouvant être dans n'importe quel état
+    packet_processor.lock = threading.Lock()
+    packet_processor.packet_queue = queue.Queue(maxsize=packet_processor.packet_queue.maxsize)
+    packet_processor.stats = PipelineStats()
+    stats = packet_processor.stats
+
+    def forward_batches():
+        while True:
+            item = packet_processor.packet_queue.get()
+            if item is None:
+                break
+            output.put(('batch', index, item[1]))
+
+    def report_counters(stop_event):
+        while not stop_event.wait(counters_interval):
+            output.put(('counters', index, {name: stats.counters.get(name, 0) for name in WORKER_COUNTERS}))
+
+    stop_event = threading.Event()
+    threads = [threading.Thread(target=forward_batches, name=f'shard-{index}-forward'),
+               threading.Thread(target=packet_processor.run_maintenance, name=f'shard-{index}-maintenance'),
+               threading.Thread(target=report_counters, args=(stop_event,), name=f'shard-{index}-counters', daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            chunk = frames.get()
+            if chunk is None:
+                break
+            for data, linktype, timestamp in chunk:
+                packet_processor.process_raw_packet(data, linktype, timestamp)
+    finally:
+        # Vider la table de flux et le lot en cours vers le processus principal
+        packet_processor.stop()
+        threads[0].join()
+        threads[1].join()
+        stop_event.set()
+        output.put(('counters', index, {name: stats.counters.get(name, 0) for name in WORKER_COUNTERS}))
+        output.put(('done', index, None))
+
+
+class ShardedCapture:
+    """
+    Args:
+    packet_processor (PacketProcessor): Processeur du processus principal, dont héritent les processus de travail.
+    workers (int): Nombre de processus de travail.
+    chunk_frames (int): Nombre de trames envoyées ensemble à un processus de travail.
+    chunk_linger (float): Attente maximale (s) d'une trame avant l'envoi de son paquet incomplet.
+    queue_chunks (int): Paquets de trames en attente par processus de travail au-delà desquels la capture en direct les abandonne.
+    """
+    def __init__(self, packet_processor, workers, chunk_frames=256, chunk_linger=0.05, queue_chunks=64,
+                 counters_interval=1.0):
+        self.packet_processor = packet_processor
+        self.workers = workers
+        self.chunk_frames = chunk_frames
+        self.chunk_linger = chunk_linger
+        self.queue_chunks = queue_chunks
+        self.counters_interval = counters_interval
+        self.processes = []
+        self.frame_queues = []
+        self.output = None
+        self.merger = None
+        self.pending = [[] for _ in range(workers)]
+        self.last_flush = time.monotonic()
+        self.frames_dispatched = [0] * workers
+        self.frames_dropped = 0
+        self.worker_counters = [{} for _ in range(workers)]
+        self.started = False
+
+    @classmethod
+    def from_config(cls, packet_processor, config):
+        workers = config.get('capture_workers', 1)
+        if workers <= 1:
+            return None
+        return cls(packet_processor, workers, config.get('shard_chunk_frames', 256),
+                   config.get('shard_chunk_linger_ms', 50) / 1000, config.get('shard_queue_chunks', 64))
+
+    def start(self):
+        """
+        Créer les processus de travail. À appeler avant le démarrage des threads du pipeline.
+        """
+        if self.started:
+            return
+        cores = os.cpu_count() or 1
+        if cores <= self.workers:
+            logger.warning(f"Capture répartie sur {self.workers} processus avec {cores} cœurs: "
+                           f"sans cœur libre pour chaque processus, elle sera plus lente qu'un seul processus")
+        context = multiprocessing.get_context('fork')
+        self.output = context.Queue()
+        for index in range(self.workers):
+            frames = context.Queue(self.queue_chunks)
+            process = context.Process(target=run_worker, name=f'capture-shard-{index}', daemon=True,
+                                      args=(self.packet_processor, index, frames, self.output, self.counters_interval))
+            process.start()
+            self.frame_queues.append(frames)
+            self.processes.append(process)
+        self.merger = threading.Thread(target=self.merge_batches, name='shard-merge', daemon=True)
+        self.merger.start()
+        self.started = True
+        logger.info(f"Capture répartie sur {self.workers} processus")
+
+    def merge_batches(self):
+        """
+        Confier les lots des processus de travail aux étapes d'inférence et d'écriture du processus principal.
+        """
+        done = set()
+        while len(done) < self.workers:
+            try:
+                kind, index, payload = self.output.get(timeout=1)
+            except queue.Empty:
+                for index, process in enumerate(self.processes):
+                    if index not in done and not process.is_alive():
+                        logger.error(f"Processus de capture {index} arrêté inopinément (code {process.exitcode})")
+                        done.add(index)
+                continue
+            if kind == 'batch':
+                self.packet_processor.queue_batch(payload)
+            elif kind == 'counters':
+                # Les compteurs des processus de travail s'ajoutent à ceux du processus principal
+                stats = self.packet_processor.stats
+                previous = self.worker_counters[index]
+                if stats is not None:
+                    for name, value in payload.items():
+                        if value != previous.get(name, 0):
+                            stats.incr(name, value - previous.get(name, 0))
+                self.worker_counters[index] = payload
+            else:
+                done.add(index)
+
+    def dispatch(self, data, linktype, timestamp, lossless=False):
+        """
+        Ajouter une trame au paquet du processus de travail de son flux.
+        """
+        shard = flow_hash(data, linktype) % self.workers
+        pending = self.pending[shard]
+        pending.append((data, linktype, timestamp))
+        if len(pending) >= self.chunk_frames:
+            self.send(shard, lossless)
+        elif time.monotonic() - self.last_flush >= self.chunk_linger:
+            self.flush(lossless)
+
+    def send(self, shard, lossless=False):
+        chunk, self.pending[shard] = self.pending[shard], []
+        if not chunk:
+            return
+        if lossless:
+            self.frame_queues[shard].put(chunk)
+        else:
+            try:
+                self.frame_queues[shard].put_nowait(chunk)
+            except queue.Full:
+                # Processus de travail saturé: mieux vaut perdre des trames que retarder la capture
+                self.frames_dropped += len(chunk)
+                return
+        self.frames_dispatched[shard] += len(chunk)
+
+    def flush(self, lossless=False):
+        """
+        Envoyer les paquets incomplets, pour qu'une trame n'attende pas plus de chunk_linger secondes.
+        """
+        for shard in range(self.workers):
+            self.send(shard, lossless)
+        self.last_flush = time.monotonic()
+
+    def stop(self):
+        """
+        Envoyer les dernières trames, laisser chaque processus de travail vider ses flux et
+        son lot, puis attendre que tous leurs lots aient rejoint le processus principal.
+        """
+        if not self.started:
+            return
+        self.flush(lossless=True)
+        for frames in self.frame_queues:
+            frames.put(None)
+        self.merger.join()
+        for process in self.processes:
+            process.join()
+        self.started = False
+
+    def stats(self):
+        dispatched = sum(self.frames_dispatched)
+        return {
+            'workers': self.workers,
+            'frames_dispatched': dispatched,
+            'frames_dropped': self.frames_dropped,
+            # Part du processus le plus chargé rapportée à une répartition égale (1.0: parfaite)
+            'dispatch_imbalance': max(self.frames_dispatched) * self.workers / dispatched if dispatched else 0.0,
+        }
@@ -0,0 +1,166 @@
+"""
+Délestage de charge entre la capture et l'envoi à l'API.
+
+Le callback de capture ne doit jamais attendre une file pleine: pendant ce temps le
+noyau perd des trames sans que personne ne le sache. LoadShedder dépose les lots
+sans bloquer et applique une politique de surcharge quand la file est pleine:
+
+- drop_newest: le nouveau lot est abandonné;
+- drop_oldest: le plus ancien lot en attente est abandonné au profit du nouveau;
+- sample: échantillonnage par flux dont le taux s'adapte au remplissage de la file
+  (un flux est conservé ou écarté en entier, ses compteurs restent donc exacts),
+  puis abandon du nouveau lot si la file déborde malgré tout;
+- block: ancien comportement, l'appelant attend qu'une place se libère.
+
+Chaque paquet écarté est compté, par motif.
+"""
+import hashlib
+import queue
+import threading
+import time
+
+from flows import FlowTable
+
+OVERLOAD_POLICIES = ('drop_newest', 'drop_oldest', 'sample', 'block')
+
+# Résolution du tirage d'échantillonnage à partir de la clé de flux
+SAMPLING_SCALE = 1 << 32
+
+
+def flow_sampling_key(packet_details):
+    """
+    Renvoyer un entier sur 32 bits identique pour les deux sens d'un même flux.
+    """
+    flow_str = '\x1f'.join(str(part) for part in FlowTable.flow_key(packet_details))
+    return int.from_bytes(hashlib.blake2b(flow_str.encode('utf-8'), digest_size=4).digest(), 'big')
+
+
+class LoadShedder:
+    """
+    Args:
+    policy (str): Politique de surcharge (voir OVERLOAD_POLICIES).
+    min_sampling_rate (float): Taux d'échantillonnage minimal de la politique sample.
+    high_watermark (float): Remplissage de la file au-delà duquel le taux est divisé par deux
+    tant que la file ne se vide pas.
+    low_watermark (float): Remplissage en deçà duquel le taux remonte progressivement.
+    recovery_step (float): Augmentation du taux à chaque ajustement sous low_watermark.
+    adjust_interval (float): Délai minimal (s) entre deux ajustements, le temps que la file réagisse.
+    """
+    def __init__(self, policy='drop_oldest', min_sampling_rate=0.01, high_watermark=0.8, low_watermark=0.5,
+                 recovery_step=0.05, adjust_interval=1.0):
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Politique de surcharge inconnue: {policy} (attendu: {', '.join(OVERLOAD_POLICIES)})")
+        self.policy = policy
+        self.min_sampling_rate = min_sampling_rate
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.recovery_step = recovery_step
+        self.adjust_interval = adjust_interval
+        self.last_adjustment = None
+        self.last_fill_ratio = 0.0
+        self.sampling_rate = 1.0
+        self.packets_offered = 0
+        self.packets_sampled_out = 0
+        self.batches_dropped = 0
+        self.packets_dropped = 0
+        self.lock = threading.Lock()
+
+    def admit(self, packet_details):
+        """
+        Décider si un paquet entre dans le pipeline (politique sample uniquement).
+
+        Appelé pour chaque paquet par le seul thread de capture: packets_offered n'a qu'un
+        écrivain, et le taux, remplacé d'un bloc par adjust(), est lu sans verrou. Le verrou
+        n'est pris que pour compter un paquet écarté.
+
+        Returns:
+        bool: False si le flux du paquet est écarté par l'échantillonnage.
+        """
+        self.packets_offered += 1
+        if self.policy != 'sample':
+            return True
+        rate = self.sampling_rate
+        if rate >= 1.0:
+            return True
+        if flow_sampling_key(packet_details) < rate * SAMPLING_SCALE:
+            return True
+        with self.lock:
+            self.packets_sampled_out += 1
+        return False
+
+    def adjust(self, fill_ratio, now):
+        """
+        Adapter le taux d'échantillonnage au remplissage de la file (0 à 1).
+        """
+        if self.policy != 'sample':
+            return
+        with self.lock:
+            if self.last_adjustment is not None and now - self.last_adjustment < self.adjust_interval:
+                return
+            self.last_adjustment = now
+            draining = fill_ratio < self.last_fill_ratio
+            self.last_fill_ratio = fill_ratio
+            if fill_ratio >= self.high_watermark and not draining:
+                self.sampling_rate = max(self.min_sampling_rate, self.sampling_rate / 2)
+            elif fill_ratio <= self.low_watermark:
+                self.sampling_rate = min(1.0, self.sampling_rate + self.recovery_step)
+
+    def offer(self, packet_queue, item, block=False):
+        """
+        Déposer un lot dans la file sans bloquer, sauf politique block ou block=True.
+
+        Args:
+        packet_queue (queue.Queue): File des lots, éléments (horodatage, lot).
+        item (tuple): Élément à déposer.
+        block (bool): Attendre une place libre quelle que soit la politique (rejeu hors temps réel, arrêt).
+
+        Returns:
+        list: Lot abandonné (le nouveau ou le plus ancien), ou None.
+        """
+        if block or self.policy == 'block':
+            packet_queue.put(item)
+            return None
+        try:
+            packet_queue.put_nowait(item)
+            return None
+        except queue.Full:
+            pass
+
+        dropped = item
+        if self.policy == 'drop_oldest':
+            try:
+                oldest = packet_queue.get_nowait()
+            except queue.Empty:
+                oldest = ()
+            if oldest is None:
+                # Marqueur de fin déjà déposé: il est remis en file et le nouveau lot abandonné
+                packet_queue.put(None)
+            elif oldest:
+                dropped = oldest
+                try:
+                    packet_queue.put_nowait(item)
+                except queue.Full:
+                    # Un autre producteur a repris la place libérée: les deux lots sont perdus
+                    self._count_drop(oldest[1])
+                    self._count_drop(item[1])
+                    return oldest[1] + item[1]
+        elif self.policy == 'sample':
+            self.adjust(1.0, time.monotonic())
+        self._count_drop(dropped[1])
+        return dropped[1]
+
+    def _count_drop(self, batch):
+        with self.lock:
+            self.batches_dropped += 1
+            self.packets_dropped += len(batch)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'policy': self.policy,
+                'sampling_rate': self.sampling_rate,
+                'packets_offered': self.packets_offered,
+                'packets_sampled_out': self.packets_sampled_out,
+                'batches_dropped': self.batches_dropped,
+                'packets_dropped': self.packets_dropped,
+            }
@@ -4,10 +4,54 @@ import json
 import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import mysql.connector
+from mysql.connector import pooling
+import msgpack
 import requests
-from scapy.all import sniff, IP, IPv6, DNS, DNSQR, UDP, TCP
+from requests.adapters import HTTPAdapter
+from scapy.all import AsyncSniffer, conf, PcapReader, RawPcapReader, IP, IPv6, DNS, DNSQR, UDP, TCP
 import threading
-import hashlib
+import signal
+import socket
+import time
+import argparse
+import random
+from urllib.parse import urljoin
+from decoder import RawPacketDecoder, DLT_EN10MB
+from capture_filter import CaptureFilter, CaptureCounters
+from flows import FlowTable, FLOW_FIELDS, FLOW_COUNTERS
+from caches import BoundedCache, packet_key, entries_for_budget
+from batching import AdaptiveBatcher
+from shedding import LoadShedder
+from persistence import SpillJournal, WriteBehindWriter
+from metrics import PipelineStats, MetricsServer
+from rules import RuleIndex
+from cascade import FirstStageModel
+from embedded import EmbeddedPredictor, InferenceUnavailable
+from sharding import ShardedCapture, FORK_AVAILABLE
+from distributed import SensorForwarder, CollectorServer
+
+# Colonnes écrites seulement avec la prédiction
+PREDICTION_COLUMNS = ('prediction', 'model_version', 'decision_source')
+PERSISTED_COLUMNS = FLOW_FIELDS + PREDICTION_COLUMNS + FLOW_COUNTERS
+# Colonnes ajoutées après la création des premières bases: (nom, type, colonne précédente)
+ADDED_COLUMNS = (('model_version', 'VARCHAR(64)', 'prediction'), ('decision_source', 'VARCHAR(16)', 'model_version'),
+                 ('packets', 'INT UNSIGNED', 'decision_source'), ('bytes', 'BIGINT UNSIGNED', 'packets'),
+                 ('first_seen', 'DOUBLE', 'bytes'), ('last_seen', 'DOUBLE', 'first_seen'))
+# Tables des flux classifiés, qui enregistrent la version du modèle de chaque prédiction
+FLOW_TABLES = ('new_data', 'blocked_frames', 'passed_frames', 'false_positive_frames')
+# json (par défaut): chaînes de flux vers api_url (/predict), compris de toute version de l'API;
+# msgpack: flux structurés vers api_flows_url (/predict/flows), plus compacts, à activer par
+# "api_format": "msgpack" une fois l'API à jour
+API_FORMATS = ('json', 'msgpack')
+# http: API distante (api_url); embedded: modèle chargé dans le processus du renifleur (voir embedded.py)
+INFERENCE_MODES = ('http', 'embedded')
+# Étiquettes renvoyées par identifiant par la route /predict/flows de l'API
+API_LABELS = ('deny', 'allow')
+# standalone: capture, classification et écriture sur la même machine; sensor: capture et envoi des flux
+# au collecteur; collector: classification et écriture des flux des capteurs (voir distributed.py)
+ROLES = ('standalone', 'sensor', 'collector')
+# Plateforme de déploiement avec npcap, dont la socket de capture n'a pas de délai de réception
+WINDOWS = os.name == 'nt'
 
 class ConfigLoader:
     @staticmethod
@@ -24,25 +68,62 @@ class LoggerSetup:
         return logger
 
 class DatabaseManager:
+    """
+    Accès MySQL au travers d'un pool de connexions persistantes.
+
+    connect() emprunte une connexion au pool; la fermer (ou sortir du bloc with) la
+    rend au pool. Avec db_pool_size à 0, chaque appel ouvre une nouvelle connexion.
+    """
     def __init__(self, config):
         self.config = config['db_config']
+        self.pool_size = config.get('db_pool_size', 4)
+        self.pool_timeout = config.get('db_pool_timeout', 10)
+        self.insert_chunk_rows = config.get('db_insert_chunk_rows', 1000)
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.stats = None
         self.logger = LoggerSetup.setup_logging(config['logging_level'])
 
+    def open_connection(self, **overrides):
+        """
+        Ouvrir une connexion hors pool (paramètres de db_config remplacés par overrides).
+        """
+        return mysql.connector.connect(**{**self.config, **overrides})
+
     def connect(self):
         try:
-            return mysql.connector.connect(**self.config)
+            if not self.pool_size:
+                return self.open_connection()
+            with self.pool_lock:
+                if self.pool is None:
+                    self.pool = pooling.MySQLConnectionPool(pool_name='packet_analysis', pool_size=self.pool_size,
+                                                            pool_reset_session=False, **self.config)
+            deadline = time.monotonic() + self.pool_timeout
+            while True:
+                try:
+                    return self.pool.get_connection()
+                except mysql.connector.errors.PoolError:
+                    # Toutes les connexions sont empruntées: attendre qu'une soit rendue
+                    if time.monotonic() >= deadline:
+                        raise
+                    time.sleep(0.01)
         except mysql.connector.Error as err:
             self.logger.error(f"Erreur lors de la connexion à la base de données: {err}")
             raise
 
+    def connect_server(self):
+        """
+        Connexion sans base sélectionnée, pour vérifier ou créer la base elle-même.
+        """
+        config = {key: value for key, value in self.config.items() if key != 'database'}
+        return mysql.connector.connect(**config)
+
     def database_exists(self):
         try:
-            conn = self.connect()
-            cursor = conn.cursor()
-            cursor.execute("SHOW DATABASES LIKE %s", (self.config['database'],))
-            result = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with self.connect_server() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SHOW DATABASES LIKE %s", (self.config['database'],))
+                    result = cursor.fetchone()
             return result is not None
         except mysql.connector.Error as err:
             self.logger.error(f"Erreur lors de la vérification de l'existence de la base de données: {err}")
@@ -52,13 +133,11 @@ class DatabaseManager:
         try:
             with open(filepath, 'r') as file:
                 sql_commands = file.read()
-            conn = self.connect()
-            cursor = conn.cursor()
-            for result in cursor.execute(sql_commands, multi=True):
-                pass
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with self.connect_server() as conn:
+                with conn.cursor() as cursor:
+                    for result in cursor.execute(sql_commands, multi=True):
+                        pass
+                conn.commit()
             self.logger.info("Base de données et tables créées avec succès.")
         except Exception as e:
             self.logger.error(f"Erreur lors de l'exécution du fichier SQL {filepath}: {e}")
@@ -81,33 +160,92 @@ class DatabaseManager:
             self.logger.error(f"Erreur lors de l'effacement des tables: {err}")
 
     def insert_packets_batch(self, packet_details_list, table, include_prediction=True):
+        return self.insert_packets_batches([(table, packet_details_list, include_prediction)])
+
+    def insert_packets_batches(self, writes):
+        """
+        Insérer plusieurs lots dans une seule transaction, avec des requêtes multi-lignes.
+
+        Args:
+        writes (list): Triplets (table, liste de packet_details, include_prediction).
+
+        Returns:
+        bool: True si la transaction a été validée (ou s'il n'y avait rien à écrire).
+        """
+        writes = [write for write in writes if write[1]]
+        if not writes:
+            return True
+        stats = self.stats
         try:
-            conn = self.connect()
-            with conn.cursor() as cursor:
-                if include_prediction:
-                    placeholders = ', '.join(['%s'] * len(packet_details_list[0]))
-                    columns = ', '.join(packet_details_list[0].keys())
-                else:
-                    placeholders = ', '.join(['%s'] * (len(packet_details_list[0]) - 1))
-                    columns = ', '.join([key for key in packet_details_list[0].keys() if key != 'prediction'])
-
-                sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-                values = [
-                    [value if value != 'none' else None for key, value in packet_details.items() if include_prediction or key != 'prediction']
-                    for packet_details in packet_details_list
-                ]
-                cursor.executemany(sql, values)
+            started_at = time.perf_counter()
+            with self.connect() as conn:
+                connected_at = time.perf_counter()
+                try:
+                    with conn.cursor() as cursor:
+                        for table, packet_details_list, include_prediction in writes:
+                            self.insert_rows(cursor, table, packet_details_list, include_prediction)
+                    conn.commit()
+                except mysql.connector.Error:
+                    conn.rollback()
+                    raise
+            if stats is not None:
+                # Attente d'une connexion du pool, puis insertion et validation de la transaction
+                stats.record('db_connect', connected_at - started_at)
+                stats.record('db_insert', time.perf_counter() - connected_at)
+                stats.incr('db_transactions')
+                stats.incr('db_rows', sum(len(write[1]) for write in writes))
+            return True
+        except mysql.connector.Error as err:
+            if stats is not None:
+                stats.incr('db_errors')
+            self.logger.error(f"Erreur lors de l'insertion dans les tables {', '.join(write[0] for write in writes)}: {err}")
+            return False
+
+    def register_metrics(self, stats):
+        self.stats = stats
+        stats.gauge('sniffer_db_pool_size', "Connexions du pool de la base de données", lambda: self.pool_size)
+
+    def insert_rows(self, cursor, table, packet_details_list, include_prediction=True):
+        keys = [key for key in PERSISTED_COLUMNS if include_prediction or key not in PREDICTION_COLUMNS]
+        columns = ', '.join(keys)
+        row_placeholders = '(' + ', '.join(['%s'] * len(keys)) + ')'
+        for start in range(0, len(packet_details_list), self.insert_chunk_rows):
+            chunk = packet_details_list[start:start + self.insert_chunk_rows]
+            sql = f"INSERT INTO {table} ({columns}) VALUES {', '.join([row_placeholders] * len(chunk))}"
+            values = [
+                packet_details.get(key) if packet_details.get(key) != 'none' else None
+                for packet_details in chunk
+                for key in keys
+            ]
+            cursor.execute(sql, values)
+
+    def ensure_added_columns(self):
+        """
+        Ajouter aux tables des flux créées avant leur introduction les colonnes de ADDED_COLUMNS
+        (version du modèle, origine de la décision, compteurs du flux).
+        """
+        try:
+            with self.connect() as conn:
+                with conn.cursor() as cursor:
+                    for table in FLOW_TABLES:
+                        for column, column_type, after in ADDED_COLUMNS:
+                            cursor.execute("SELECT COUNT(*) FROM information_schema.columns "
+                                           "WHERE table_schema = %s AND table_name = %s AND column_name = %s",
+                                           (self.config['database'], table, column))
+                            if cursor.fetchone()[0] == 0:
+                                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type} AFTER {after}")
+                                self.logger.info(f"Colonne {column} ajoutée à la table {table}")
                 conn.commit()
         except mysql.connector.Error as err:
-            self.logger.error(f"Erreur lors de l'insertion dans la table {table}: {err}")
+            self.logger.error(f"Erreur lors de l'ajout des colonnes {', '.join(column for column, _, _ in ADDED_COLUMNS)}: {err}")
 
     def load_known_ports(self):
         known_ports = {}
         try:
-            conn = self.connect()
-            with conn.cursor(dictionary=True) as cursor:
-                cursor.execute("SELECT port, protocol FROM known_ports")
-                known_ports = {str(row['port']): row['protocol'] for row in cursor.fetchall()}
+            with self.connect() as conn:
+                with conn.cursor(dictionary=True) as cursor:
+                    cursor.execute("SELECT port, protocol FROM known_ports")
+                    known_ports = {str(row['port']): row['protocol'] for row in cursor.fetchall()}
         except mysql.connector.Error as err:
             self.logger.error(f"Erreur lors du chargement des ports connus: {err}")
         self.logger.info("Ports connus chargés depuis la base de données")
@@ -115,11 +253,11 @@ class DatabaseManager:
 
     def is_known_ports_table_empty(self):
         try:
-            conn = self.connect()
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT COUNT(*) FROM known_ports")
-                result = cursor.fetchone()
-                return result[0] == 0
+            with self.connect() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT COUNT(*) FROM known_ports")
+                    result = cursor.fetchone()
+                    return result[0] == 0
         except mysql.connector.Error as err:
             self.logger.error(f"Erreur lors de la vérification de la table known_ports: {err}")
             return True
@@ -145,14 +283,11 @@ class KnownPortsLoader:
 
     def insert_known_ports(self, known_ports, db_manager):
         try:
-            conn = db_manager.connect()
-            cursor = conn.cursor()
-            for port, protocol in known_ports.items():
-                sql = "INSERT INTO known_ports (port, protocol) VALUES (%s, %s) ON DUPLICATE KEY UPDATE protocol = VALUES(protocol)"
-                cursor.execute(sql, (port, protocol))
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with db_manager.connect() as conn:
+                with conn.cursor() as cursor:
+                    sql = "INSERT INTO known_ports (port, protocol) VALUES (%s, %s) ON DUPLICATE KEY UPDATE protocol = VALUES(protocol)"
+                    cursor.executemany(sql, list(known_ports.items()))
+                conn.commit()
             self.logger.info("Ports connus insérés dans la base de données")
         except mysql.connector.Error as err:
             self.logger.error(f"Erreur lors de l'insertion dans la base de données: {err}")
@@ -160,17 +295,93 @@ class KnownPortsLoader:
             self.logger.error(f"Exception lors de l'insertion dans la base de données: {e}")
 
 class PacketProcessor:
-    def __init__(self, db_manager, config):
+    def __init__(self, db_manager, config, known_ports=None):
         self.db_manager = db_manager
         self.api_url = config['api_url']
+        self.api_format = config.get('api_format', 'json')
+        if self.api_format not in API_FORMATS:
+            raise ValueError(f"api_format inconnu: {self.api_format} (attendu: {', '.join(API_FORMATS)})")
+        self.api_flows_url = config.get('api_flows_url', self.api_url.rstrip('/') + '/flows')
+        self.inference_mode = config.get('inference_mode', 'http')
+        if self.inference_mode not in INFERENCE_MODES:
+            raise ValueError(f"inference_mode inconnu: {self.inference_mode} (attendu: {', '.join(INFERENCE_MODES)})")
+        self.embedded = None
+        if self.inference_mode == 'embedded':
+            self.embedded = EmbeddedPredictor(config.get('embedded_api_path', './src/api'), config.get('embedded_api_env', {}),
+                                              config.get('api_ready_timeout', 120))
         self.batch_size = config['batch_size']
-        self.known_ports = db_manager.load_known_ports()
-        self.packet_batch = []
+        # Un capteur, sans base de données, reçoit les ports connus du fichier known_ports_path
+        self.known_ports = known_ports if known_ports is not None else db_manager.load_known_ports()
+        self.decoder = RawPacketDecoder(self.known_ports)
+        self.flow_table = None
+        if config.get('flow_aggregation', False):
+            self.flow_table = FlowTable(config.get('flow_idle_timeout', 30), config.get('flow_active_timeout', 300),
+                                        config.get('flow_table_max_flows', 100000))
+        self.last_packet_clock = None
+        self.stopped = threading.Event()
+        self.max_in_flight = max(1, config.get('api_max_in_flight', 4))
+        self.batcher = AdaptiveBatcher(self.batch_size, config.get('batch_max_size', 500),
+                                       config.get('batch_max_linger_ms', 500) / 1000, concurrency=self.max_in_flight)
         self.packet_queue = queue.Queue(maxsize=config['packet_queue_maxsize'])
-        self.processed_packets_cache = set()
-        self.api_cache = {}
+        self.result_queue = queue.Queue(maxsize=config.get('result_queue_maxsize', 50))
+        # Sans base de données (capteur), ni écriture différée ni journal de débordement
+        self.write_behind = None
+        if db_manager is not None:
+            journal = SpillJournal(config.get('spill_journal_dir', './data/spill_journal'), PERSISTED_COLUMNS,
+                                   config.get('spill_segment_max_records', 5000), config.get('spill_fsync', False))
+            self.write_behind = WriteBehindWriter(self.persist_batch, journal, config.get('write_buffer_max_records', 50000),
+                                                  config.get('write_batch_max_records', 5000), config.get('spill_retry_interval', 5))
+        self.shedder = LoadShedder(config.get('overload_policy', 'drop_oldest'), config.get('sampling_min_rate', 0.01),
+                                   config.get('overload_high_watermark', 0.8), config.get('overload_low_watermark', 0.5))
+        # Rejeu hors temps réel: la lecture du fichier ralentit plutôt que de perdre des lots
+        self.lossless = False
+        # Le budget mémoire est partagé à parts égales entre les deux caches
+        cache_entries = entries_for_budget(config.get('cache_memory_budget_mb', 64) / 2)
+        self.processed_packets_cache = BoundedCache(cache_entries, config.get('dedup_cache_ttl', 3600))
+        self.api_cache = BoundedCache(cache_entries, config.get('prediction_cache_ttl', 86400))
+        # Dernière version du modèle annoncée par l'API, qui porte les clés du cache des prédictions
+        self.model_version = None
+        # Règles déterministes consultées avant le cache et l'API (voir rules.py)
+        self.rule_index = RuleIndex.from_config(config, db_manager) if config.get('rules_enabled', False) else None
         self.lock = threading.Lock()
+        self.stats = None
+        # Part des lots dont les données envoyées à l'API et ses réponses sont journalisées (niveau DEBUG)
+        self.payload_log_sample_rate = config.get('payload_log_sample_rate', 0.0)
         self.logger = LoggerSetup.setup_logging(config['logging_level'])
+        # Premier étage de la cascade (voir cascade.py): seuls les flux moins sûrs que le seuil vont à l'API
+        self.first_stage = self.load_first_stage(config) if config.get('first_stage_enabled', False) else None
+        self.first_stage_threshold = config.get('first_stage_threshold', 0.95)
+
+    def load_first_stage(self, config):
+        path = config.get('first_stage_model_path', './data/first_stage/first_stage.npz')
+        try:
+            model = FirstStageModel.load(path)
+        except (OSError, KeyError, ValueError) as e:
+            self.logger.warning(f"Premier étage de la cascade indisponible ({path}: {e}), tous les flux sont envoyés à l'API")
+            return None
+        self.logger.info(f"Premier étage de la cascade chargé: {model.name} ({model.n_features} caractéristiques)")
+        return model
+
+    def register_metrics(self, stats):
+        """
+        Activer les mesures du pipeline et exposer les files, caches et composants en jauges.
+        """
+        self.stats = stats
+        stats.gauge('sniffer_packet_queue_depth', "Lots en attente d'envoi à l'API", self.packet_queue.qsize)
+        stats.gauge('sniffer_packet_queue_capacity', "Capacité de la file d'envoi", lambda: self.packet_queue.maxsize)
+        stats.gauge('sniffer_result_queue_depth', "Lots classifiés en attente d'écriture", self.result_queue.qsize)
+        stats.gauge('sniffer_dedup_cache', "Cache de dédoublonnage", self.processed_packets_cache.stats)
+        stats.gauge('sniffer_prediction_cache', "Cache des prédictions", self.api_cache.stats)
+        stats.gauge('sniffer_batcher', "Lot adaptatif en cours", self.batcher.stats)
+        stats.gauge('sniffer_shedding', "Délestage sous surcharge", self.shedder.stats)
+        if self.write_behind is not None:
+            stats.gauge('sniffer_write_behind', "Écriture différée et journal de débordement", self.write_behind.stats)
+        if self.embedded is not None:
+            stats.gauge('sniffer_embedded_prediction_cache', "Cache des prédictions de l'inférence intégrée", self.embedded.stats)
+        if self.rule_index is not None:
+            stats.gauge('sniffer_rules', "Index des règles déterministes", self.rule_index.stats)
+        if self.flow_table is not None:
+            stats.gauge('sniffer_flow_table_flows', "Flux actifs de la table de flux", lambda: len(self.flow_table.flows))
 
     def detect_protocol_l7(self, packet):
         if packet.haslayer(TCP) or packet.haslayer(UDP):
@@ -182,86 +393,392 @@ class PacketProcessor:
                 return self.known_ports[str(dport)]
         return 'unknown'
 
+    def extract_packet_details(self, packet):
+        protocol_l7 = self.detect_protocol_l7(packet)
+
+        return {
+            'domain': packet[DNSQR].qname.decode('utf-8').rstrip('.') if DNSQR in packet and packet.haslayer(DNS) else 'none',
+            'source_ip': packet[IP].src if packet.haslayer(IP) else (packet[IPv6].src if packet.haslayer(IPv6) else 'none'),
+            'source_port': packet[UDP].sport if packet.haslayer(UDP) else (packet[TCP].sport if packet.haslayer(TCP) else 'none'),
+            'destination_ip': packet[IP].dst if packet.haslayer(IP) else (packet[IPv6].dst if packet.haslayer(IPv6) else 'none'),
+            'destination_port': packet[UDP].dport if packet.haslayer(UDP) else (packet[TCP].dport if packet.haslayer(TCP) else 'none'),
+            'protocol': 'TCP' if packet.haslayer(TCP) else ('UDP' if packet.haslayer(UDP) else 'none'),
+            'application_layer_protocol': protocol_l7,
+            'prediction': None,
+            'model_version': None,
+            'decision_source': None
+        }
+
     def process_packet(self, packet):
+        started_at = time.perf_counter()
         try:
-            protocol_l7 = self.detect_protocol_l7(packet)
-
-            packet_details = {
-                'domain': packet[DNSQR].qname.decode('utf-8').rstrip('.') if DNSQR in packet and packet.haslayer(DNS) else 'none',
-                'source_ip': packet[IP].src if packet.haslayer(IP) else (packet[IPv6].src if packet.haslayer(IPv6) else 'none'),
-                'source_port': packet[UDP].sport if packet.haslayer(UDP) else (packet[TCP].sport if packet.haslayer(TCP) else 'none'),
-                'destination_ip': packet[IP].dst if packet.haslayer(IP) else (packet[IPv6].dst if packet.haslayer(IPv6) else 'none'),
-                'destination_port': packet[UDP].dport if packet.haslayer(UDP) else (packet[TCP].dport if packet.haslayer(TCP) else 'none'),
-                'protocol': 'TCP' if packet.haslayer(TCP) else ('UDP' if packet.haslayer(UDP) else 'none'),
-                'application_layer_protocol': protocol_l7,
-                'prediction': None
-            }
-
-            packet_hash = self.hash_packet(packet_details)
-            
-            with self.lock:
-                if packet_hash not in self.processed_packets_cache:
-                    self.processed_packets_cache.add(packet_hash)
-                    self.packet_batch.append(packet_details)
-                    if len(self.packet_batch) >= self.batch_size:
-                        self.logger.info("Taille de lot atteinte, ajout des paquets à la file d'attente...")
-                        self.packet_queue.put(self.packet_batch.copy())
-                        self.packet_batch.clear()
+            self.add_packet_details(self.extract_packet_details(packet), len(packet), float(packet.time))
+        except Exception as e:
+            self.logger.error(f"Erreur lors du traitement du paquet: {e}")
+        if self.stats is not None:
+            self.stats.record('capture', time.perf_counter() - started_at)
+            self.stats.incr('packets_captured')
+
+    def process_raw_packet(self, data, linktype, timestamp=None):
+        """
+        Traiter une trame brute avec le décodeur rapide, ou via scapy si le décodeur
+        ne sait pas la traiter à l'identique.
+
+        Args:
+        data (bytes): Octets de la trame.
+        linktype (int): Type de lien (DLT) de la capture.
+        timestamp (float): Instant de capture; par défaut l'heure courante.
+        """
+        started_at = time.perf_counter()
+        try:
+            packet_details = self.decoder.decode(data, linktype)
+            if packet_details is None:
+                packet_details = self.extract_packet_details(conf.l2types.num2layer.get(linktype, conf.raw_layer)(data))
+                if self.stats is not None:
+                    self.stats.incr('packets_decoder_fallback')
+            self.add_packet_details(packet_details, len(data), timestamp if timestamp is not None else time.time())
         except Exception as e:
             self.logger.error(f"Erreur lors du traitement du paquet: {e}")
+        if self.stats is not None:
+            self.stats.record('capture', time.perf_counter() - started_at)
+            self.stats.incr('packets_captured')
+
+    def add_packet_details(self, packet_details, length=0, timestamp=None):
+        """
+        Faire passer un paquet par l'échantillonnage, la table de flux (si activée) puis
+        vers le dédoublonnage.
+        """
+        if not self.shedder.admit(packet_details):
+            if self.stats is not None:
+                self.stats.incr('packets_sampled_out')
+            return
+        if self.flow_table is None:
+            self.enqueue_packet_details(packet_details)
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            records = self.flow_table.update(packet_details, length, timestamp)
+            self.last_packet_clock = (timestamp, time.monotonic())
+        self.enqueue_flow_records(records)
+
+    def enqueue_flow_records(self, records):
+        if self.stats is not None and records:
+            self.stats.incr('flows_emitted', len(records))
+        for record in records:
+            # Chaque enregistrement de flux est unique: un flux découpé par les délais d'expiration
+            # garde les mêmes FLOW_FIELDS mais apporte ses propres compteurs
+            self.enqueue_packet_details(record, dedup=False)
+
+    def expire_flows(self):
+        """
+        Émettre les flux inactifs. L'horloge de capture est celle du dernier paquet,
+        avancée du temps écoulé depuis, ce qui convient au direct comme au rejeu.
+        """
+        with self.lock:
+            if self.last_packet_clock is None:
+                return
+            packet_time, seen_at = self.last_packet_clock
+            records = self.flow_table.expire(packet_time + time.monotonic() - seen_at)
+        self.enqueue_flow_records(records)
+
+    def flush_lingering_batch(self):
+        with self.lock:
+            batch = self.batcher.poll(time.monotonic())
+        if batch:
+            self.queue_batch(batch)
+
+    def queue_batch(self, batch, block=False):
+        """
+        Déposer un lot dans la file d'envoi selon la politique de surcharge. Le chemin de
+        capture n'attend jamais, sauf en rejeu hors temps réel et pendant l'arrêt.
+        """
+        dropped = self.shedder.offer(self.packet_queue, (time.perf_counter(), batch),
+                                     block or self.lossless or self.stopped.is_set())
+        if dropped:
+            # Les paquets perdus pourront être proposés de nouveau à l'API
+            for packet in dropped:
+                self.processed_packets_cache.discard(packet['cache_key'])
+            if self.stats is not None:
+                self.stats.incr('packets_dropped', len(dropped))
+            self.logger.debug(f"File d'envoi pleine, lot de {len(dropped)} paquets abandonné ({self.shedder.policy})")
+
+    def overload_stats(self):
+        stats = self.shedder.stats()
+        stats['queue_depth'] = self.packet_queue.qsize()
+        return stats
+
+    def run_maintenance(self):
+        """
+        Boucle de fond: envoi des lots qui ont trop attendu, expiration des flux inactifs et
+        ajustement du taux d'échantillonnage.
+        """
+        interval = self.batcher.max_linger / 4
+        if self.flow_table is not None:
+            interval = min(interval, self.flow_table.sweep_interval)
+        next_flow_expiry = time.monotonic()
+        while not self.stopped.wait(interval):
+            if self.flow_table is not None and time.monotonic() >= next_flow_expiry:
+                self.expire_flows()
+                next_flow_expiry = time.monotonic() + self.flow_table.sweep_interval
+            self.flush_lingering_batch()
+            if self.packet_queue.maxsize:
+                self.shedder.adjust(self.packet_queue.qsize() / self.packet_queue.maxsize, time.monotonic())
+
+    def enqueue_packet_details(self, packet_details, dedup=True):
+        """
+        Mettre un paquet en lot s'il n'a pas déjà été vu. Les enregistrements de flux
+        agrégés (dedup=False) sont tous mis en lot; leur clé sert encore au cache des prédictions.
+        """
+        dedup_started_at = time.perf_counter()
+        packet_hash = self.hash_packet(packet_details)
+        packet_details['cache_key'] = packet_hash
+
+        batch = None
+        with self.lock:
+            if not dedup or self.processed_packets_cache.add(packet_hash):
+                batch = self.batcher.add(packet_details, time.monotonic())
+                if self.stats is not None:
+                    self.stats.record('dedup', time.perf_counter() - dedup_started_at)
+                    self.stats.incr('packets_unique')
+            elif self.stats is not None:
+                self.stats.record('dedup', time.perf_counter() - dedup_started_at)
+                self.stats.incr('packets_duplicate')
+        if batch:
+            self.logger.debug("Taille de lot atteinte, ajout des paquets à la file d'attente...")
+            self.queue_batch(batch)
 
     def hash_packet(self, packet):
-        packet_str = json.dumps(packet, sort_keys=True)
-        return hashlib.md5(packet_str.encode('utf-8')).hexdigest()
+        return packet_key(packet, FLOW_FIELDS)
+
+    def cache_stats(self):
+        return {'dedup': self.processed_packets_cache.stats(), 'predictions': self.api_cache.stats()}
+
+    def create_session(self):
+        """
+        Session HTTP partagée par les requêtes simultanées, avec un pool d'autant de
+        connexions persistantes que de requêtes en vol.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_in_flight, pool_block=True)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def classify_batch(self, session, packets):
+        """
+        Classifier un lot: les flux couverts par une règle déterministe sont tranchés sans
+        le modèle; pour les autres, les prédictions en cache sont celles de la dernière
+        version du modèle vue dans les réponses de l'API, un changement de version
+        invalidant le cache. Parmi les flux absents du cache, ceux que le premier étage de
+        la cascade tranche avec une confiance d'au moins first_stage_threshold ne sont pas
+        envoyés à l'API. decision_source indique l'origine de chaque prédiction.
+        """
+        if self.rule_index is not None:
+            model_packets = []
+            for packet in packets:
+                match = self.rule_index.lookup(packet)
+                if match is None:
+                    model_packets.append(packet)
+                else:
+                    packet['prediction'] = match[0]
+                    packet['decision_source'] = 'rule'
+            if self.stats is not None:
+                self.stats.incr('rule_hits', len(packets) - len(model_packets))
+                self.stats.incr('rule_misses', len(model_packets))
+            packets = model_packets
 
-    def send_packet_batch(self, session, packets):
         predictions = []
+        # Version sous laquelle le cache est consulté: les prédictions trouvées viennent de ce modèle,
+        # même si l'API en annonce un nouveau pendant le lot
+        cached_version = self.model_version
 
         for packet in packets:
-            packet_hash = self.hash_packet(packet)
-            if packet_hash in self.api_cache:
-                predictions.append(self.api_cache[packet_hash])
-            else:
-                predictions.append(None)
+            predictions.append(self.api_cache.get((cached_version, packet['cache_key'])))
 
         uncached_packets = [packet for packet, prediction in zip(packets, predictions) if prediction is None]
+        if uncached_packets and self.first_stage is not None:
+            started_at = time.perf_counter()
+            decided, uncached_packets = self.first_stage.split(uncached_packets, self.first_stage_threshold)
+            for packet, label in decided:
+                packet['prediction'] = label
+                packet['model_version'] = self.first_stage.name
+                packet['decision_source'] = 'first_stage'
+            if self.stats is not None:
+                self.stats.record('first_stage', time.perf_counter() - started_at)
+                self.stats.incr('first_stage_decided', len(decided))
+                self.stats.incr('first_stage_escalated', len(uncached_packets))
         if uncached_packets:
-            uncached_input_texts = [f"{packet['domain']} {packet['source_ip']} {packet['source_port']} {packet['destination_ip']} {packet['destination_port']} {packet['protocol']} {packet['application_layer_protocol']}" for packet in uncached_packets]
             try:
-                self.logger.info(f"Envoi de la requête à l'API avec cet input : {uncached_input_texts}")
-                response = session.post(self.api_url, json={'input_text': uncached_input_texts})
-                response.raise_for_status()
-                results = response.json()
-                self.logger.info(f"Résultats reçus de l'API: {results}")
-
-                for packet, result in zip(uncached_packets, results.get('predictions', [])):
-                    packet_hash = self.hash_packet(packet)
-                    self.api_cache[packet_hash] = result
+                api_started_at = time.perf_counter()
+                results, model_version = self.request_predictions(session, uncached_packets)
+                self.model_version = model_version
+                api_elapsed = time.perf_counter() - api_started_at
+                with self.lock:
+                    self.batcher.observe_latency(api_elapsed)
+                if self.stats is not None:
+                    self.stats.record('api', api_elapsed)
+                    self.stats.incr('api_requests')
+
+                for packet, result in zip(uncached_packets, results):
+                    self.api_cache.set((model_version, packet['cache_key']), result)
                     packet['prediction'] = result
+                    packet['model_version'] = model_version
+                    packet['decision_source'] = 'model'
             except requests.RequestException as e:
                 self.logger.error(f"Erreur de requête lors de l'appel à l'API: {e}")
+            except InferenceUnavailable as e:
+                self.logger.error(f"Inférence intégrée indisponible: {e}")
 
         for packet, prediction in zip(packets, predictions):
             if prediction is not None:
                 packet['prediction'] = prediction
+                packet['model_version'] = cached_version
+                packet['decision_source'] = 'model'
+
+    def request_predictions(self, session, packets):
+        """
+        Interroger l'API pour des paquets, en JSON (chaînes de flux, route /predict) ou
+        en msgpack (flux structurés, route /predict/flows, étiquettes par identifiant),
+        ou, en inférence intégrée, appeler directement la prédiction de l'API.
+
+        Returns:
+        tuple: (prédictions 'allow' ou 'deny' dans l'ordre des paquets, version du modèle de l'API).
+        """
+        debug = self.payload_log_sample_rate > 0 and self.logger.isEnabledFor(logging.DEBUG) \
+            and random.random() < self.payload_log_sample_rate
+        if self.embedded is not None:
+            return self.embedded.predict([[None if packet[field] == 'none' else packet[field] for field in FLOW_FIELDS]
+                                          for packet in packets])
+        if self.api_format == 'msgpack':
+            records = [[None if packet[field] == 'none' else packet[field] for field in FLOW_FIELDS] for packet in packets]
+            if debug:
+                self.logger.debug(f"Envoi de la requête à l'API avec ces flux : {records}")
+            response = session.post(self.api_flows_url, data=msgpack.packb(records),
+                                    headers={'Content-Type': 'application/msgpack'})
+            response.raise_for_status()
+            results = msgpack.unpackb(response.content, raw=False)
+            if debug:
+                self.logger.debug(f"Résultats reçus de l'API: {results}")
+            return [API_LABELS[label] for label in results['labels']], results.get('model_version')
 
-        self.db_manager.insert_packets_batch(packets, 'new_data')
+        input_texts = [' '.join(str(packet[field]) for field in FLOW_FIELDS) for packet in packets]
+        if debug:
+            self.logger.debug(f"Envoi de la requête à l'API avec cet input : {input_texts}")
+        response = session.post(self.api_url, json={'input_text': input_texts})
+        response.raise_for_status()
+        results = response.json()
+        if debug:
+            self.logger.debug(f"Résultats reçus de l'API: {results}")
+        return results.get('predictions', []), results.get('model_version')
 
+    def persist_batch(self, packets):
+        """
+        Écrire des enregistrements classifiés dans new_data et blocked_frames/passed_frames.
+
+        Returns:
+        bool: True si la transaction a été validée.
+        """
+        db_started_at = time.perf_counter()
         blocked_packets = [packet for packet in packets if packet['prediction'] == "deny"]
         passed_packets = [packet for packet in packets if packet['prediction'] != "deny"]
 
-        if blocked_packets:
-            self.db_manager.insert_packets_batch(blocked_packets, 'blocked_frames')
-        if passed_packets:
-            self.db_manager.insert_packets_batch(passed_packets, 'passed_frames')
+        try:
+            persisted = self.db_manager.insert_packets_batches([
+                ('new_data', packets, True),
+                ('blocked_frames', blocked_packets, True),
+                ('passed_frames', passed_packets, True),
+            ])
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'écriture du lot: {e}")
+            persisted = False
+        if self.stats is not None:
+            self.stats.record('db', time.perf_counter() - db_started_at)
+            if persisted:
+                self.stats.incr('packets_persisted', len(packets))
+        return persisted
+
+    def dispatch_batch(self, session, in_flight, sequence, packets):
+        """
+        Classifier un lot dans un thread du pool puis le confier à l'étape d'écriture,
+        même en cas d'erreur afin de ne pas bloquer les lots suivants.
+        """
+        try:
+            self.classify_batch(session, packets)
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la classification du lot {sequence}: {e}")
+        finally:
+            self.result_queue.put((sequence, packets))
+            in_flight.release()
 
     def send_packet_batches(self):
-        session = requests.Session()
+        """
+        Étape d'inférence: jusqu'à max_in_flight lots sont classifiés simultanément.
+        Les lots sont numérotés dans leur ordre de sortie de la file pour que l'étape
+        d'écriture les persiste dans ce même ordre.
+        """
+        session = self.create_session()
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        sequence = 0
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='api') as executor:
+            while True:
+                item = self.packet_queue.get()
+                if item is None:
+                    break
+                enqueued_at, batch = item
+                if self.stats is not None:
+                    self.stats.record('batch', time.perf_counter() - enqueued_at)
+                    self.stats.incr('batches')
+                in_flight.acquire()
+                executor.submit(self.dispatch_batch, session, in_flight, sequence, batch)
+                sequence += 1
+        session.close()
+        self.result_queue.put(None)
+
+    def write_results(self):
+        """
+        Étape d'écriture: remettre les lots classifiés dans leur ordre d'envoi, ce qui
+        préserve l'ordre des enregistrements de chaque flux malgré les réponses
+        désordonnées de l'API, puis les confier sans attente à l'écriture différée.
+        """
+        pending = {}
+        next_sequence = 0
         while True:
-            batch = self.packet_queue.get()
-            if batch is None:
+            item = self.result_queue.get()
+            if item is None:
                 break
-            self.send_packet_batch(session, batch)
+            sequence, packets = item
+            pending[sequence] = packets
+            while next_sequence in pending:
+                self.write_behind.submit(pending.pop(next_sequence))
+                next_sequence += 1
+        for sequence in sorted(pending):
+            self.write_behind.submit(pending[sequence])
+        self.write_behind.stop()
+
+    def persist_writes(self):
+        """
+        Thread d'écriture en base: vider le tampon par gros lots et rejouer le journal de débordement.
+        """
+        self.write_behind.run()
+
+    def stop(self):
+        """
+        Vider la table de flux, envoyer le lot partiel restant puis signaler la fin à l'étape
+        d'inférence, qui la transmet à l'étape d'écriture.
+        """
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        if self.flow_table is not None:
+            with self.lock:
+                records = self.flow_table.flush()
+            self.enqueue_flow_records(records)
+        with self.lock:
+            batch = self.batcher.take()
+        if batch:
+            self.queue_batch(batch, block=True)
+        self.packet_queue.put(None)
 
     def reset_caches(self):
         with self.lock:
@@ -270,24 +787,329 @@ class PacketProcessor:
         self.logger.info("Caches réinitialisés.")
 
 class Sniffer:
-    def __init__(self, packet_processor):
+    def __init__(self, packet_processor, config):
         self.packet_processor = packet_processor
+        self.fast_decoder = config.get('fast_decoder', False)
+        self.replay_pcap_path = config.get('replay_pcap_path')
+        self.replay_realtime = config.get('replay_realtime', False)
+        self.interface = config.get('capture_interface')
+        self.capture_filter = CaptureFilter(config)
+        self.capture_stats_interval = config.get('capture_stats_interval', 60)
+        # Répartition du décodage, des flux et du dédoublonnage sur capture_workers processus (voir sharding.py)
+        self.shards = ShardedCapture.from_config(packet_processor, config)
+        self.counters = None
+        self.async_sniffer = None
+        self.stop_event = threading.Event()
         self.logger = LoggerSetup.setup_logging(config['logging_level'])
 
+    def register_metrics(self, stats):
+        stats.gauge('sniffer_capture', "Compteurs de capture de l'interface (capture en direct)",
+                    lambda: self.counters.snapshot() if self.counters is not None else {})
+        if self.shards is not None:
+            stats.gauge('sniffer_shards', "Répartition de la capture sur plusieurs processus", self.shards.stats)
+
+    def start_workers(self):
+        """
+        Créer les processus de capture répartie, avant le démarrage des threads du pipeline.
+        """
+        if self.shards is not None:
+            self.shards.start()
+
     def start_sniffing(self):
+        if self.replay_pcap_path:
+            self.replay(self.replay_pcap_path, self.replay_realtime)
+            self.packet_processor.stop()
+            return
         self.logger.info("Démarrage de la capture du trafic réseau...")
-        sniff(prn=self.packet_processor.process_packet, store=False)
+        if self.capture_filter.expression:
+            self.logger.info(f"Filtre de capture BPF: {self.capture_filter.expression}")
+        sock = conf.L2listen(iface=self.interface, filter=self.capture_filter.expression)
+        self.counters = CaptureCounters(self.interface or conf.iface)
+        stop_event = threading.Event()
+        threading.Thread(target=self.report_capture_stats, args=(sock, stop_event), daemon=True).start()
+        try:
+            if self.shards is not None:
+                self.sniff_sharded(sock)
+            elif self.fast_decoder:
+                self.sniff_raw(sock)
+            else:
+                self.async_sniffer = AsyncSniffer(opened_socket=sock, prn=self.deliver_packet, store=False)
+                self.async_sniffer.start()
+                if self.stop_event.is_set():
+                    self.async_sniffer.stop(join=False)
+                self.async_sniffer.join()
+        finally:
+            stop_event.set()
+            self.counters.poll_socket(sock)
+            self.log_capture_stats()
+            sock.close()
+
+    def deliver_packet(self, packet):
+        self.counters.delivered += 1
+        self.packet_processor.process_packet(packet)
+
+    def sniff_raw(self, sock):
+        """
+        Capturer les trames sans dissection scapy et les confier au décodeur rapide.
+        """
+        counters = self.counters
+        # Délai de réception pour pouvoir observer la demande d'arrêt sur un lien calme
+        sock.ins.settimeout(0.5)
+        while not self.stop_event.is_set():
+            try:
+                cls, data, timestamp = sock.recv_raw()
+            except socket.timeout:
+                continue
+            if data is None:
+                continue
+            counters.delivered += 1
+            self.packet_processor.process_raw_packet(data, conf.l2types.layer2num.get(cls, DLT_EN10MB), timestamp)
+
+    def sniff_sharded(self, sock):
+        """
+        Capturer les trames brutes et les répartir entre les processus de travail, puis,
+        une fois la capture arrêtée, attendre leurs derniers lots avant de clore le pipeline.
+        """
+        counters = self.counters
+        sock.ins.settimeout(self.shards.chunk_linger)
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    cls, data, timestamp = sock.recv_raw()
+                except socket.timeout:
+                    self.shards.flush()
+                    continue
+                if data is None:
+                    continue
+                counters.delivered += 1
+                self.shards.dispatch(data, conf.l2types.layer2num.get(cls, DLT_EN10MB), timestamp)
+        finally:
+            self.shards.stop()
+            self.packet_processor.stop()
+
+    def stop(self):
+        """
+        Interrompre la capture en direct ou le rejeu en cours.
+        """
+        self.stop_event.set()
+        if self.async_sniffer is not None and self.async_sniffer.running:
+            self.async_sniffer.stop(join=False)
+
+    def report_capture_stats(self, sock, stop_event):
+        while not stop_event.wait(self.capture_stats_interval):
+            self.counters.poll_socket(sock)
+            self.log_capture_stats()
+
+    def log_capture_stats(self):
+        self.logger.info(f"Statistiques de capture: {self.counters.snapshot()}")
+        overload = self.packet_processor.overload_stats()
+        if overload['packets_dropped'] or overload['packets_sampled_out']:
+            self.logger.warning(f"Délestage sous surcharge: {overload}")
+        else:
+            self.logger.info(f"Délestage sous surcharge: {overload}")
+
+    def replay(self, pcap_path, realtime=False):
+        """
+        Rejouer un fichier pcap/pcapng dans le pipeline.
+
+        Args:
+        pcap_path (str): Chemin du fichier de capture.
+        realtime (bool): Respecter l'espacement d'origine des trames au lieu de rejouer au plus vite.
+
+        Returns:
+        int: Nombre de trames rejouées.
+        """
+        self.logger.info(f"Rejeu de la capture {pcap_path} ({'temps réel' if realtime else 'au plus vite'})...")
+        # Au plus vite, aucune trame n'est perdue par le noyau: la lecture suit le rythme de l'API
+        self.packet_processor.lossless = not realtime
+        count = 0
+        first_capture_time = None
+        replay_started_at = time.perf_counter()
+        for capture_time, frame, linktype in self._read_capture(pcap_path, raw=self.shards is not None):
+            if self.stop_event.is_set():
+                break
+            if realtime:
+                if first_capture_time is None:
+                    first_capture_time = capture_time
+                delay = (capture_time - first_capture_time) - (time.perf_counter() - replay_started_at)
+                if delay > 0:
+                    time.sleep(delay)
+            if self.shards is not None:
+                self.shards.dispatch(frame, linktype, capture_time, lossless=not realtime)
+            elif linktype is None:
+                self.packet_processor.process_packet(frame)
+            else:
+                self.packet_processor.process_raw_packet(frame, linktype, capture_time)
+            count += 1
+        if self.shards is not None:
+            self.shards.stop()
+        elapsed = time.perf_counter() - replay_started_at
+        self.logger.info(f"Rejeu terminé: {count} trames en {elapsed:.2f}s ({count / elapsed if elapsed > 0 else 0:.0f} trames/s)")
+        self.logger.info(f"Délestage sous surcharge: {self.packet_processor.overload_stats()}")
+        return count
+
+    def _read_capture(self, pcap_path, raw=False):
+        """
+        Parcourir une capture en produisant (horodatage, trame, type de lien) pour chaque trame.
+
+        Avec le décodeur rapide ou raw, les trames sont lues brutes (RawPcapReader) sans
+        dissection; sinon ce sont des paquets scapy et le type de lien vaut None.
+        """
+        if not (self.fast_decoder or raw):
+            with PcapReader(pcap_path) as reader:
+                for packet in reader:
+                    yield float(packet.time), packet, None
+            return
+        with RawPcapReader(pcap_path) as reader:
+            for data, metadata in reader:
+                linktype = getattr(metadata, 'linktype', None)
+                if linktype is None:
+                    linktype = reader.linktype
+                if hasattr(metadata, 'tsresol'):
+                    capture_time = ((metadata.tshigh << 32) + metadata.tslow) / metadata.tsresol
+                else:
+                    capture_time = metadata.sec + metadata.usec / (1e9 if reader.nano else 1e6)
+                yield capture_time, data, linktype
 
 class MainApp:
     def __init__(self, config):
+        self.role = config.get('role', 'standalone')
+        if self.role not in ROLES:
+            raise ValueError(f"role inconnu: {self.role} (attendu: {', '.join(ROLES)})")
+        if self.role == 'sensor':
+            # Le capteur ne classifie ni n'écrit: ni base de données, ni API, ni règles, ni premier étage
+            config = dict(config, rules_enabled=False, first_stage_enabled=False, inference_mode='http')
+        if self.role != 'collector' and config.get('capture_workers', 1) > 1 and config.get('inference_mode', 'http') == 'embedded':
+            # Le modèle intégré démarre ses threads dès la création du PacketProcessor: les processus de capture
+            # créés ensuite par fork pourraient hériter de verrous tenus (journalisation, imports)
+            raise ValueError("capture_workers > 1 est incompatible avec inference_mode \"embedded\"")
+        if self.role != 'collector':
+            self.check_platform(config)
         self.config = config
         self.logger = LoggerSetup.setup_logging(config['logging_level'])
-        self.db_manager = DatabaseManager(config)
         self.known_ports_loader = KnownPortsLoader(config)
-        self.packet_processor = PacketProcessor(self.db_manager, config)
-        self.sniffer = Sniffer(self.packet_processor)
+        self.db_manager = None
+        self.forwarder = None
+        self.collector = None
+        self.sniffer = None
+        if self.role == 'sensor':
+            self.packet_processor = PacketProcessor(None, config, self.known_ports_loader.load_known_ports() or {})
+            self.forwarder = SensorForwarder(self.packet_processor, config)
+        else:
+            self.db_manager = DatabaseManager(config)
+            self.packet_processor = PacketProcessor(self.db_manager, config)
+        if self.role == 'collector':
+            self.collector = CollectorServer(self.packet_processor, config.get('collector_host', '127.0.0.1'),
+                                             config.get('collector_port', 9109), config.get('collector_token') or None)
+        else:
+            self.sniffer = Sniffer(self.packet_processor, config)
+        self.stats = None
+        self.metrics_server = None
+        self.metrics_stop = threading.Event()
+        self.rules_stop = threading.Event()
+        if config.get('metrics_enabled', True):
+            self.stats = PipelineStats()
+            for component in (self.sniffer, self.packet_processor, self.db_manager, self.forwarder, self.collector):
+                if component is not None:
+                    component.register_metrics(self.stats)
+
+    @staticmethod
+    def check_platform(config):
+        """
+        Refuser au démarrage les modes de capture que la plateforme ne permet pas, plutôt
+        que d'échouer plus tard avec une erreur peu claire.
+        """
+        if config.get('capture_workers', 1) > 1 and not FORK_AVAILABLE:
+            raise ValueError("capture_workers > 1 nécessite la création des processus par fork, indisponible sur cette "
+                             "plateforme (Windows): utiliser capture_workers = 1")
+        if WINDOWS and config.get('fast_decoder', False) and not config.get('replay_pcap_path'):
+            raise ValueError("fast_decoder n'est pas disponible en capture directe sous Windows (socket npcap sans délai "
+                             "de réception): utiliser la dissection scapy, le décodeur rapide restant disponible en rejeu")
+
+    def wait_for_api(self):
+        """
+        Attendre que l'API ait chargé et préchauffé son modèle (route /ready), pour que les
+        premiers lots ne subissent pas le démarrage du modèle. Passé api_ready_timeout
+        secondes, la capture démarre quand même. En inférence intégrée, c'est le modèle
+        chargé dans le processus qui est attendu.
+        """
+        embedded = self.packet_processor.embedded
+        if embedded is not None:
+            started_at = time.monotonic()
+            if embedded.wait_ready(self.config.get('api_ready_timeout', 120)):
+                self.logger.info(f"Modèle intégré prêt après {time.monotonic() - started_at:.1f}s d'attente")
+                return True
+            self.logger.warning(f"Modèle intégré non prêt (statut: {embedded.status()['status']}), démarrage de la capture")
+            return False
+        ready_url = self.config.get('api_ready_url') or urljoin(self.config['api_url'], '/ready')
+        timeout = self.config.get('api_ready_timeout', 120)
+        deadline = time.monotonic() + timeout
+        started_at = time.monotonic()
+        status = None
+        while time.monotonic() < deadline:
+            try:
+                response = requests.get(ready_url, timeout=2)
+                if response.ok:
+                    self.logger.info(f"API prête après {time.monotonic() - started_at:.1f}s d'attente")
+                    return True
+                status = response.json().get('status')
+                if status == 'failed':
+                    break
+            except (requests.RequestException, ValueError):
+                pass
+            time.sleep(1)
+        self.logger.warning(f"API non prête (statut: {status}) après {time.monotonic() - started_at:.0f}s, démarrage de la capture")
+        return False
+
+    def start_metrics(self):
+        """
+        Exposer les métriques en HTTP local (metrics_port, 0: désactivé) et journaliser un
+        résumé toutes les metrics_log_interval secondes (0: désactivé).
+        """
+        if self.stats is None:
+            return
+        port = self.config.get('metrics_port', 9108)
+        if port:
+            try:
+                self.metrics_server = MetricsServer(self.stats, self.config.get('metrics_host', '127.0.0.1'), port)
+                self.metrics_server.start()
+            except OSError as e:
+                self.logger.error(f"Impossible d'exposer les métriques sur le port {port}: {e}")
+        interval = self.config.get('metrics_log_interval', 60)
+        if interval:
+            threading.Thread(target=self.log_metrics, args=(interval,), name='metrics-log', daemon=True).start()
+
+    def log_metrics(self, interval):
+        while not self.metrics_stop.wait(interval):
+            self.logger.info(f"Pipeline: {self.stats.summary_line()}")
+
+    def stop_metrics(self):
+        self.metrics_stop.set()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.stats is not None:
+            self.logger.info(f"Pipeline: {self.stats.summary_line()}")
+
+    def start_rules(self):
+        """
+        Compiler les règles déterministes puis charger leurs ajouts toutes les
+        rules_refresh_interval secondes (0: chargement au démarrage seulement).
+        """
+        rule_index = self.packet_processor.rule_index
+        if rule_index is None:
+            return
+        started_at = time.perf_counter()
+        rule_index.refresh()
+        self.logger.info(f"Règles déterministes compilées en {time.perf_counter() - started_at:.2f}s: {rule_index.stats()['rules']} règles")
+        interval = self.config.get('rules_refresh_interval', 30)
+        if interval:
+            threading.Thread(target=rule_index.watch, args=(interval, self.rules_stop), name='rules-refresh', daemon=True).start()
 
     def run(self):
+        if self.role == 'sensor':
+            self.run_sensor()
+            return
+
         if not self.db_manager.database_exists():
             self.logger.info("La base de données n'existe pas, création de la base de données...")
             self.db_manager.execute_sql_file(config['sql_file_path'])
@@ -298,6 +1120,8 @@ class MainApp:
             if known_ports:
                 self.known_ports_loader.insert_known_ports(known_ports, self.db_manager)
         
+        self.db_manager.ensure_added_columns()
+
         try:
             self.packet_processor.reset_caches()
 
@@ -305,19 +1129,101 @@ class MainApp:
                 tables_to_keep = self.config['tables_to_keep']
                 self.db_manager.truncate_tables(conn, tables_to_keep)
 
-            with ThreadPoolExecutor(max_workers=3) as executor:
-                futures = [executor.submit(self.packet_processor.send_packet_batches), executor.submit(self.sniffer.start_sniffing)]
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        self.logger.error(f"Erreur dans l'exécution du thread: {e}")
+            if self.sniffer is not None:
+                self.sniffer.start_workers()
+            self.start_rules()
+            self.wait_for_api()
+            self.start_metrics()
+
+            signal.signal(signal.SIGTERM, self.handle_sigterm)
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                futures = [executor.submit(self.packet_processor.send_packet_batches), executor.submit(self.packet_processor.write_results),
+                           executor.submit(self.packet_processor.persist_writes), executor.submit(self.packet_processor.run_maintenance)]
+                if self.collector is not None:
+                    self.collector.start()
+                else:
+                    futures.append(executor.submit(self.sniffer.start_sniffing))
+                try:
+                    self.wait_for(futures)
+                except KeyboardInterrupt:
+                    self.logger.info("Arrêt demandé, envoi des lots en cours...")
+                    self.shutdown()
+                    self.wait_for(futures)
+        except Exception as e:
+            self.logger.error(f"Erreur dans la fonction principale: {e}")
+        finally:
+            self.rules_stop.set()
+            self.stop_metrics()
+
+    def run_sensor(self):
+        """
+        Capteur: capturer les flux (agrégés avec flow_aggregation) puis les envoyer au
+        collecteur, sans base de données ni API. Les lots que le collecteur ne reçoit pas sont gardés dans le journal
+        local et renvoyés à son retour.
+        """
+        self.logger.info(f"Capteur {self.forwarder.name}: envoi des flux à {self.forwarder.collector_url}")
+        try:
+            self.sniffer.start_workers()
+            self.start_metrics()
+
+            signal.signal(signal.SIGTERM, self.handle_sigterm)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(self.forwarder.forward_batches), executor.submit(self.forwarder.send_batches),
+                           executor.submit(self.sniffer.start_sniffing), executor.submit(self.packet_processor.run_maintenance)]
+                try:
+                    self.wait_for(futures)
+                except KeyboardInterrupt:
+                    self.logger.info("Arrêt demandé, envoi des lots en cours au collecteur...")
+                    self.shutdown()
+                    self.wait_for(futures)
         except Exception as e:
             self.logger.error(f"Erreur dans la fonction principale: {e}")
+        finally:
+            self.stop_metrics()
+
+    def wait_for(self, futures):
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                self.logger.error(f"Erreur dans l'exécution du thread: {e}")
+
+    def shutdown(self):
+        """
+        Arrêter la capture puis vider la table de flux et le lot en cours vers l'API et la base.
+        En capture répartie, c'est la capture qui clôt le pipeline une fois les derniers lots
+        des processus de travail reçus. Le collecteur cesse d'abord de recevoir des flux.
+        """
+        if self.collector is not None:
+            self.collector.stop()
+            self.packet_processor.stop()
+            return
+        self.sniffer.stop()
+        if self.sniffer.shards is None:
+            self.packet_processor.stop()
+
+    @staticmethod
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture et classification du trafic réseau")
+    parser.add_argument('--config', default='./src/sniffing/config.json', help="Chemin du fichier de configuration")
+    parser.add_argument('--replay', help="Rejouer un fichier pcap/pcapng au lieu de capturer sur l'interface")
+    parser.add_argument('--realtime', action='store_true', help="Rejouer en respectant l'espacement d'origine des trames")
+    parser.add_argument('--fast-decoder', action='store_true', help="Décoder les en-têtes à partir des octets bruts au lieu de la dissection scapy")
+    parser.add_argument('--role', choices=ROLES, help="Rôle de cette instance (remplace role de la configuration)")
+    args = parser.parse_args()
     try:
-        config = ConfigLoader.load_config('./src/sniffing/config.json')
+        config = ConfigLoader.load_config(args.config)
+        if args.replay:
+            config['replay_pcap_path'] = args.replay
+        if args.realtime:
+            config['replay_realtime'] = True
+        if args.fast_decoder:
+            config['fast_decoder'] = True
+        if args.role:
+            config['role'] = args.role
         app = MainApp(config)
         app.run()
     except KeyboardInterrupt:
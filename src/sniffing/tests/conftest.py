@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Les modules du renifleur s'importent par leur nom, comme depuis src/sniffing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
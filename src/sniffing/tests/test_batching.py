@@ -0,0 +1,46 @@
+from batching import AdaptiveBatcher
+
+
+def test_batch_leaves_at_target_size():
+    batcher = AdaptiveBatcher(3, 100, max_linger=0.5)
+    assert batcher.add('a', 0.0) is None
+    assert batcher.add('b', 0.0) is None
+    assert batcher.add('c', 0.0) == ['a', 'b', 'c']
+    assert batcher.stats()['pending'] == 0
+
+
+def test_partial_batch_leaves_after_max_linger():
+    batcher = AdaptiveBatcher(10, 100, max_linger=0.5)
+    batcher.add('a', 0.0)
+    batcher.add('b', 0.3)
+    assert batcher.poll(0.49) is None
+    assert batcher.poll(0.5) == ['a', 'b']
+    assert batcher.poll(10.0) is None
+
+
+def test_target_grows_with_arrival_rate_and_latency():
+    batcher = AdaptiveBatcher(10, 500, max_linger=0.5, smoothing=1.0, headroom=2.0)
+    # 1000 éléments/s pendant une fenêtre d'une seconde, appels API de 100 ms
+    for index in range(1000):
+        batcher.add(index, index / 999)
+    batcher.observe_latency(0.1)
+    assert batcher.target_size == 200
+
+
+def test_target_is_shared_between_concurrent_requests_and_bounded():
+    batcher = AdaptiveBatcher(10, 500, max_linger=0.5, smoothing=1.0, headroom=2.0, concurrency=4)
+    for index in range(1000):
+        batcher.add(index, index / 999)
+    batcher.observe_latency(0.1)
+    assert batcher.target_size == 50
+    batcher.observe_latency(10.0)
+    assert batcher.target_size == 500
+    batcher.observe_latency(0.001)
+    assert batcher.target_size == 10
+
+
+def test_target_stays_at_minimum_without_latency():
+    batcher = AdaptiveBatcher(10, 500, max_linger=0.5, smoothing=1.0)
+    for index in range(2000):
+        batcher.add(index, index / 999)
+    assert batcher.target_size == 10
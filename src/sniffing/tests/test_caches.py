@@ -0,0 +1,62 @@
+import pytest
+
+import caches
+from caches import BoundedCache, entries_for_budget, packet_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caches.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = BoundedCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = BoundedCache(10, ttl=5)
+    cache.set('a', 1)
+    clock[0] += 4.9
+    assert cache.get('a') == 1
+    clock[0] += 0.1
+    assert cache.get('a') is None
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 1
+
+
+def test_add_reports_new_and_expired_keys(clock):
+    cache = BoundedCache(10, ttl=5)
+    assert cache.add('k')
+    assert not cache.add('k')
+    clock[0] += 5
+    assert cache.add('k')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+def test_discard_allows_a_key_to_be_added_again():
+    cache = BoundedCache(10)
+    cache.add('k')
+    cache.discard('k')
+    assert cache.add('k')
+
+
+def test_packet_key_is_stable_and_field_sensitive():
+    details = {'source_ip': '10.0.0.1', 'source_port': 80}
+    assert packet_key(details, ('source_ip', 'source_port')) == packet_key(dict(details), ('source_ip', 'source_port'))
+    assert packet_key(details, ('source_ip', 'source_port')) != packet_key(dict(details, source_port=81), ('source_ip', 'source_port'))
+    assert 0 <= packet_key(details, ('source_ip',)) < 2 ** 64
+
+
+def test_entries_for_budget():
+    assert entries_for_budget(1) == 1024 * 1024 // caches.ENTRY_SIZE_BYTES
+    assert entries_for_budget(0) == 1
@@ -0,0 +1,40 @@
+import pytest
+
+from capture_filter import CaptureFilter
+
+CONFIG = {'api_url': 'http://api.local:5000/predict', 'db_config': {'host': 'db.local', 'port': 3307}}
+ADDRESSES = {'api.local': ['10.0.0.2'], 'db.local': ['10.0.0.3', '10.0.0.4'], 'collector.local': ['10.0.0.9']}
+
+
+@pytest.fixture(autouse=True)
+def resolve(monkeypatch):
+    monkeypatch.setattr(CaptureFilter, 'resolve', staticmethod(lambda host: ADDRESSES.get(host, [])))
+
+
+def test_pipeline_traffic_is_excluded():
+    assert CaptureFilter(CONFIG).build_expression() == (
+        'not (host 10.0.0.2 and tcp port 5000) and not (host 10.0.0.3 and tcp port 3307)'
+        ' and not (host 10.0.0.4 and tcp port 3307)')
+
+
+def test_user_filter_is_combined_with_the_exclusions():
+    capture_filter = CaptureFilter(dict(CONFIG, capture_filter=' tcp or udp ', db_config={}))
+    assert capture_filter.build_expression() == '(tcp or udp) and not (host 10.0.0.2 and tcp port 5000)'
+
+
+def test_default_ports_follow_the_url_scheme():
+    capture_filter = CaptureFilter(dict(CONFIG, api_url='https://api.local/predict', db_config={'host': 'db.local'}))
+    assert capture_filter.endpoints == [('10.0.0.2', 443), ('10.0.0.3', 3306), ('10.0.0.4', 3306)]
+
+
+def test_no_expression_without_filter_or_exclusion():
+    capture_filter = CaptureFilter(dict(CONFIG, exclude_pipeline_traffic=False))
+    assert capture_filter.build_expression() is None
+    capture_filter = CaptureFilter(dict(CONFIG, exclude_pipeline_traffic=False, capture_filter='port 53'))
+    assert capture_filter.build_expression() == '(port 53)'
+
+
+def test_sensor_also_excludes_its_collector():
+    config = dict(CONFIG, role='sensor', collector_url='http://collector.local:8100/flows', db_config={})
+    assert ('10.0.0.9', 8100) in CaptureFilter(config).endpoints
+    assert ('10.0.0.9', 8100) not in CaptureFilter(dict(config, role='standalone')).endpoints
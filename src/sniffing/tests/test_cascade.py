@@ -0,0 +1,84 @@
+import zlib
+
+import numpy as np
+import pytest
+
+from cascade import FirstStageModel, flow_tokens
+from sniffing import PacketProcessor
+
+N_FEATURES = 2 ** 18
+CONFIG = {'api_url': 'http://127.0.0.1:1/predict', 'batch_size': 10, 'packet_queue_maxsize': 10, 'logging_level': 'WARNING'}
+
+
+def flow(domain='none', destination_port='443'):
+    return {'domain': domain, 'source_ip': '10.0.0.5', 'source_port': '51000', 'destination_ip': '192.168.1.10',
+            'destination_port': destination_port, 'protocol': 'TCP', 'application_layer_protocol': 'https'}
+
+
+def weighted_model(**token_weights):
+    weights = np.zeros(N_FEATURES, dtype=np.float32)
+    for token, weight in token_weights.items():
+        weights[zlib.crc32(token.encode('utf-8')) % N_FEATURES] = weight
+    return FirstStageModel(weights, name='first_stage_test')
+
+
+def test_flow_tokens_normalize_values_and_add_derived_features():
+    tokens = flow_tokens(['Example.COM', '10.0.0.5', '51000', '192.168.1.10', '22', 'TCP', 'ssh'])
+    assert 'domain=example.com' in tokens
+    assert 'source_net=10.0.0' in tokens
+    assert 'source_port_class=dynamic' in tokens
+    assert 'destination_port_class=system' in tokens
+    assert 'protocol_destination_port=tcp/22' in tokens
+    assert tokens[-1] == 'bias'
+
+
+def test_confident_flows_are_decided_and_the_others_escalated():
+    model = weighted_model(**{'domain=good.example': 6.0, 'domain=bad.example': -6.0})
+    good, bad, unknown = flow('good.example'), flow('bad.example'), flow('unknown.example')
+    decided, escalated = model.split([good, unknown, bad], 0.95)
+    assert decided == [(good, 'allow'), (bad, 'deny')]
+    assert escalated == [unknown]
+    # Un seuil plus exigeant que la confiance du modèle renvoie tout à l'API
+    assert model.split([good, bad], 0.999) == ([], [good, bad])
+    assert model.split([], 0.95) == ([], [])
+
+
+def test_saved_model_is_reloaded_with_its_name(tmp_path):
+    model = weighted_model(**{'destination_port=22': -3.0})
+    model.save(str(tmp_path / 'first_stage.npz'))
+    loaded = FirstStageModel.load(str(tmp_path / 'first_stage.npz'))
+    assert loaded.name == 'first_stage_test'
+    assert loaded.n_features == N_FEATURES
+    np.testing.assert_array_equal(loaded.predict_proba([flow(destination_port='22')]),
+                                  model.predict_proba([flow(destination_port='22')]))
+
+
+def test_fit_separates_the_training_labels():
+    rows = [[flow(domain)[field] for field in flow()] for domain in ('good.example', 'bad.example')] * 50
+    model = FirstStageModel.fit(rows, [1, 0] * 50, n_features=1024, epochs=30)
+    allow, deny = model.predict_indexes(model.feature_indexes(rows[:2]))
+    assert allow > 0.9 and deny < 0.1
+
+
+def test_only_escalated_flows_reach_the_api(tmp_path, monkeypatch):
+    weighted_model(**{'domain=good.example': 6.0}).save(str(tmp_path / 'first_stage.npz'))
+    processor = PacketProcessor(None, dict(CONFIG, first_stage_enabled=True,
+                                           first_stage_model_path=str(tmp_path / 'first_stage.npz')), {})
+    requested = []
+
+    def request_predictions(session, packets):
+        requested.extend(packets)
+        return ['deny'] * len(packets), 'v2'
+
+    monkeypatch.setattr(processor, 'request_predictions', request_predictions)
+    packets = [dict(flow('good.example'), cache_key='good'), dict(flow('unknown.example'), cache_key='unknown')]
+    processor.classify_batch(None, packets)
+    assert requested == [packets[1]]
+    assert [(packet['prediction'], packet['decision_source'], packet['model_version']) for packet in packets] == \
+        [('allow', 'first_stage', 'first_stage_test'), ('deny', 'model', 'v2')]
+
+
+def test_missing_first_stage_model_sends_everything_to_the_api(tmp_path):
+    processor = PacketProcessor(None, dict(CONFIG, first_stage_enabled=True,
+                                           first_stage_model_path=str(tmp_path / 'absent.npz')), {})
+    assert processor.first_stage is None
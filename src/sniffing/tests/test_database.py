@@ -0,0 +1,90 @@
+import mysql.connector
+
+from sniffing import DatabaseManager, PERSISTED_COLUMNS, PREDICTION_COLUMNS
+
+
+class RecordingCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, values):
+        if self.connection.failing_table and f'INTO {self.connection.failing_table} ' in sql:
+            raise mysql.connector.Error("table absente")
+        self.connection.statements.append((sql, values))
+
+
+class RecordingConnection:
+    def __init__(self, failing_table=None):
+        self.failing_table = failing_table
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def database(connection, **config):
+    db_manager = DatabaseManager(dict({'db_config': {}, 'logging_level': 'WARNING'}, **config))
+    db_manager.connect = lambda: connection
+    return db_manager
+
+
+def packet(number, prediction='allow'):
+    return {**{key: f'{key}-{number}' for key in PERSISTED_COLUMNS}, 'domain': 'none', 'prediction': prediction}
+
+
+def test_rows_are_inserted_in_chunks_of_multi_row_statements():
+    connection = RecordingConnection()
+    database(connection, db_insert_chunk_rows=2).insert_packets_batch([packet(number) for number in range(5)], 'new_data')
+    assert [sql.count('(%s') for sql, _ in connection.statements] == [2, 2, 1]
+    sql, values = connection.statements[0]
+    assert sql.startswith(f"INSERT INTO new_data ({', '.join(PERSISTED_COLUMNS)}) VALUES (")
+    assert len(values) == 2 * len(PERSISTED_COLUMNS)
+    # 'none' est écrit NULL
+    assert values[PERSISTED_COLUMNS.index('domain')] is None
+    assert values[PERSISTED_COLUMNS.index('source_ip')] == 'source_ip-0'
+    assert connection.commits == 1
+
+
+def test_prediction_columns_can_be_left_out():
+    connection = RecordingConnection()
+    database(connection).insert_packets_batch([packet(0)], 'passed_frames', include_prediction=False)
+    sql, values = connection.statements[0]
+    assert not any(column in sql for column in PREDICTION_COLUMNS)
+    assert len(values) == len(PERSISTED_COLUMNS) - len(PREDICTION_COLUMNS)
+
+
+def test_batches_share_one_transaction_and_empty_writes_are_skipped():
+    connection = RecordingConnection()
+    packets = [packet(0), packet(1, 'deny')]
+    assert database(connection).insert_packets_batches([
+        ('new_data', packets, True), ('blocked_frames', packets[1:], True), ('passed_frames', [], True)])
+    assert [sql.split(' (')[0] for sql, _ in connection.statements] == ['INSERT INTO new_data', 'INSERT INTO blocked_frames']
+    assert connection.commits == 1
+    assert database(RecordingConnection()).insert_packets_batches([('new_data', [], True)])
+
+
+def test_failed_insert_rolls_back_the_whole_transaction():
+    connection = RecordingConnection(failing_table='blocked_frames')
+    packets = [packet(0, 'deny')]
+    assert not database(connection).insert_packets_batches([('new_data', packets, True), ('blocked_frames', packets, True)])
+    assert (connection.commits, connection.rollbacks) == (0, 1)
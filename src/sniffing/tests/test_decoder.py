@@ -0,0 +1,56 @@
+import pytest
+from scapy.all import ARP, DNS, DNSQR, ICMP, IP, TCP, UDP, CookedLinux, Dot1Q, Ether, IPv6
+
+from decoder import DLT_EN10MB, DLT_LINUX_SLL, DLT_RAW, RawPacketDecoder
+from sniffing import PacketProcessor
+
+KNOWN_PORTS = {'443': 'https', '53': 'dns', '22': 'ssh'}
+CONFIG = {'api_url': 'http://127.0.0.1:1/predict', 'batch_size': 10, 'packet_queue_maxsize': 10, 'logging_level': 'WARNING'}
+
+FRAMES = {
+    'ipv4_tcp': Ether() / IP(src='10.0.0.1', dst='10.0.0.2') / TCP(sport=51000, dport=443),
+    'ipv4_udp_dns': Ether() / IP(src='10.0.0.1', dst='8.8.8.8') / UDP(sport=40000, dport=53) / DNS(qd=DNSQR(qname='example.com')),
+    'ipv6_udp_dns': Ether() / IPv6(src='2001:db8::1', dst='2001:db8::2') / UDP(sport=40001, dport=53) / DNS(qd=DNSQR(qname='example.org')),
+    'vlan_tcp': Ether() / Dot1Q(vlan=10) / IP(src='192.168.1.1', dst='192.168.1.2') / TCP(sport=22, dport=60000),
+    'ipv4_unknown_port': Ether() / IP(src='10.0.0.3', dst='10.0.0.4') / TCP(sport=1234, dport=5678),
+    'icmp': Ether() / IP(src='10.0.0.1', dst='10.0.0.2') / ICMP(),
+    'arp': Ether() / ARP(psrc='10.0.0.1', pdst='10.0.0.2'),
+}
+
+
+@pytest.fixture(scope='module')
+def processor():
+    return PacketProcessor(None, CONFIG, KNOWN_PORTS)
+
+
+@pytest.mark.parametrize('name', sorted(FRAMES))
+def test_ethernet_matches_scapy(processor, name):
+    data = bytes(FRAMES[name])
+    decoded = RawPacketDecoder(KNOWN_PORTS).decode(data, DLT_EN10MB)
+    assert decoded is not None
+    assert decoded == processor.extract_packet_details(Ether(data))
+
+
+def test_raw_ip_and_linux_cooked_match_scapy(processor):
+    decoder = RawPacketDecoder(KNOWN_PORTS)
+    packet = IP(src='10.1.1.1', dst='10.1.1.2') / UDP(sport=53, dport=33333) / DNS(qd=DNSQR(qname='raw.example'))
+    assert decoder.decode(bytes(packet), DLT_RAW) == processor.extract_packet_details(IP(bytes(packet)))
+    cooked = bytes(CookedLinux(proto=0x0800) / packet)
+    assert decoder.decode(cooked, DLT_LINUX_SLL) == processor.extract_packet_details(CookedLinux(cooked))
+
+
+def test_first_fragment_falls_back_to_scapy():
+    fragment = Ether() / IP(src='10.0.0.1', dst='10.0.0.2', flags='MF', frag=0) / UDP(sport=1, dport=53) / (b'x' * 64)
+    assert RawPacketDecoder(KNOWN_PORTS).decode(bytes(fragment), DLT_EN10MB) is None
+
+
+def test_later_fragment_has_no_ports_like_scapy(processor):
+    data = bytes(Ether() / IP(src='10.0.0.1', dst='10.0.0.2', frag=8, proto=17) / (b'x' * 64))
+    decoded = RawPacketDecoder(KNOWN_PORTS).decode(data, DLT_EN10MB)
+    assert decoded == processor.extract_packet_details(Ether(data))
+    assert decoded['source_port'] == 'none'
+
+
+def test_truncated_frame_falls_back_to_scapy():
+    data = bytes(FRAMES['ipv4_tcp'])[:20]
+    assert RawPacketDecoder(KNOWN_PORTS).decode(data, DLT_EN10MB) is None
@@ -0,0 +1,127 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from distributed import CollectorServer, SensorForwarder
+from sniffing import PacketProcessor
+
+KNOWN_PORTS = {'443': 'https'}
+CONFIG = {'api_url': 'http://127.0.0.1:1/predict', 'batch_size': 10, 'packet_queue_maxsize': 10, 'logging_level': 'WARNING'}
+
+
+def flow(first_seen, packets=10, source_port=50000):
+    return {'domain': 'none', 'source_ip': '10.0.0.1', 'source_port': source_port, 'destination_ip': '10.0.0.2',
+            'destination_port': 443, 'protocol': 'TCP', 'application_layer_protocol': 'https',
+            'packets': packets, 'bytes': packets * 100, 'first_seen': first_seen, 'last_seen': first_seen + packets - 1}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_collector(port=0, **config):
+    processor = PacketProcessor(None, dict(CONFIG, **config), KNOWN_PORTS)
+    collector = CollectorServer(processor, port=port)
+    collector.start()
+    return processor, collector
+
+
+def received_records(processor):
+    """
+    Vider le lot en cours du collecteur puis relever tous les enregistrements mis en file.
+    """
+    stopper = threading.Thread(target=processor.stop)
+    stopper.start()
+    records = []
+    while True:
+        item = processor.packet_queue.get(timeout=5)
+        if item is None:
+            stopper.join(5)
+            return records
+        records.extend(item[1])
+
+
+def forwarder_for(tmp_path, port):
+    return SensorForwarder(PacketProcessor(None, CONFIG, KNOWN_PORTS), {
+        'collector_url': f'http://127.0.0.1:{port}/flows', 'sensor_name': 'sensor-1', 'collector_timeout': 2,
+        'sensor_journal_dir': str(tmp_path / 'journal'), 'sensor_retry_interval': 0.05, 'sensor_drain_timeout': 5})
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("condition non atteinte")
+        time.sleep(0.01)
+
+
+def test_collector_keeps_every_record_of_a_split_flow(tmp_path):
+    processor, collector = start_collector()
+    try:
+        forwarder = forwarder_for(tmp_path, collector.address[1])
+        assert forwarder.send_records([flow(0.0, 300), flow(300.0, 300)])
+        assert forwarder.send_records([flow(600.0, 100)])
+    finally:
+        collector.stop()
+    records = received_records(processor)
+    assert [(record['first_seen'], record['packets']) for record in records] == [(0.0, 300), (300.0, 300), (600.0, 100)]
+    assert records[0]['source_port'] == 50000 and records[0]['domain'] == 'none'
+    assert collector.stats() == {'sensor-1': 3}
+
+
+def test_collector_deduplicates_packets_without_counters(tmp_path):
+    processor, collector = start_collector()
+    try:
+        forwarder = forwarder_for(tmp_path, collector.address[1])
+        packet = dict(flow(0.0), packets=None, bytes=None, first_seen=None, last_seen=None)
+        assert forwarder.send_records([packet, dict(packet)])
+    finally:
+        collector.stop()
+    assert len(received_records(processor)) == 1
+
+
+def test_journal_is_replayed_in_order_once_the_collector_is_back(tmp_path):
+    port = free_port()
+    forwarder = forwarder_for(tmp_path, port)
+    sender = threading.Thread(target=forwarder.send_batches)
+    sender.start()
+    forwarder.writer.submit([flow(float(second), source_port=50000 + second) for second in range(3)])
+    forwarder.writer.submit([flow(3.0, source_port=50003)])
+    wait_until(lambda: forwarder.writer.stats()['journal_records'] == 4)
+
+    processor, collector = start_collector(port)
+    try:
+        wait_until(lambda: forwarder.writer.stats()['journal_records'] == 0)
+        forwarder.writer.stop()
+        sender.join(5)
+    finally:
+        collector.stop()
+    assert forwarder.writer.stats()['replayed'] == 4
+    assert [record['source_port'] for record in received_records(processor)] == [50000, 50001, 50002, 50003]
+
+
+def test_full_collector_answers_503_and_the_sensor_keeps_its_batch(tmp_path):
+    processor, collector = start_collector(packet_queue_maxsize=1)
+    processor.packet_queue.put((time.perf_counter(), []))
+    assert collector.receive({'sensor': 'sensor-1', 'records': [[None] * 11]})[0] == 503
+    try:
+        forwarder = forwarder_for(tmp_path, collector.address[1])
+        sender = threading.Thread(target=forwarder.send_batches)
+        sender.start()
+        forwarder.writer.submit([flow(0.0)])
+        wait_until(lambda: forwarder.writer.stats()['journal_records'] == 1)
+        assert collector.stats() == {}
+
+        # La file d'envoi se libère: le lot conservé est rejoué
+        processor.packet_queue.get()
+        wait_until(lambda: forwarder.writer.stats()['journal_records'] == 0)
+        forwarder.writer.stop()
+        sender.join(5)
+    finally:
+        collector.stop()
+    assert collector.stats() == {'sensor-1': 1}
+    assert [record['first_seen'] for record in received_records(processor)] == [0.0]
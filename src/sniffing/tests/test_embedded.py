@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from embedded import EmbeddedPredictor, InferenceUnavailable
+from sniffing import PacketProcessor
+
+API_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'api')
+# Pas de chargement du vrai modèle à l'import de l'API: le test fournit son moteur
+API_ENV = {'API_LOAD_IN_BACKGROUND': '0', 'MODEL_WATCH_INTERVAL': '0', 'PREDICT_MAX_WAIT_MS': '0'}
+
+
+class KeywordBackend:
+    """
+    Moteur d'inférence factice: refuse les flux vers le port 22.
+    """
+    pass_timings = (0.0, 0.0)
+
+    def __init__(self):
+        self.texts = []
+
+    def classify(self, texts):
+        self.texts.extend(texts)
+        return [(0, 0.9) if ' 22 ' in text else (1, 0.8) for text in texts]
+
+
+class LoadedVersion:
+    """
+    Version en service, réduite à ce qu'en lit la prédiction de l'API.
+    """
+    def __init__(self, backend):
+        self.name = 'v1'
+        self.cache_scope = 'v1:test'
+        self.backend = backend
+
+
+@pytest.fixture
+def predictor(monkeypatch):
+    for name, value in API_ENV.items():
+        monkeypatch.setenv(name, value)
+    predictor = EmbeddedPredictor(API_PATH, ready_timeout=0.1)
+    backend = KeywordBackend()
+    monkeypatch.setattr(predictor.app.manager, 'current', LoadedVersion(backend))
+    monkeypatch.setattr(predictor.app, 'startup', predictor.app.StartupState())
+    predictor.backend = backend
+    return predictor
+
+
+def record(destination_port, domain=None):
+    return [domain, '10.0.0.5', 51000, '192.168.1.10', destination_port, 'TCP', 'https']
+
+
+def test_predictions_come_from_the_api_model_without_http(predictor):
+    with pytest.raises(InferenceUnavailable):
+        predictor.predict([record(443)])
+    predictor.app.startup.mark_ready()
+    assert predictor.predict([record(443), record(22), record(443)]) == (['allow', 'deny', 'allow'], 'v1')
+    # Le texte soumis au modèle est celui de /predict/flows, chaque flux distinct une seule fois
+    assert predictor.backend.texts == [predictor.app.flow_text(record(443)), predictor.app.flow_text(record(22))]
+    assert predictor.predict([record(22)]) == (['deny'], 'v1')
+    assert len(predictor.backend.texts) == 2
+
+
+def test_sniffer_classifies_batches_in_process(predictor, monkeypatch):
+    predictor.app.startup.mark_ready()
+    monkeypatch.setattr('sniffing.EmbeddedPredictor', lambda *args: predictor)
+    processor = PacketProcessor(None, {'api_url': 'http://127.0.0.1:1/predict', 'batch_size': 10, 'packet_queue_maxsize': 10,
+                                       'logging_level': 'WARNING', 'inference_mode': 'embedded'}, {})
+    packets = [{'domain': 'none', 'source_ip': '10.0.0.5', 'source_port': 51000, 'destination_ip': '192.168.1.10',
+                'destination_port': port, 'protocol': 'TCP', 'application_layer_protocol': 'ssh', 'cache_key': port}
+               for port in (22, 8443)]
+    processor.classify_batch(None, packets)
+    assert [(packet['prediction'], packet['model_version']) for packet in packets] == [('deny', 'v1'), ('allow', 'v1')]
+    assert predictor.backend.texts[0].startswith('none 10.0.0.5')
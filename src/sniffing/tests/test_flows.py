@@ -0,0 +1,89 @@
+import threading
+
+from flows import FLOW_FIELDS, FlowTable
+from sniffing import PacketProcessor
+
+
+def packet(source_ip='10.0.0.1', source_port='50000', destination_ip='10.0.0.2', destination_port='443', protocol='TCP'):
+    return {'domain': 'none', 'source_ip': source_ip, 'source_port': source_port, 'destination_ip': destination_ip,
+            'destination_port': destination_port, 'protocol': protocol, 'application_layer_protocol': 'https'}
+
+
+def test_both_directions_share_one_flow():
+    table = FlowTable(idle_timeout=30, active_timeout=300)
+    table.update(packet(), 100, 0.0)
+    table.update(packet('10.0.0.2', '443', '10.0.0.1', '50000'), 1500, 0.5)
+    flows = table.flush()
+    assert len(flows) == 1
+    assert flows[0]['packets'] == 2
+    assert flows[0]['bytes'] == 1600
+    assert (flows[0]['first_seen'], flows[0]['last_seen']) == (0.0, 0.5)
+    assert {field: flows[0][field] for field in FLOW_FIELDS} == packet()
+
+
+def test_packet_after_idle_timeout_starts_a_new_flow():
+    table = FlowTable(idle_timeout=30, active_timeout=300)
+    emitted = []
+    for timestamp in (0.0, 1.0, 40.0):
+        emitted += table.update(packet(), 100, timestamp)
+    assert [(flow['packets'], flow['first_seen'], flow['last_seen']) for flow in emitted] == [(2, 0.0, 1.0)]
+    assert [(flow['packets'], flow['first_seen']) for flow in table.flush()] == [(1, 40.0)]
+
+
+def test_active_timeout_splits_a_busy_flow():
+    table = FlowTable(idle_timeout=30, active_timeout=60)
+    emitted = []
+    for timestamp in range(0, 70, 10):
+        emitted += table.update(packet(), 100, float(timestamp))
+    assert [(flow['first_seen'], flow['packets']) for flow in emitted] == [(0.0, 6)]
+    assert table.flush()[0]['first_seen'] == 60.0
+
+
+def test_expire_emits_only_idle_flows():
+    table = FlowTable(idle_timeout=30, active_timeout=300)
+    table.update(packet(source_port='1'), 100, 0.0)
+    table.update(packet(source_port='2'), 100, 20.0)
+    expired = table.expire(35.0)
+    assert [flow['source_port'] for flow in expired] == ['1']
+    assert [flow['source_port'] for flow in table.expire(60.0)] == ['2']
+
+
+def test_full_table_emits_least_recently_seen_flow():
+    table = FlowTable(idle_timeout=30, active_timeout=300, max_flows=2)
+    table.update(packet(source_port='1'), 100, 0.0)
+    table.update(packet(source_port='2'), 100, 0.1)
+    table.update(packet(source_port='1'), 100, 0.2)
+    emitted = table.update(packet(source_port='3'), 100, 0.3)
+    assert [flow['source_port'] for flow in emitted] == ['2']
+    assert len(table.flows) == 2
+
+
+class RecordingDatabase:
+    def __init__(self):
+        self.rows = []
+
+    def insert_packets_batches(self, batches):
+        self.rows.extend(packets for table, packets, _ in batches if table == 'new_data')
+        return True
+
+
+def test_every_emitted_flow_record_is_persisted(tmp_path, monkeypatch):
+    database = RecordingDatabase()
+    processor = PacketProcessor(database, {
+        'api_url': 'http://127.0.0.1:1/predict', 'batch_size': 10, 'packet_queue_maxsize': 10, 'logging_level': 'WARNING',
+        'flow_aggregation': True, 'flow_idle_timeout': 30, 'flow_active_timeout': 300,
+        'spill_journal_dir': str(tmp_path)}, {'443': 'https'})
+    processor.lossless = True
+    monkeypatch.setattr(processor, 'classify_batch', lambda session, packets: None)
+    threads = [threading.Thread(target=target) for target in
+               (processor.send_packet_batches, processor.write_results, processor.persist_writes)]
+    for thread in threads:
+        thread.start()
+    # Un flux long de 700 paquets à 1 paquet/s est découpé par active_timeout en trois enregistrements
+    for timestamp in range(700):
+        processor.add_packet_details(packet(), 100, float(timestamp))
+    processor.stop()
+    for thread in threads:
+        thread.join(10)
+    persisted = [record for rows in database.rows for record in rows]
+    assert [(record['first_seen'], record['packets']) for record in persisted] == [(0.0, 300), (300.0, 300), (600.0, 100)]
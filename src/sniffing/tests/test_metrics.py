@@ -0,0 +1,62 @@
+import json
+import urllib.request
+
+from metrics import MetricsServer, PipelineStats
+
+
+def test_counters_histograms_and_gauges_are_rendered():
+    stats = PipelineStats(buckets=(0.01, 0.1))
+    stats.incr('packets_captured', 3)
+    stats.record('api', 0.005)
+    stats.record('api', 0.05)
+    stats.record('api', 0.5)
+    stats.gauge('sniffer_packet_queue', "File d'envoi", lambda: {'depth': 2, 'capacity': 10, 'name': 'ignorée'})
+    stats.gauge('sniffer_broken', "Jauge illisible", lambda: 1 / 0)
+    lines = stats.render().splitlines()
+    assert 'sniffer_packets_captured_total 3' in lines
+    # Les compteurs internes des fenêtres de percentiles ne sont pas exposés
+    assert not any(line.startswith('sniffer_api_samples') for line in lines)
+    assert [line for line in lines if line.startswith('sniffer_stage_duration_seconds_')] == [
+        'sniffer_stage_duration_seconds_bucket{stage="api",le="0.01"} 1',
+        'sniffer_stage_duration_seconds_bucket{stage="api",le="0.1"} 2',
+        'sniffer_stage_duration_seconds_bucket{stage="api",le="+Inf"} 3',
+        'sniffer_stage_duration_seconds_sum{stage="api"} 0.555',
+        'sniffer_stage_duration_seconds_count{stage="api"} 3',
+    ]
+    assert 'sniffer_packet_queue_depth 2' in lines
+    assert 'sniffer_packet_queue_capacity 10' in lines
+    assert not any(line.startswith('sniffer_packet_queue_name') or line.startswith('sniffer_broken') for line in lines)
+
+
+def test_percentile_window_is_bounded():
+    stats = PipelineStats(max_samples=10)
+    for sample in range(100):
+        stats.record('db_insert', sample / 1000)
+    assert len(stats.samples['db_insert']) == 10
+    assert stats.percentiles('db_insert') == {'p50': 0.095, 'p90': 0.099, 'p99': 0.099}
+    assert stats.summary()['counters']['db_insert_samples'] == 100
+
+
+def test_summary_line_reports_rates_since_the_previous_line():
+    stats = PipelineStats()
+    stats.incr('packets_unique', 3)
+    stats.incr('packets_duplicate', 1)
+    assert 'doublons 25.0%' in stats.summary_line()
+    stats.incr('packets_unique', 4)
+    assert 'doublons 0.0%' in stats.summary_line()
+
+
+def test_server_exposes_metrics_and_stats():
+    stats = PipelineStats()
+    stats.incr('batches')
+    server = MetricsServer(stats, port=0)
+    server.start()
+    try:
+        url = f'http://127.0.0.1:{server.address[1]}'
+        with urllib.request.urlopen(f'{url}/metrics', timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert 'sniffer_batches_total 1' in response.read().decode('utf-8').splitlines()
+        with urllib.request.urlopen(f'{url}/stats', timeout=5) as response:
+            assert json.loads(response.read())['counters'] == {'batches': 1}
+    finally:
+        server.stop()
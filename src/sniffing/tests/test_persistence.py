@@ -0,0 +1,104 @@
+import threading
+
+from persistence import SpillJournal, WriteBehindWriter
+
+COLUMNS = ('id',)
+
+
+def records(*ids):
+    return [{'id': i} for i in ids]
+
+
+def drain(journal):
+    replayed = []
+    while True:
+        segment = journal.oldest()
+        if segment is None:
+            return replayed
+        number, segment_records = segment
+        replayed += [record['id'] for record in segment_records]
+        journal.remove(number, len(segment_records))
+
+
+def test_journal_replays_in_append_order_across_segments(tmp_path):
+    journal = SpillJournal(str(tmp_path), COLUMNS, segment_max_records=2)
+    journal.append(records(1, 2, 3))
+    journal.append(records(4))
+    journal.append(records(5, 6))
+    assert len(journal) == 6
+    assert drain(journal) == [1, 2, 3, 4, 5, 6]
+    assert len(journal) == 0
+
+
+def test_push_front_precedes_existing_records(tmp_path):
+    journal = SpillJournal(str(tmp_path), COLUMNS)
+    journal.append(records(3, 4))
+    journal.push_front(records(1, 2))
+    assert drain(journal) == [1, 2, 3, 4]
+
+
+def test_journal_is_reloaded_after_restart(tmp_path):
+    journal = SpillJournal(str(tmp_path), COLUMNS, segment_max_records=1)
+    journal.append(records(1))
+    journal.append(records(2))
+    reopened = SpillJournal(str(tmp_path), COLUMNS, segment_max_records=1)
+    assert len(reopened) == 2
+    reopened.append(records(3))
+    assert drain(reopened) == [1, 2, 3]
+
+
+def test_journal_keeps_only_its_columns(tmp_path):
+    journal = SpillJournal(str(tmp_path), ('id', 'missing'))
+    journal.append([{'id': 1, 'extra': 'x'}])
+    assert journal.oldest()[1] == [{'id': 1, 'missing': None}]
+
+
+class FlakyStore:
+    def __init__(self, failures):
+        self.failures = failures
+        self.written = []
+        self.lock = threading.Lock()
+
+    def persist(self, batch):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                return False
+            self.written += [record['id'] for record in batch]
+            return True
+
+
+def test_writer_spills_on_failure_and_replays_in_order(tmp_path):
+    store = FlakyStore(failures=2)
+    writer = WriteBehindWriter(store.persist, SpillJournal(str(tmp_path), COLUMNS), batch_records=2, retry_interval=0.01,
+                               drain_timeout=5)
+    for start in range(0, 10, 2):
+        writer.submit(records(start, start + 1))
+    writer.stop()
+    writer.run()
+    assert store.written == list(range(10))
+    stats = writer.stats()
+    assert stats['journal_records'] == 0
+    assert stats['written'] == 10
+    assert stats['spilled'] > 0
+
+
+def test_writer_keeps_journal_when_store_stays_down(tmp_path):
+    store = FlakyStore(failures=10 ** 6)
+    writer = WriteBehindWriter(store.persist, SpillJournal(str(tmp_path), COLUMNS), retry_interval=0.01, drain_timeout=0.05)
+    writer.submit(records(1, 2, 3))
+    writer.stop()
+    writer.run()
+    assert store.written == []
+    assert len(SpillJournal(str(tmp_path), COLUMNS)) == 3
+
+
+def test_buffer_overflow_spills_to_journal(tmp_path):
+    store = FlakyStore(failures=0)
+    writer = WriteBehindWriter(store.persist, SpillJournal(str(tmp_path), COLUMNS), max_buffered=3, retry_interval=0.01)
+    writer.submit(records(1, 2))
+    writer.submit(records(3, 4))
+    assert writer.stats()['spilling']
+    writer.stop()
+    writer.run()
+    assert store.written == [1, 2, 3, 4]
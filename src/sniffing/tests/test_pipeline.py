@@ -0,0 +1,81 @@
+import threading
+import time
+
+from sniffing import PacketProcessor
+
+CONFIG = {'api_url': 'http://127.0.0.1:1/predict', 'batch_size': 10, 'packet_queue_maxsize': 10, 'logging_level': 'WARNING',
+          'api_max_in_flight': 4}
+
+
+class RecordingDatabase:
+    def __init__(self):
+        self.rows = []
+
+    def insert_packets_batches(self, batches):
+        self.rows.extend(packet for table, packets, _ in batches if table == 'new_data' for packet in packets)
+        return True
+
+
+def processor_for(tmp_path):
+    database = RecordingDatabase()
+    processor = PacketProcessor(database, dict(CONFIG, spill_journal_dir=str(tmp_path)), {})
+    return processor, database
+
+
+def record(number):
+    return {'number': number, 'prediction': 'allow'}
+
+
+def run_writer(processor):
+    threads = [threading.Thread(target=target) for target in (processor.write_results, processor.persist_writes)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_results_are_written_in_dispatch_order(tmp_path):
+    processor, database = processor_for(tmp_path)
+    threads = run_writer(processor)
+    # Le lot 3 n'arrive jamais: les lots suivants sont écrits à l'arrêt, dans l'ordre
+    for sequence in (2, 0, 1, 5, 4):
+        processor.result_queue.put((sequence, [record(sequence)]))
+    processor.result_queue.put(None)
+    for thread in threads:
+        thread.join(10)
+    assert [row['number'] for row in database.rows] == [0, 1, 2, 4, 5]
+
+
+def test_out_of_order_responses_keep_the_batch_order(tmp_path, monkeypatch):
+    processor, database = processor_for(tmp_path)
+
+    def classify_batch(session, packets):
+        # Les premiers lots reçoivent leur réponse en dernier
+        time.sleep(0.05 * (4 - packets[0]['number'] % 4))
+
+    monkeypatch.setattr(processor, 'classify_batch', classify_batch)
+    threads = run_writer(processor) + [threading.Thread(target=processor.send_packet_batches)]
+    threads[-1].start()
+    for number in range(8):
+        processor.packet_queue.put((time.perf_counter(), [record(number)]))
+    processor.packet_queue.put(None)
+    for thread in threads:
+        thread.join(10)
+    assert [row['number'] for row in database.rows] == list(range(8))
+
+
+def test_failed_classification_does_not_block_later_batches(tmp_path, monkeypatch):
+    processor, database = processor_for(tmp_path)
+
+    def classify_batch(session, packets):
+        if packets[0]['number'] == 0:
+            raise RuntimeError("réponse invalide")
+
+    monkeypatch.setattr(processor, 'classify_batch', classify_batch)
+    threads = run_writer(processor) + [threading.Thread(target=processor.send_packet_batches)]
+    threads[-1].start()
+    for number in range(3):
+        processor.packet_queue.put((time.perf_counter(), [record(number)]))
+    processor.packet_queue.put(None)
+    for thread in threads:
+        thread.join(10)
+    assert [row['number'] for row in database.rows] == [0, 1, 2]
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from rules import CsvRuleSource, RuleIndex, RuleSet, parse_label
+
+HEADER = 'domain,source_ip,source_port,destination_ip,destination_port,protocol,application_layer_protocol,target\n'
+
+
+def flow(domain='none', source_ip='10.0.0.5', source_port='51000', destination_ip='192.168.1.10', destination_port='443',
+         protocol='TCP', application='https'):
+    return {'domain': domain, 'source_ip': source_ip, 'source_port': source_port, 'destination_ip': destination_ip,
+            'destination_port': destination_port, 'protocol': protocol, 'application_layer_protocol': application}
+
+
+def index_from(tmp_path, *files):
+    sources = []
+    for number, content in enumerate(files):
+        path = tmp_path / f'rules_{number}.csv'
+        path.write_text(content)
+        sources.append(CsvRuleSource(f'source_{number}', str(path)))
+    index = RuleIndex(sources)
+    index.refresh()
+    return index
+
+
+def test_exact_rule_matches_case_insensitively(tmp_path):
+    index = index_from(tmp_path, HEADER + 'none,10.0.0.5,51000,192.168.1.10,443,tcp,HTTPS,allow\n')
+    assert index.lookup(flow()) == ('allow', 'source_0')
+    assert index.lookup(flow(source_port='51001')) is None
+
+
+def test_wildcards_prefixes_and_port_ranges(tmp_path):
+    index = index_from(tmp_path, HEADER + 'any,10.0.0.0/8,any,any,22,tcp,any,deny\n'
+                                          'any,any,any,any,1024-2048,udp,any,allow\n')
+    assert index.lookup(flow(destination_port='22'))[0] == 'deny'
+    assert index.lookup(flow(source_ip='11.0.0.1', destination_port='22')) is None
+    assert index.lookup(flow(destination_port='1500', protocol='UDP'))[0] == 'allow'
+    assert index.lookup(flow(destination_port='4000', protocol='UDP')) is None
+
+
+def test_most_specific_rule_wins_within_a_source():
+    rule_set = RuleSet('rules')
+    rule_set.add(dict(flow(), domain='any', source_ip='any', source_port='any', application_layer_protocol='any'), 'allow')
+    rule_set.add(dict(flow(), domain='any', source_port='any', application_layer_protocol='any'), 'deny')
+    normalized = tuple(value.lower() for value in flow().values())
+    assert rule_set.lookup(normalized, {}) == 'deny'
+    assert rule_set.lookup(normalized[:1] + ('10.9.9.9',) + normalized[2:], {}) == 'allow'
+
+
+def test_earlier_source_has_priority(tmp_path):
+    index = index_from(tmp_path, HEADER + 'any,any,any,any,443,tcp,any,deny\n',
+                       HEADER + 'none,10.0.0.5,51000,192.168.1.10,443,tcp,https,allow\n')
+    assert index.lookup(flow()) == ('deny', 'source_0')
+
+
+def test_semicolon_files_are_read_and_appended_rules_loaded(tmp_path):
+    path = tmp_path / 'extra.csv'
+    path.write_text(HEADER.replace(',', ';') + 'any;any;any;any;53;udp;any;allow\n')
+    index = RuleIndex([CsvRuleSource('extra', str(path))])
+    index.refresh()
+    assert index.lookup(flow(destination_port='53', protocol='UDP'))[0] == 'allow'
+    with open(path, 'a') as f:
+        f.write('any;any;any;any;123;udp;any;deny\n')
+    index.refresh()
+    assert index.lookup(flow(destination_port='123', protocol='UDP'))[0] == 'deny'
+    assert index.stats()['rules'] == 2
+
+
+def test_rewritten_file_is_recompiled(tmp_path):
+    index = index_from(tmp_path, HEADER + 'any,any,any,any,443,tcp,any,deny\n')
+    replacement = tmp_path / 'replacement.csv'
+    replacement.write_text(HEADER + 'any,any,any,any,80,tcp,any,allow\n')
+    os.replace(replacement, tmp_path / 'rules_0.csv')
+    index.refresh()
+    assert index.lookup(flow()) is None
+    assert index.lookup(flow(destination_port='80'))[0] == 'allow'
+
+
+@pytest.mark.parametrize('target, label', [('allow', 'allow'), ('DENY', 'deny'), ('label_deny', 'deny'), ('other', None)])
+def test_parse_label(target, label):
+    assert parse_label(target) == label
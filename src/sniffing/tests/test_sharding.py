@@ -0,0 +1,66 @@
+import pytest
+from scapy.all import ARP, IP, TCP, UDP, CookedLinux, Dot1Q, Ether, IPv6
+
+import sniffing
+from decoder import DLT_EN10MB, DLT_LINUX_SLL, DLT_RAW
+from sharding import flow_hash, network_offset
+from sniffing import MainApp
+
+
+def both_directions(source, destination, transport):
+    forward = source / transport
+    backward = destination / transport.__class__(sport=transport.dport, dport=transport.sport)
+    return bytes(forward), bytes(backward)
+
+
+@pytest.mark.parametrize('forward, backward', [
+    both_directions(Ether() / IP(src='10.0.0.1', dst='10.0.0.2'), Ether() / IP(src='10.0.0.2', dst='10.0.0.1'),
+                    TCP(sport=51000, dport=443)),
+    both_directions(Ether() / IPv6(src='2001:db8::1', dst='2001:db8::2'), Ether() / IPv6(src='2001:db8::2', dst='2001:db8::1'),
+                    UDP(sport=40000, dport=53)),
+    both_directions(Ether() / Dot1Q(vlan=5) / IP(src='10.0.0.1', dst='10.0.0.2'),
+                    Ether() / Dot1Q(vlan=5) / IP(src='10.0.0.2', dst='10.0.0.1'), UDP(sport=1000, dport=2000)),
+])
+def test_hash_is_symmetric(forward, backward):
+    assert flow_hash(forward, DLT_EN10MB) == flow_hash(backward, DLT_EN10MB) != 0
+
+
+def test_hash_depends_on_ports_and_protocol():
+    base = Ether() / IP(src='10.0.0.1', dst='10.0.0.2')
+    hashes = {flow_hash(bytes(base / TCP(sport=1000, dport=443)), DLT_EN10MB),
+              flow_hash(bytes(base / TCP(sport=1001, dport=443)), DLT_EN10MB),
+              flow_hash(bytes(base / UDP(sport=1000, dport=443)), DLT_EN10MB)}
+    assert len(hashes) == 3
+
+
+def test_same_flow_hashes_alike_across_link_types():
+    packet = IP(src='10.0.0.1', dst='10.0.0.2') / TCP(sport=1000, dport=443)
+    expected = flow_hash(bytes(Ether() / packet), DLT_EN10MB)
+    assert flow_hash(bytes(packet), DLT_RAW) == expected
+    assert flow_hash(bytes(CookedLinux(proto=0x0800) / packet), DLT_LINUX_SLL) == expected
+
+
+def test_later_fragments_hash_on_addresses_only():
+    later = Ether() / IP(src='10.0.0.2', dst='10.0.0.1', frag=8, proto=17) / (b'x' * 16)
+    reverse = Ether() / IP(src='10.0.0.1', dst='10.0.0.2', frag=8, proto=17) / (b'y' * 16)
+    assert flow_hash(bytes(later), DLT_EN10MB) == flow_hash(bytes(reverse), DLT_EN10MB) != 0
+
+
+def test_non_ip_and_truncated_frames_hash_to_zero():
+    assert flow_hash(bytes(Ether() / ARP()), DLT_EN10MB) == 0
+    assert flow_hash(bytes(Ether() / IP())[:20], DLT_EN10MB) == 0
+    assert network_offset(memoryview(bytes(Ether() / ARP())), DLT_EN10MB) is None
+
+
+def test_sharding_is_refused_without_fork(monkeypatch):
+    monkeypatch.setattr(sniffing, 'FORK_AVAILABLE', False)
+    with pytest.raises(ValueError, match='fork'):
+        MainApp.check_platform({'capture_workers': 2})
+    MainApp.check_platform({'capture_workers': 1})
+
+
+def test_fast_decoder_live_capture_is_refused_on_windows(monkeypatch):
+    monkeypatch.setattr(sniffing, 'WINDOWS', True)
+    with pytest.raises(ValueError, match='fast_decoder'):
+        MainApp.check_platform({'fast_decoder': True})
+    MainApp.check_platform({'fast_decoder': True, 'replay_pcap_path': 'capture.pcap'})
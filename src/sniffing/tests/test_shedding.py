@@ -0,0 +1,88 @@
+import queue
+
+import pytest
+
+from shedding import LoadShedder, flow_sampling_key
+
+
+def packet(source_port):
+    return {'domain': 'none', 'source_ip': '10.0.0.1', 'source_port': source_port, 'destination_ip': '10.0.0.2',
+            'destination_port': 443, 'protocol': 'TCP', 'application_layer_protocol': 'https'}
+
+
+def full_queue():
+    packet_queue = queue.Queue(maxsize=1)
+    packet_queue.put((0.0, ['old']))
+    return packet_queue
+
+
+def test_unknown_policy_is_refused():
+    with pytest.raises(ValueError):
+        LoadShedder('drop_everything')
+
+
+def test_drop_newest_keeps_the_queued_batch():
+    shedder = LoadShedder('drop_newest')
+    packet_queue = full_queue()
+    assert shedder.offer(packet_queue, (1.0, ['new', 'new'])) == ['new', 'new']
+    assert packet_queue.get_nowait() == (0.0, ['old'])
+    assert (shedder.stats()['batches_dropped'], shedder.stats()['packets_dropped']) == (1, 2)
+
+
+def test_drop_oldest_replaces_the_queued_batch():
+    shedder = LoadShedder('drop_oldest')
+    packet_queue = full_queue()
+    assert shedder.offer(packet_queue, (1.0, ['new'])) == ['old']
+    assert packet_queue.get_nowait() == (1.0, ['new'])
+    assert shedder.stats()['packets_dropped'] == 1
+
+
+def test_drop_oldest_keeps_the_end_marker():
+    shedder = LoadShedder('drop_oldest')
+    packet_queue = queue.Queue(maxsize=1)
+    packet_queue.put(None)
+    assert shedder.offer(packet_queue, (1.0, ['new'])) == ['new']
+    assert packet_queue.get_nowait() is None
+
+
+def test_block_waits_for_room():
+    shedder = LoadShedder('block')
+    packet_queue = queue.Queue(maxsize=2)
+    assert shedder.offer(packet_queue, (0.0, ['a'])) is None
+    assert shedder.offer(packet_queue, (1.0, ['b'])) is None
+    assert packet_queue.qsize() == 2
+
+
+def test_sample_drops_whole_flows_once_the_queue_stays_full():
+    shedder = LoadShedder('sample', min_sampling_rate=0.25, adjust_interval=0.0)
+    assert all(shedder.admit(packet(port)) for port in range(100))
+    shedder.adjust(0.9, 1.0)
+    shedder.adjust(0.9, 2.0)
+    assert shedder.sampling_rate == 0.25
+    admitted = {port for port in range(1000) if shedder.admit(packet(port))}
+    assert 150 < len(admitted) < 350
+    # Un flux est conservé ou écarté en entier, dans les deux sens
+    for port in range(50):
+        reverse = dict(packet(port), source_ip='10.0.0.2', source_port=443, destination_ip='10.0.0.1', destination_port=port)
+        assert flow_sampling_key(reverse) == flow_sampling_key(packet(port))
+        assert shedder.admit(reverse) == (port in admitted)
+    assert shedder.stats()['packets_sampled_out'] == 1050 - len(admitted) - sum(port in admitted for port in range(50))
+
+
+def test_sample_rate_recovers_when_the_queue_drains():
+    shedder = LoadShedder('sample', min_sampling_rate=0.01, recovery_step=0.25, adjust_interval=0.0)
+    shedder.adjust(0.9, 1.0)
+    assert shedder.sampling_rate == 0.5
+    # La file se vide: pas de nouvelle division malgré un remplissage encore haut
+    shedder.adjust(0.85, 2.0)
+    assert shedder.sampling_rate == 0.5
+    shedder.adjust(0.4, 3.0)
+    shedder.adjust(0.4, 4.0)
+    assert shedder.sampling_rate == 1.0
+
+
+def test_other_policies_admit_every_packet():
+    shedder = LoadShedder('drop_oldest')
+    shedder.adjust(1.0, 1.0)
+    assert shedder.admit(packet(1))
+    assert shedder.stats()['packets_offered'] == 1
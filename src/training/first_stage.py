@@ -0,0 +1,111 @@
+"""
+Entraîner le premier étage de la cascade (src/sniffing/cascade.py) sur les jeux de
+données de preparation.py, et mesurer pour plusieurs seuils la part des flux envoyés
+à BERT et l'exactitude de la cascade par rapport à BERT seul.
+
+Les prédictions de BERT sur le jeu de validation sont demandées à l'API (--api-url);
+sans elle, le rapport se limite au premier étage.
+
+Exemple:
+python src/training/first_stage.py --version v2_3 --api-url http://127.0.0.1:55555/predict
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import requests
+from datasets import load_from_disk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sniffing'))
+from cascade import FirstStageModel, text_values  # noqa: E402
+
+REPORT_THRESHOLDS = (0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+
+def bert_predictions(api_url, texts, batch_size=64):
+    """
+    Returns:
+    np.ndarray: Prédictions de l'API (1 pour 'allow', 0 pour 'deny').
+    """
+    predictions = []
+    with requests.Session() as session:
+        for start in range(0, len(texts), batch_size):
+            response = session.post(api_url, json={'input_text': texts[start:start + batch_size]}, timeout=60)
+            response.raise_for_status()
+            predictions += [1 if label == 'allow' else 0 for label in response.json()['predictions']]
+    return np.array(predictions)
+
+
+def cascade_report(probabilities, labels, bert=None, thresholds=REPORT_THRESHOLDS):
+    """
+    Args:
+    probabilities (np.ndarray): Probabilité 'allow' du premier étage pour chaque flux.
+    labels (np.ndarray): Étiquettes de référence.
+    bert (np.ndarray): Prédictions de BERT, None si indisponibles.
+
+    Returns:
+    list: Une ligne par seuil (part envoyée à BERT, exactitudes).
+    """
+    first_stage = (probabilities >= 0.5).astype(int)
+    confident = np.maximum(probabilities, 1.0 - probabilities)
+    rows = []
+    for threshold in thresholds:
+        decided = confident >= threshold
+        row = {
+            'threshold': threshold,
+            'escalated': 1.0 - decided.mean(),
+            'first_stage_accuracy': (first_stage[decided] == labels[decided]).mean() if decided.any() else float('nan'),
+        }
+        if bert is not None:
+            cascade = np.where(decided, first_stage, bert)
+            row['cascade_accuracy'] = (cascade == labels).mean()
+            row['agreement_with_bert'] = (cascade == bert).mean()
+        rows.append(row)
+    return rows
+
+
+def print_report(rows, first_stage_accuracy, bert_accuracy=None):
+    print(f"Exactitude du premier étage seul : {first_stage_accuracy:.2%}")
+    if bert_accuracy is not None:
+        print(f"Exactitude de BERT seul          : {bert_accuracy:.2%}")
+    print()
+    header = f"{'seuil':>6}{'envoyés à BERT':>16}{'exactitude 1er étage':>22}"
+    if bert_accuracy is not None:
+        header += f"{'exactitude cascade':>20}{'accord avec BERT':>18}"
+    print(header)
+    for row in rows:
+        line = f"{row['threshold']:>6.2f}{row['escalated']:>16.1%}{row['first_stage_accuracy']:>22.2%}"
+        if bert_accuracy is not None:
+            line += f"{row['cascade_accuracy']:>20.2%}{row['agreement_with_bert']:>18.2%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement et rapport du premier étage de la cascade")
+    parser.add_argument('--version', default='v2_3', help="Version des jeux de données de preparation.py")
+    parser.add_argument('--output', default='./data/first_stage/first_stage.npz', help="Fichier du modèle entraîné")
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--learning-rate', type=float, default=0.5)
+    parser.add_argument('--api-url', help="Route /predict de l'API, pour comparer la cascade à BERT seul")
+    args = parser.parse_args()
+
+    try:
+        train_dataset = load_from_disk(f'./data/datasets/{args.version}/train_dataset')
+        test_dataset = load_from_disk(f'./data/datasets/{args.version}/test_dataset')
+    except FileNotFoundError:
+        raise FileNotFoundError("Les datasets enregistrés n'ont pas été trouvés.")
+
+    model = FirstStageModel.fit([text_values(text) for text in train_dataset['text']], train_dataset['label'],
+                                name=f'first_stage_{args.version}', epochs=args.epochs, learning_rate=args.learning_rate)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    model.save(args.output)
+    print(f"Modèle enregistré dans {args.output}")
+
+    test_texts = list(test_dataset['text'])
+    test_labels = np.array(test_dataset['label'])
+    probabilities = model.predict_indexes(model.feature_indexes([text_values(text) for text in test_texts]))
+    first_stage_accuracy = ((probabilities >= 0.5).astype(int) == test_labels).mean()
+    bert = bert_predictions(args.api_url, test_texts) if args.api_url else None
+    bert_accuracy = (bert == test_labels).mean() if bert is not None else None
+    print_report(cascade_report(probabilities, test_labels, bert), first_stage_accuracy, bert_accuracy)
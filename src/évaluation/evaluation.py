@@ -126,7 +126,9 @@ if __name__ == "__main__":
     cnx = mysql.connector.connect(**db_config)
     cursor = cnx.cursor()
 
-    query = "SELECT * FROM false_positive_frames"
+    # Seules les colonnes de la matrice de flux sont exportées (pas model_version ni decision_source)
+    query = ("SELECT id, domain, source_ip, source_port, destination_ip, destination_port, protocol, "
+             "application_layer_protocol, prediction FROM false_positive_frames")
     cursor.execute(query)
 
     column_names = [i[0] for i in cursor.description]